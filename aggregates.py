@@ -0,0 +1,333 @@
+import numpy as np
+
+import balances
+import schemas
+
+
+# KPI summary tables maintained while the facts are generated.
+#
+# The dashboards (customer lifetime value, transaction volume by channel and location, loan approval rates) would
+# otherwise scan the full fact tables on every refresh. A KpiAggregator sees every fact batch as it streams past
+# (tee() wraps the batch iterators, like balances.BalanceEngine) and keeps the aggregates of AGGREGATES; they are
+# written as small agg_<name>.csv tables next to the facts, with the column layout of schemas.AGGREGATE_SCHEMAS.
+#
+# Every measure is a count, sum, minimum or maximum, so aggregates are mergeable: the aggregator of each shard
+# (parallel.py) is merged into the run's, and the state saved in _state/ is extended by every incremental.py append.
+# Each batch is reduced to its groups right away (sorted on the group-by columns, then reduceat) and the reduced
+# parts are folded together every MAX_PENDING_PARTS batches, so memory follows the number of groups, not of rows.
+# Money is summed in integer cents, so the result does not depend on how rows were split across shards or days.
+# Every transaction aggregate leaves out failed transactions (balances.IGNORED_STATUSES), as the derived balances do,
+# so transaction_count and transaction_amount agree between the per-account, per-customer and daily tables.
+#
+#   python main.py --seed 42 --aggregates
+#   python incremental.py --folder data --days 1    # also updates the agg_*.csv tables
+
+# aggregate table -> definition:
+#   source: the fact table it is computed from
+#   keys: the group-by columns; columns of LOOKUPS are read from a dimension through a fact column
+#   exclude: fact column -> values of rows left out
+#   measures: output column -> (operation, fact column); 'count' counts rows
+AGGREGATES = {
+    'agg_account_transactions': {
+        'source': 'fact_transactions',
+        'keys': ['account_id'],
+        'exclude': {'transaction_status': balances.IGNORED_STATUSES},
+        'measures': {'transaction_count': ('count', None), 'transaction_amount': ('sum', 'transaction_amount'),
+                     'first_date_id': ('min', 'date_id'), 'last_date_id': ('max', 'date_id')},
+    },
+    'agg_customer_transactions': {
+        'source': 'fact_transactions',
+        'keys': ['customer_id'],
+        'exclude': {'transaction_status': balances.IGNORED_STATUSES},
+        'measures': {'transaction_count': ('count', None), 'transaction_amount': ('sum', 'transaction_amount'),
+                     'first_date_id': ('min', 'date_id'), 'last_date_id': ('max', 'date_id')},
+    },
+    'agg_daily_channel_location': {
+        'source': 'fact_transactions',
+        'keys': ['date_id', 'channel_id', 'location_id'],
+        'exclude': {'transaction_status': balances.IGNORED_STATUSES},
+        'measures': {'transaction_count': ('count', None), 'transaction_amount': ('sum', 'transaction_amount')},
+    },
+    'agg_loan_status': {
+        'source': 'fact_loans',
+        'keys': ['loan_type', 'loan_status'],
+        'measures': {'loan_count': ('count', None), 'loan_amount': ('sum', 'loan_amount')},
+    },
+    'agg_daily_interactions': {
+        'source': 'fact_customer_interactions',
+        'keys': ['date_id', 'channel_id', 'interaction_type'],
+        'measures': {'interaction_count': ('count', None), 'rating_total': ('sum', 'interaction_rating')},
+    },
+}
+
+# dimension attribute used as a group-by column -> (dimension table, the key column shared with the fact table)
+LOOKUPS = {
+    'customer_id': ('accounts', 'account_id'),
+    'loan_type': ('loans', 'loan_id'),
+}
+
+REDUCERS = {'count': np.add, 'sum': np.add, 'min': np.minimum, 'max': np.maximum}
+MAX_PENDING_PARTS = 32
+
+
+def _reduce(keys, measures, operations):
+    # -> (group-by columns sorted and unique, each measure reduced per group)
+    if not len(keys[0]):
+        return keys, measures
+    packed = _pack(keys)
+    if packed is not None:
+        # one int64 per row: a single sort instead of a lexsort over every column
+        order = np.argsort(packed, kind='stable')
+        packed = packed[order]
+        starts = np.flatnonzero(np.r_[True, packed[1:] != packed[:-1]])
+        keys = [key[order] for key in keys]
+    else:
+        order = np.lexsort(keys[::-1])
+        keys = [key[order] for key in keys]
+        starts = np.zeros(len(order), dtype=bool)
+        starts[0] = True
+        for key in keys:
+            starts[1:] |= key[1:] != key[:-1]
+        starts = np.flatnonzero(starts)
+    return ([key[starts] for key in keys],
+            [REDUCERS[operation].reduceat(measure[order], starts) for measure, operation in zip(measures, operations)])
+
+
+def _pack(keys):
+    # integer group-by columns -> one int64 that sorts in the same order, or None if they do not fit in 63 bits
+    if not all(key.dtype.kind in 'iu' for key in keys):
+        return None
+    if len(keys) == 1:
+        return keys[0]
+    lows = [int(key.min()) for key in keys]
+    spans = [int(key.max()) - low + 1 for key, low in zip(keys, lows)]
+    if np.prod([float(span) for span in spans]) >= 2 ** 62:
+        return None
+    packed = np.zeros(len(keys[0]), dtype=np.int64)
+    for key, low, span in zip(keys, lows, spans):
+        packed *= span
+        packed += key - low
+    return packed
+
+
+def _fold(parts, operations):
+    return _reduce([np.concatenate(columns) for columns in zip(*(part[0] for part in parts))],
+                   [np.concatenate(columns) for columns in zip(*(part[1] for part in parts))], operations)
+
+
+class _Batch:
+    # lazy numpy views of the columns of one fact batch: columns (a dict of arrays), records or tuples
+
+    def __init__(self, batch, table):
+        if isinstance(batch, dict):
+            self.columns = batch
+        elif batch and isinstance(batch[0], dict):
+            self.columns = {name: [record[name] for record in batch] for name in schemas.fieldnames(table)}
+        else:
+            self.columns = dict(zip(schemas.fieldnames(table), zip(*batch)))
+        self._arrays = {}
+
+    def __getitem__(self, name):
+        if name not in self._arrays:
+            self._arrays[name] = np.asarray(self.columns[name])
+        return self._arrays[name]
+
+
+class KpiAggregator:
+    """
+    Maintains the KPI summary tables of AGGREGATES from streaming fact batches.
+    Parameters:
+        lookups (dict, optional): LOOKUPS column -> (dimension keys, attribute values), e.g.
+            {'customer_id': (account_ids, customer_ids)}; needed by the aggregates that group by that column.
+        names (list, optional): Only maintain these aggregate tables. Defaults to every table in AGGREGATES.
+    Example:
+        >>> aggregator = KpiAggregator.from_dimensions(accounts, loans)
+        >>> write(aggregator.tee('fact_transactions', transaction_batches))
+        >>> for table, columns in aggregator.tables():
+        ...     columnar.write_columns_to_csv(columns, f'{table}.csv')
+    """
+
+    def __init__(self, lookups=None, names=None):
+        self.names = list(names or AGGREGATES)
+        self.lookups = {}
+        for column, (keys, values) in (lookups or {}).items():
+            keys = np.asarray(keys, dtype=np.int64)
+            order = np.argsort(keys, kind='stable')
+            values = np.asarray(values)
+            if values.dtype == object:
+                values = values.astype(str)  # e.g. columns from dimension_cache; sortable and savable without pickle
+            self.lookups[column] = (keys[order], values[order])
+        self._parts = {name: [] for name in self.names}
+
+    @classmethod
+    def from_dimensions(cls, accounts, loans, **kwargs):
+        """
+        Builds an aggregator from the generated dimensions.
+        Parameters:
+            accounts (list or dict): dim_account records, or its columns (maps accounts to customers).
+            loans (list or dict): dim_loan records, or its columns (maps loans to loan types).
+            **kwargs: Passed to KpiAggregator.
+        Returns:
+            KpiAggregator: The aggregator.
+        """
+        dimensions = {'accounts': accounts, 'loans': loans}
+        lookups = {column: (balances._column(dimensions[table], key), balances._column(dimensions[table], column))
+                   for column, (table, key) in LOOKUPS.items()}
+        return cls(lookups, **kwargs)
+
+    def for_table(self, table):
+        """
+        Returns:
+            KpiAggregator: An empty aggregator for the aggregates of one fact table, with only the lookups they
+            need, e.g. to send to the worker of a shard; None if no aggregate reads the table.
+        """
+        names = [name for name in self.names if AGGREGATES[name]['source'] == table]
+        if not names:
+            return None
+        needed = {key for name in names for key in AGGREGATES[name]['keys'] if key in LOOKUPS}
+        aggregator = KpiAggregator(names=names)
+        aggregator.lookups = {column: self.lookups[column] for column in needed}
+        return aggregator
+
+    def _lookup(self, column, batch):
+        sorted_keys, values = self.lookups[column]
+        keys = np.asarray(batch[LOOKUPS[column][1]], dtype=np.int64)
+        positions = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+        if len(keys) and not np.array_equal(sorted_keys[positions], keys):
+            raise ValueError(f'facts reference unknown {LOOKUPS[column][1]} values')
+        return values[positions]
+
+    def add(self, table, batch):
+        """
+        Folds one fact batch into the aggregates of its table.
+        Parameters:
+            table (str): The fact table, e.g. 'fact_transactions'.
+            batch (dict or list): Columns (a dict of arrays from columnar.py), records, or tuples in schema order.
+        """
+        names = [name for name in self.names if AGGREGATES[name]['source'] == table]
+        if not names or not len(batch):
+            return
+        batch = _Batch(batch, table)
+        for name in names:
+            definition = AGGREGATES[name]
+            keys = [self._lookup(key, batch) if key in LOOKUPS else batch[key] for key in definition['keys']]
+            kept = None
+            for column, values in definition.get('exclude', {}).items():
+                kept = ~np.isin(batch[column], values) if kept is None else kept & ~np.isin(batch[column], values)
+            if kept is not None:
+                keys = [key[kept] for key in keys]
+            types = dict(schemas.columns(name))
+            measures, operations = [], []
+            for output, (operation, column) in definition['measures'].items():
+                if operation == 'count':
+                    values = np.ones(len(keys[0]), dtype=np.int64)
+                else:
+                    values = batch[column][kept] if kept is not None else batch[column]
+                    if types[output] == 'money':
+                        values = np.rint(np.asarray(values, dtype=np.float64) * 100)  # integer cents
+                    values = values.astype(np.int64)
+                measures.append(values)
+                operations.append(operation)
+            parts = self._parts[name]
+            parts.append(_reduce(keys, measures, operations))
+            if len(parts) >= MAX_PENDING_PARTS:
+                parts[:] = [_fold(parts, operations)]
+
+    def tee(self, table, batches):
+        """
+        Passes fact batches through unchanged, aggregating each one on the way.
+        Parameters:
+            table (str): The fact table the batches belong to.
+            batches (iterable): Batches, as accepted by add().
+        Yields:
+            The same batches.
+        """
+        for batch in batches:
+            self.add(table, batch)
+            yield batch
+
+    def merge(self, other):
+        """
+        Adds the aggregates of another aggregator, e.g. of a shard or of an earlier run, to this one.
+        Parameters:
+            other (KpiAggregator): The aggregator to merge; it is left unchanged.
+        """
+        for name in other.names:
+            if name in self._parts and other._parts[name]:
+                parts = self._parts[name]
+                parts.extend(other._parts[name])
+                if len(parts) >= MAX_PENDING_PARTS:
+                    parts[:] = [_fold(parts, _operations(name))]
+
+    def _folded(self, name):
+        # -> (group-by columns, measures) of everything added so far, or None
+        parts = self._parts[name]
+        if len(parts) > 1:
+            parts[:] = [_fold(parts, _operations(name))]
+        return parts[0] if parts else None
+
+    def result(self, name):
+        """
+        Parameters:
+            name (str): The aggregate table, e.g. 'agg_loan_status'.
+        Returns:
+            dict: Column name -> numpy.ndarray, in schemas.AGGREGATE_SCHEMAS order and sorted on the group-by
+            columns; money columns are in currency units.
+        """
+        folded = self._folded(name)
+        if folded is None:
+            types = dict(schemas.columns(name))
+            folded = ([np.zeros(0, dtype=str if types[key] == 'str' else np.int64) for key in AGGREGATES[name]['keys']],
+                      [np.zeros(0, dtype=np.int64) for _ in AGGREGATES[name]['measures']])
+        values = folded[0] + folded[1]
+        return {column: value / 100 if column_type == 'money' else value
+                for (column, column_type), value in zip(schemas.columns(name), values)}
+
+    def tables(self):
+        """
+        Yields:
+            tuple: (aggregate table name, its columns from result()), for every maintained table.
+        """
+        for name in self.names:
+            yield name, self.result(name)
+
+    def save(self, file_path):
+        """
+        Writes the aggregates and the lookups to a .npz file, so a later run can continue them with load().
+        Parameters:
+            file_path (str): The .npz file.
+        """
+        arrays = {'names': np.asarray(self.names)}
+        for name in self.names:
+            folded = self._folded(name)
+            if folded is not None:
+                arrays.update({f'{name}.key{i}': values for i, values in enumerate(folded[0])})
+                arrays.update({f'{name}.measure{i}': values for i, values in enumerate(folded[1])})
+        for column, (keys, values) in self.lookups.items():
+            arrays[f'lookup.{column}.keys'] = keys
+            arrays[f'lookup.{column}.values'] = values
+        with open(file_path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        Reads aggregates written by save().
+        Parameters:
+            file_path (str): The .npz file.
+        Returns:
+            KpiAggregator: The aggregator, ready to add more batches to.
+        """
+        with np.load(file_path) as arrays:
+            aggregator = cls(names=arrays['names'].tolist())
+            for name in aggregator.names:
+                if f'{name}.key0' in arrays:
+                    aggregator._parts[name] = [([arrays[f'{name}.key{i}'] for i in range(len(AGGREGATES[name]['keys']))],
+                                                [arrays[f'{name}.measure{i}'] for i in range(len(AGGREGATES[name]['measures']))])]
+            aggregator.lookups = {column: (arrays[f'lookup.{column}.keys'], arrays[f'lookup.{column}.values'])
+                                  for column in LOOKUPS if f'lookup.{column}.keys' in arrays}
+        return aggregator
+
+
+def _operations(name):
+    return [operation for operation, _ in AGGREGATES[name]['measures'].values()]
@@ -0,0 +1,248 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+
+# Benchmark harness for the generators and writers.
+#
+# Every (case, size) pair runs in a fresh process, so peak RSS is the peak of that case alone. Dimensions a fact
+# generator needs are built before the clock starts. Writers get their rows generated lazily, batch by batch, as
+# in a real run, so peak RSS reflects the writer streaming one batch, not the whole input held in memory; the time
+# spent generating the batches is left out of the writer's time. Results are written as a JSON report; --compare
+# checks a report against a stored baseline and exits non-zero on regressions.
+#
+#   python benchmark.py --sizes 1000 100000 --output bench_report.json
+#   python benchmark.py --sizes 1000 100000 --compare bench_baseline.json
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_TOLERANCE = 0.10
+
+
+def _dims(main):
+    customers = main.generate_dim_customer(1000)
+    return {
+        'customers': customers,
+        'ls_dates': main.generate_dim_date(),
+        'channels': main.generate_dim_channel(),
+        'transactions_types': main.generate_dim_transaction_type(),
+        'locations': main.generate_dim_location(50),
+        'currencies': main.generate_dim_currency(),
+        'accounts': main.generate_dim_account(1000, customer_ids=[customer['customer_id'] for customer in customers]),
+        'investment_types': main.generate_dim_investment_type(),
+        'loans': main.generate_dim_loan(50),
+    }
+
+
+# fact table -> (row generator, columnar generator, dimension arguments in order)
+def _fact_cases(main, columnar):
+    return {
+        'fact_transaction': (main.generate_fact_transaction, columnar.generate_fact_transaction_columns,
+                             ['accounts', 'ls_dates', 'transactions_types', 'channels', 'locations', 'currencies']),
+        'fact_investement': (main.generate_fact_investement, columnar.generate_fact_investement_columns,
+                             ['accounts', 'ls_dates', 'investment_types', 'locations', 'currencies']),
+        'fact_loan': (main.generate_fact_loan, columnar.generate_fact_loan_columns,
+                      ['accounts', 'ls_dates', 'loans', 'locations', 'currencies']),
+        'fact_customer_interactions': (main.generate_fact_customer_interactions,
+                                       columnar.generate_fact_customer_interactions_columns,
+                                       ['customers', 'ls_dates', 'channels', 'locations']),
+        'fact_daily_balances': (main.generate_fact_daily_balances, columnar.generate_fact_daily_balances_columns,
+                                ['accounts', 'ls_dates', 'currencies']),
+    }
+
+
+# dimension generators that take a row count; the others always produce their natural size
+SIZED_DIMENSIONS = ['generate_dim_customer', 'generate_dim_account', 'generate_dim_location',
+                    'generate_dim_investment_type', 'generate_dim_loan']
+FIXED_DIMENSIONS = ['generate_dim_date', 'generate_dim_channel', 'generate_dim_transaction_type', 'generate_dim_currency']
+
+
+def case_names():
+    """
+    Returns:
+        list: The name of every benchmark case.
+    """
+    facts = ['fact_transaction', 'fact_investement', 'fact_loan', 'fact_customer_interactions', 'fact_daily_balances']
+    return (SIZED_DIMENSIONS + FIXED_DIMENSIONS + [f'generate_{name}' for name in facts]
+            + [f'generate_{name}_columns' for name in facts] + ['write_to_csv', 'write_columns_to_csv'])
+
+
+class _UntimedBatches:
+    # yields the batches of a generator, adding up the time spent producing them, so a writer can be timed alone
+    def __init__(self, batches):
+        self.batches = iter(batches)
+        self.seconds = 0.0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            return next(self.batches)
+        finally:
+            self.seconds += time.perf_counter() - start
+
+
+def _prepare(name, size, main, columnar):
+    # builds the untimed inputs of a case and returns a callable doing the timed work
+    # -> (rows, bytes written, seconds to leave out of the timing)
+    if name in SIZED_DIMENSIONS:
+        if name == 'generate_dim_account':
+            return lambda folder: (len(main.generate_dim_account(size, customer_ids=list(range(1, 1001)))), 0, 0.0)
+        return lambda folder: (len(getattr(main, name)(size)), 0, 0.0)
+    if name in FIXED_DIMENSIONS:
+        return lambda folder: (len(getattr(main, name)()), 0, 0.0)
+
+    dims = _dims(main)
+    facts = _fact_cases(main, columnar)
+    for fact, (generate, generate_columns, dim_names) in facts.items():
+        args = [dims[dim_name] for dim_name in dim_names]
+        if name == f'generate_{fact}':
+            return lambda folder: (sum(len(batch) for batch in main.iter_chunks(generate, size, *args)), 0, 0.0)
+        if name == f'generate_{fact}_columns':
+            return lambda folder: (sum(len(next(iter(batch.values())))
+                                       for batch in columnar.iter_column_chunks(generate_columns, size, *args)), 0, 0.0)
+
+    generate, generate_columns, dim_names = facts['fact_transaction']
+    args = [dims[dim_name] for dim_name in dim_names]
+    if name == 'write_to_csv':
+        def run(folder):
+            batches = _UntimedBatches(main.iter_chunks(generate, size, *args))
+            main.write_to_csv(batches, 'bench.csv', folder_name=folder, fieldnames=main.schemas.fieldnames('fact_transactions'))
+            return size, os.path.getsize(os.path.join(folder, 'bench.csv')), batches.seconds
+        return run
+    if name == 'write_columns_to_csv':
+        def run(folder):
+            batches = _UntimedBatches(columnar.iter_column_chunks(generate_columns, size, *args))
+            columnar.write_columns_to_csv(batches, 'bench.csv', folder_name=folder)
+            return size, os.path.getsize(os.path.join(folder, 'bench.csv')), batches.seconds
+        return run
+    raise ValueError(f'unknown benchmark case {name!r}')
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024  # bytes on macOS, KB on Linux
+
+
+def run_case(name, size):
+    """
+    Runs one benchmark case in the current process.
+    Parameters:
+        name (str): The case, one of case_names().
+        size (int): The number of rows to generate or write (ignored by fixed-size dimensions).
+    Returns:
+        dict: 'name', 'size', 'rows', 'seconds', 'rows_per_sec', 'peak_rss_mb' and 'bytes_written'.
+    """
+    import columnar
+    import main
+
+    main.random.seed(0)
+    main.fake.seed_instance(0)
+    run = _prepare(name, size, main, columnar)
+    folder = tempfile.mkdtemp(prefix='bench-')
+    try:
+        start = time.perf_counter()
+        rows, bytes_written, untimed_seconds = run(folder)
+        seconds = time.perf_counter() - start - untimed_seconds
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return {
+        'name': name,
+        'size': size if name not in FIXED_DIMENSIONS else rows,
+        'rows': rows,
+        'seconds': seconds,
+        'rows_per_sec': rows / seconds if seconds else 0.0,
+        'peak_rss_mb': _peak_rss_mb(),
+        'bytes_written': bytes_written,
+    }
+
+
+def run_benchmarks(cases=None, sizes=None):
+    """
+    Runs benchmark cases at several sizes, each in a fresh process.
+    Parameters:
+        cases (list, optional): Case names. Defaults to every case.
+        sizes (list, optional): Row counts. Defaults to DEFAULT_SIZES.
+    Returns:
+        dict: The report: run metadata plus one result per (case, size) under 'results'.
+    """
+    cases = cases or case_names()
+    sizes = sizes or DEFAULT_SIZES
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for name in cases:
+        for size in (sizes if name not in FIXED_DIMENSIONS else sizes[:1]):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                result = pool.submit(run_case, name, size).result()
+            results.append(result)
+            print(f"{result['name']:<46} {result['size']:>10} rows {result['seconds']:9.3f}s "
+                  f"{result['rows_per_sec']:>14,.0f} rows/s {result['peak_rss_mb']:9.1f} MB RSS "
+                  f"{result['bytes_written'] / 1e6:9.1f} MB written")
+    return {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+
+
+def compare_reports(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Flags cases that got slower or bigger than a stored baseline.
+    A case regresses when its rows/sec drops, or its peak RSS grows, by more than `tolerance`.
+    Parameters:
+        report (dict): The new report, from run_benchmarks.
+        baseline (dict): The stored baseline report.
+        tolerance (float, optional): The allowed relative change. Defaults to 0.10.
+    Returns:
+        list: One dictionary per regression with 'name', 'size', 'metric', 'baseline' and 'current'.
+    """
+    baseline_results = {(result['name'], result['size']): result for result in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        base = baseline_results.get((result['name'], result['size']))
+        if base is None:
+            continue
+        if result['rows_per_sec'] < base['rows_per_sec'] * (1 - tolerance):
+            regressions.append({'name': result['name'], 'size': result['size'], 'metric': 'rows_per_sec',
+                                'baseline': base['rows_per_sec'], 'current': result['rows_per_sec']})
+        if result['peak_rss_mb'] > base['peak_rss_mb'] * (1 + tolerance):
+            regressions.append({'name': result['name'], 'size': result['size'], 'metric': 'peak_rss_mb',
+                                'baseline': base['peak_rss_mb'], 'current': result['peak_rss_mb']})
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the data generators and writers.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='row counts to run every case at')
+    parser.add_argument('--cases', nargs='+', choices=case_names(), help='cases to run (default: all)')
+    parser.add_argument('--output', default='bench_report.json', help='where to write the JSON report')
+    parser.add_argument('--compare', help='baseline report to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='allowed relative slowdown/growth')
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.cases, args.sizes)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f'Wrote {args.output}')
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare_reports(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression['name']} @ {regression['size']}: {regression['metric']} "
+                  f"{regression['baseline']:,.1f} -> {regression['current']:,.1f}")
+        if regressions:
+            sys.exit(1)
+        print('No regressions')
@@ -0,0 +1,239 @@
+import gzip
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+except ImportError:  # zstd output is optional; gzip only needs the standard library
+    zstandard = None
+
+
+# Compressed CSV output with parallel block compression.
+#
+# ParallelCompressor cuts the byte stream into fixed-size blocks and compresses every block on a thread pool
+# (zlib and zstandard release the GIL while they work), writing the results in order. Each block becomes a
+# complete gzip member or zstd frame. A stream of members/frames is itself a valid .gz/.zst file, so:
+#   - gzip -d, zstd -d, Python, Redshift COPY ... GZIP|ZSTD and Snowflake COPY read the files as usual;
+#   - compressed files can be concatenated byte for byte, which is how parallel.merge_parts() joins compressed shards;
+#   - the header line goes into a block of its own, so a merge can drop it from every part but the first.
+# Blocks are compressed with a fixed gzip mtime, so the same rows always give the same bytes.
+#
+#   python main.py --seed 42 --compression zstd      # data/fact_transactions.csv.zst, ...
+
+CODECS = {'gzip': '.gz', 'zstd': '.zst'}
+DEFAULT_BLOCK_SIZE = 4 * 1024 * 1024
+DEFAULT_LEVELS = {'gzip': 6, 'zstd': 3}
+CSV_EXTENSIONS = ('.csv',) + tuple('.csv' + extension for extension in CODECS.values())
+
+
+def _require_codec(codec):
+    if codec not in CODECS:
+        raise ValueError(f'compression must be one of {sorted(CODECS)}, got {codec!r}')
+    if codec == 'zstd' and zstandard is None:
+        raise ImportError('zstd output needs zstandard: pip install zstandard')
+
+
+def compressed_name(file_name, codec=None):
+    """
+    Returns:
+        str: The file name with the codec's extension, e.g. 'fact_loans.csv.gz'; unchanged without a codec.
+    """
+    if not codec:
+        return file_name
+    _require_codec(codec)
+    return file_name + CODECS[codec]
+
+
+def codec_of(file_name):
+    """
+    Returns:
+        str: The codec a file name's extension stands for, or None for an uncompressed file.
+    """
+    for codec, extension in CODECS.items():
+        if file_name.endswith(extension):
+            return codec
+    return None
+
+
+def compress_block(data, codec, level=None):
+    """
+    Compresses one block into a self-contained gzip member or zstd frame.
+    Parameters:
+        data (bytes): The block.
+        codec (str): 'gzip' or 'zstd'.
+        level (int, optional): The compression level. Defaults to DEFAULT_LEVELS[codec].
+    Returns:
+        bytes: The compressed block.
+    """
+    _require_codec(codec)
+    level = DEFAULT_LEVELS[codec] if level is None else level
+    if codec == 'gzip':
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+class ParallelCompressor(io.RawIOBase):
+    """
+    A writable binary file object that compresses blocks on a thread pool and writes them, in order, to another
+    binary file object.
+    Parameters:
+        raw (file object): Receives the compressed bytes, e.g. an open file or a stream_upload.S3MultipartWriter.
+            It is not closed by close().
+        codec (str): 'gzip' or 'zstd'.
+        block_size (int, optional): Uncompressed bytes per block. Defaults to 4 MB.
+        workers (int, optional): Compression threads. Defaults to the number of CPUs.
+        level (int, optional): The compression level. Defaults to DEFAULT_LEVELS[codec].
+    Example:
+        >>> with open('fact_loans.csv.zst', 'wb') as f, ParallelCompressor(f, 'zstd') as out:
+        ...     out.write(b'loan_fact_id|date_id|...\r\n')
+    """
+
+    def __init__(self, raw, codec, block_size=DEFAULT_BLOCK_SIZE, workers=None, level=None):
+        super().__init__()
+        _require_codec(codec)
+        self.raw = raw
+        self.codec = codec
+        self.block_size = block_size
+        self.level = level
+        self.bytes_in = 0
+        self.bytes_out = 0
+        workers = workers or os.cpu_count() or 1
+        self._buffer = bytearray()
+        self._pending = []
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._slots = threading.BoundedSemaphore(2 * workers)
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        self.bytes_in += len(data)
+        while len(self._buffer) >= self.block_size:
+            block = bytes(self._buffer[:self.block_size])
+            del self._buffer[:self.block_size]
+            self._submit(block)
+        return len(data)
+
+    def flush_block(self):
+        """
+        Ends the current block early, so the bytes written so far form complete members/frames of their own.
+        """
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            self._buffer = bytearray()
+
+    def _submit(self, block):
+        self._slots.acquire()  # backpressure: at most 2 blocks per thread are buffered or compressing
+        future = self._pool.submit(compress_block, block, self.codec, self.level)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._pending.append(future)
+        # write out finished blocks in order, without waiting for the ones still running
+        while self._pending and self._pending[0].done():
+            self._write_out(self._pending.pop(0).result())
+
+    def _write_out(self, compressed):
+        self.raw.write(compressed)
+        self.bytes_out += len(compressed)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.flush_block()
+            for future in self._pending:
+                self._write_out(future.result())
+            self._pending = []
+        finally:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            super().close()
+
+    def abort(self):
+        """
+        Stops the compression threads and drops the blocks not yet written, e.g. after the raw stream failed.
+        """
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self._pending = []
+        self._buffer = bytearray()
+        super().close()
+
+
+def open_csv_writer(file_path, codec=None, block_size=DEFAULT_BLOCK_SIZE, workers=None):
+    """
+    Opens a CSV file for text writing, compressed in parallel blocks when a codec is given.
+    Parameters:
+        file_path (str): The file to write, already carrying the codec's extension.
+        codec (str, optional): 'gzip', 'zstd' or None. Defaults to None.
+        block_size (int, optional): See ParallelCompressor. Defaults to 4 MB.
+        workers (int, optional): See ParallelCompressor. Defaults to the number of CPUs.
+    Returns:
+        file object: A text file object (UTF-8, no newline translation); closing it closes the file.
+    """
+    if not codec:
+        return open(file_path, 'w', newline='', encoding='utf-8')
+    raw = open(file_path, 'wb')
+    try:
+        return _CompressedText(raw, ParallelCompressor(raw, codec, block_size, workers))
+    except BaseException:
+        raw.close()
+        raise
+
+
+class _CompressedText(io.TextIOWrapper):
+    # a text wrapper around a ParallelCompressor that also closes the underlying file
+
+    def __init__(self, raw, compressor):
+        super().__init__(compressor, encoding='utf-8', newline='', write_through=True)
+        self._file = raw
+
+    def flush_block(self):
+        self.flush()
+        self.buffer.flush_block()
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._file.close()
+
+
+def open_csv_reader(file_path):
+    """
+    Opens a CSV file for binary reading, decompressing it when its extension is .gz or .zst.
+    Parameters:
+        file_path (str): The file to read.
+    Returns:
+        file object: A binary file object over the uncompressed bytes.
+    """
+    codec = codec_of(file_path)
+    if codec == 'gzip':
+        return gzip.open(file_path, 'rb')  # reads every member of a multi-member file
+    if codec == 'zstd':
+        _require_codec(codec)
+        raw = open(file_path, 'rb')
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True,
+                                                                            closefd=True))
+    return open(file_path, 'rb')
+
+
+def header_block_size(file_path):
+    """
+    Measures the block holding the header line of a file written by open_csv_writer(), so that compressed files
+    can be concatenated without repeating the header.
+    Parameters:
+        file_path (str): A .csv, .csv.gz or .csv.zst file.
+    Returns:
+        int: The number of bytes, at the start of the file, that hold the header line.
+    """
+    with open_csv_reader(file_path) as f:
+        header = f.readline()
+    codec = codec_of(file_path)
+    if not codec:
+        return len(header)
+    block = compress_block(header, codec)
+    with open(file_path, 'rb') as f:
+        if f.read(len(block)) != block:
+            raise ValueError(f'the header of {file_path} is not a block of its own; it was not written by open_csv_writer()')
+    return len(block)
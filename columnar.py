@@ -0,0 +1,234 @@
+import csv
+import itertools
+import os
+
+import numpy as np
+
+import block_compression
+from id_allocator import allocator_for
+
+
+# Batched, NumPy-backed counterparts of the generate_fact_* functions in main.py.
+# Every function draws whole columns at once and returns a dict of column name ->
+# array, in the same column order and value ranges as the row-based generators.
+
+TRANSACTION_STATUSES = np.array(['Pending', 'Completed', 'Failed'])
+LOAN_STATUSES = np.array(['Pending', 'Approved', 'Rejected'])
+INTERACTION_TYPES = np.array(['Phone', 'Email', 'Chat', 'Website', 'Social Media', 'In-Person'])
+
+
+def default_rng(seed=None):
+    """
+    Returns a NumPy random generator for the columnar engine.
+    Parameters:
+        seed (int, optional): Seed for a reproducible stream. Defaults to None (fresh entropy).
+    Returns:
+        numpy.random.Generator: The random generator.
+    """
+    return np.random.default_rng(seed)
+
+
+def key_column(records, key):
+    """
+    Extracts the key column of a dimension as an integer array.
+    Parameters:
+        records (list or numpy.ndarray): A list of dictionaries representing dimension records, or the key values themselves.
+        key (str): The name of the key to extract, e.g. 'account_id'.
+    Returns:
+        numpy.ndarray: The key values, in record order.
+    """
+    if isinstance(records, np.ndarray):
+        return records
+    return np.fromiter((record[key] for record in records), dtype=np.int64, count=len(records))
+
+
+def _choice(rng, values, num_records):
+    return values[rng.integers(0, len(values), size=num_records)]
+
+
+def _key(rng, samplers, records, key, num_records):
+    # a KeySampler from distributions.py replaces the uniform draw for the columns it covers
+    if samplers and key in samplers:
+        return samplers[key].sample(num_records, rng)
+    return _choice(rng, key_column(records, key), num_records)
+
+
+def _amount(rng, a, b, num_records):
+    return np.round(rng.uniform(a, b, size=num_records), 2)
+
+
+def _unique_ids(id_alloc, name, num_records):
+    # shares the allocators of the row-based generators unless one is passed in
+    return (id_alloc if id_alloc is not None else allocator_for(name)).take(num_records)
+
+
+def generate_fact_transaction_columns(num_records, accounts, ls_dates, transactions_types, channels, locations, currencies, rng=None, id_alloc=None, samplers=None):
+    """
+    Columnar version of generate_fact_transaction.
+    Parameters:
+        num_records (int): The number of fact transaction records to generate.
+        accounts, ls_dates, transactions_types, channels, locations, currencies (list or numpy.ndarray): Dimension records, or their key values.
+        rng (numpy.random.Generator, optional): The random generator to draw from.
+        id_alloc (IdAllocator, optional): Allocator for the primary key. Defaults to the shared one for the table.
+        samplers (dict, optional): Key column -> distributions.KeySampler for skewed foreign keys. Defaults to uniform keys.
+    Returns:
+        dict: Column name -> numpy.ndarray, with the columns of generate_fact_transaction.
+    """
+    rng = rng if rng is not None else default_rng()
+    return {
+        'transaction_id': _unique_ids(id_alloc, 'transaction_id', num_records),
+        'date_id': _key(rng, samplers, ls_dates, 'date_id', num_records),
+        'transaction_type_id': _key(rng, samplers, transactions_types, 'transaction_type_id', num_records),
+        'account_id': _key(rng, samplers, accounts, 'account_id', num_records),
+        'channel_id': _key(rng, samplers, channels, 'channel_id', num_records),
+        'location_id': _key(rng, samplers, locations, 'location_id', num_records),
+        'currency_id': _key(rng, samplers, currencies, 'currency_id', num_records),
+        'transaction_amount': _amount(rng, 1.00, 10000, num_records),
+        'transaction_status': _choice(rng, TRANSACTION_STATUSES, num_records),
+    }
+
+
+def generate_fact_investement_columns(num_records, accounts, ls_dates, investment_types, locations, currencies, rng=None, id_alloc=None, samplers=None):
+    """
+    Columnar version of generate_fact_investement.
+    Parameters:
+        num_records (int): The number of investment records to generate.
+        accounts, ls_dates, investment_types, locations, currencies (list or numpy.ndarray): Dimension records, or their key values.
+        rng (numpy.random.Generator, optional): The random generator to draw from.
+        id_alloc (IdAllocator, optional): Allocator for the primary key. Defaults to the shared one for the table.
+        samplers (dict, optional): Key column -> distributions.KeySampler for skewed foreign keys. Defaults to uniform keys.
+    Returns:
+        dict: Column name -> numpy.ndarray, with the columns of generate_fact_investement.
+    """
+    rng = rng if rng is not None else default_rng()
+    return {
+        'investment_id': _unique_ids(id_alloc, 'investment_id', num_records),
+        'date_id': _key(rng, samplers, ls_dates, 'date_id', num_records),
+        'investment_type_id': _key(rng, samplers, investment_types, 'investment_type_id', num_records),
+        'account_id': _key(rng, samplers, accounts, 'account_id', num_records),
+        'location_id': _key(rng, samplers, locations, 'location_id', num_records),
+        'currency_id': _key(rng, samplers, currencies, 'currency_id', num_records),
+        'investment_amount': _amount(rng, 1000.00, 10000, num_records),
+        'investment_return': _amount(rng, -5000, 15000, num_records),
+    }
+
+
+def generate_fact_loan_columns(num_records, accounts, ls_dates, loans, locations, currencies, rng=None, id_alloc=None, samplers=None):
+    """
+    Columnar version of generate_fact_loan.
+    Parameters:
+        num_records (int): The number of loan records to generate.
+        accounts, ls_dates, loans, locations, currencies (list or numpy.ndarray): Dimension records, or their key values.
+        rng (numpy.random.Generator, optional): The random generator to draw from.
+        id_alloc (IdAllocator, optional): Allocator for the primary key. Defaults to the shared one for the table.
+        samplers (dict, optional): Key column -> distributions.KeySampler for skewed foreign keys. Defaults to uniform keys.
+    Returns:
+        dict: Column name -> numpy.ndarray, with the columns of generate_fact_loan.
+    """
+    rng = rng if rng is not None else default_rng()
+    return {
+        'loan_fact_id': _unique_ids(id_alloc, 'loan_fact_id', num_records),
+        'date_id': _key(rng, samplers, ls_dates, 'date_id', num_records),
+        'loan_id': _key(rng, samplers, loans, 'loan_id', num_records),
+        'account_id': _key(rng, samplers, accounts, 'account_id', num_records),
+        'location_id': _key(rng, samplers, locations, 'location_id', num_records),
+        'currency_id': _key(rng, samplers, currencies, 'currency_id', num_records),
+        'loan_amount': _amount(rng, 5000, 500000, num_records),
+        'loan_status': _choice(rng, LOAN_STATUSES, num_records),
+    }
+
+
+def generate_fact_customer_interactions_columns(num_records, customers, ls_dates, channels, locations, rng=None, id_alloc=None, samplers=None):
+    """
+    Columnar version of generate_fact_customer_interactions.
+    Parameters:
+        num_records (int): The number of fact customer interaction records to generate.
+        customers, ls_dates, channels, locations (list or numpy.ndarray): Dimension records, or their key values.
+        rng (numpy.random.Generator, optional): The random generator to draw from.
+        id_alloc (IdAllocator, optional): Allocator for the primary key. Defaults to the shared one for the table.
+        samplers (dict, optional): Key column -> distributions.KeySampler for skewed foreign keys. Defaults to uniform keys.
+    Returns:
+        dict: Column name -> numpy.ndarray, with the columns of generate_fact_customer_interactions.
+    """
+    rng = rng if rng is not None else default_rng()
+    return {
+        'interaction_id': _unique_ids(id_alloc, 'interaction_id', num_records),
+        'date_id': _key(rng, samplers, ls_dates, 'date_id', num_records),
+        'customer_id': _key(rng, samplers, customers, 'customer_id', num_records),
+        'channel_id': _key(rng, samplers, channels, 'channel_id', num_records),
+        'location_id': _key(rng, samplers, locations, 'location_id', num_records),
+        'interaction_type': _choice(rng, INTERACTION_TYPES, num_records),
+        'interaction_rating': rng.integers(1, 6, size=num_records),
+    }
+
+
+def generate_fact_daily_balances_columns(num_records, accounts, ls_dates, currencies, rng=None, id_alloc=None, samplers=None):
+    """
+    Columnar version of generate_fact_daily_balances.
+    Parameters:
+        num_records (int): The number of daily balance records to generate.
+        accounts, ls_dates, currencies (list or numpy.ndarray): Dimension records, or their key values.
+        rng (numpy.random.Generator, optional): The random generator to draw from.
+        id_alloc (IdAllocator, optional): Allocator for the primary key. Defaults to the shared one for the table.
+        samplers (dict, optional): Key column -> distributions.KeySampler for skewed foreign keys. Defaults to uniform keys.
+    Returns:
+        dict: Column name -> numpy.ndarray, with the columns of generate_fact_daily_balances.
+    """
+    rng = rng if rng is not None else default_rng()
+    return {
+        'balance_id': _unique_ids(id_alloc, 'balance_id', num_records),
+        'date_id': _key(rng, samplers, ls_dates, 'date_id', num_records),
+        'account_id': _key(rng, samplers, accounts, 'account_id', num_records),
+        'currency_id': _key(rng, samplers, currencies, 'currency_id', num_records),
+        'opening_balance': _amount(rng, 0, 1000000, num_records),
+        'closing_balance': _amount(rng, 0, 1000000, num_records),
+        'average_balance': np.round(rng.uniform(0, 1000000, num_records) + rng.uniform(0, 1000000, num_records), 2) / 2,
+    }
+
+
+def iter_column_chunks(generate, num_records, *args, rng=None, chunk_size=50000, id_alloc=None, samplers=None):
+    """
+    Calls a generate_*_columns function repeatedly so a large table is produced in fixed-size batches.
+    Parameters:
+        generate (callable): A generate_*_columns function taking the number of records as its first argument.
+        num_records (int): The total number of records to generate.
+        *args: The dimension arguments for `generate`.
+        rng (numpy.random.Generator, optional): The random generator shared by every batch.
+        chunk_size (int, optional): The number of records per batch. Defaults to 50000.
+        id_alloc (IdAllocator, optional): Allocator for the primary key. Defaults to the shared one for the table.
+        samplers (dict, optional): Key column -> distributions.KeySampler for skewed foreign keys. Defaults to uniform keys.
+    Yields:
+        dict: Column name -> numpy.ndarray for the next batch.
+    """
+    rng = rng if rng is not None else default_rng()
+    for offset in range(0, num_records, chunk_size):
+        yield generate(min(chunk_size, num_records - offset), *args, rng=rng, id_alloc=id_alloc, samplers=samplers)
+
+
+def write_columns_to_csv(columns, file_name, folder_name='data', compression=None, compression_workers=None):
+    """
+    Writes column arrays to a pipe-delimited CSV file, in the same format as write_to_csv.
+    Parameters:
+        columns (dict or iterable): Column name -> numpy.ndarray, as returned by the generate_*_columns functions,
+            or an iterable of such dicts (batches), e.g. from iter_column_chunks.
+        file_name (str): The name of the file to write.
+        folder_name (str, optional): The folder to write into. Defaults to 'data'.
+        compression (str, optional): 'gzip' or 'zstd' to compress in parallel blocks; file_name should then end in
+            .gz or .zst (see block_compression.py). Defaults to None.
+        compression_workers (int, optional): Compression threads. Defaults to the number of CPUs.
+    """
+    batches = iter([columns]) if isinstance(columns, dict) else iter(columns)
+    # batches without rows are skipped, so an empty table writes no file, as with write_to_csv
+    first_batch = next((batch for batch in batches if batch and len(next(iter(batch.values())))), None)
+    if first_batch is None:
+        return  # exit if there are no rows
+    file_path = os.path.join(folder_name, file_name)
+    os.makedirs(folder_name, exist_ok=True)
+    with block_compression.open_csv_writer(file_path, compression, workers=compression_workers) as output_file:
+        writer = csv.writer(output_file, delimiter='|')
+        writer.writerow(first_batch.keys())
+        if compression:
+            output_file.flush_block()  # the header gets a block of its own, so compressed parts can be merged
+        for batch in itertools.chain([first_batch], batches):
+            # tolist() hands back Python ints/floats/strs, so values are formatted exactly as DictWriter does
+            writer.writerows(zip(*(column.tolist() for column in batch.values())))
@@ -0,0 +1,75 @@
+import csv
+import io
+import operator
+
+import block_compression
+
+
+# Batched pipe-delimited CSV encoding.
+#
+# csv.DictWriter looks up every value of every row by name and hands each row to the file separately. The row
+# generators in main.py can instead return plain tuples in schema order (schemas.fieldnames), and encode_rows()
+# formats a whole batch into one string buffer with a single writerows() call, which is then written to the file
+# in one write(). The output is byte-identical to DictWriter's: same delimiter, quoting and '\r\n' line endings.
+#
+#   rows = main.generate_fact_transaction(50000, ..., as_tuples=True)
+#   write_rows([rows], 'data/fact_transactions.csv', schemas.fieldnames('fact_transactions'))
+
+DELIMITER = '|'
+
+
+def row_getter(fieldnames):
+    """
+    Parameters:
+        fieldnames (list): The column names, in output order.
+    Returns:
+        callable: Maps a record dictionary to the tuple of its values in `fieldnames` order.
+    """
+    if len(fieldnames) == 1:
+        name = fieldnames[0]
+        return lambda record: (record[name],)
+    return operator.itemgetter(*fieldnames)
+
+
+def encode_rows(rows, fieldnames=None, header=False):
+    """
+    Formats a batch of rows as pipe-delimited CSV text.
+    Parameters:
+        rows (list): Tuples in column order, or record dictionaries (then `fieldnames` picks and orders the values).
+        fieldnames (list, optional): The column names. Required for record dictionaries and for `header`.
+        header (bool, optional): Start the text with the header line. Defaults to False.
+    Returns:
+        str: The encoded rows, one '\r\n'-terminated line each.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=DELIMITER)
+    if header:
+        writer.writerow(fieldnames)
+    if rows and isinstance(rows[0], dict):
+        rows = map(row_getter(fieldnames), rows)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def write_rows(batches, file_path, fieldnames, compression=None):
+    """
+    Writes batches of rows to a pipe-delimited CSV file with one write() per batch.
+    Parameters:
+        batches (iterable): Lists of tuples or record dictionaries, see encode_rows().
+        file_path (str): The file to write; its folder must exist.
+        fieldnames (list): The header.
+        compression (str, optional): 'gzip' or 'zstd' to compress the file in parallel blocks (see
+            block_compression.py); file_path should then end in .gz or .zst. Defaults to None.
+    Returns:
+        int: The number of rows written.
+    """
+    rows = 0
+    with block_compression.open_csv_writer(file_path, compression) as output_file:
+        output_file.write(encode_rows([], fieldnames, header=True))
+        if compression:
+            output_file.flush_block()  # the header gets a block of its own, see block_compression.header_block_size
+        for batch in batches:
+            if batch:
+                output_file.write(encode_rows(batch, fieldnames))
+                rows += len(batch)
+    return rows
@@ -0,0 +1,239 @@
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import shutil
+
+import faker
+import numpy as np
+
+import schemas
+
+
+# Persistent cache of the generated dimension tables.
+#
+# Dimensions only depend on their generator parameters, the seed and the generator code, so a run with the same
+# inputs can reuse them instead of calling Faker again. A cache entry lives in .cache/dimensions/<key>/ and holds
+# every column as a .npy file: numbers as int64/float64, strings as one UTF-8 blob plus character offsets. Entries
+# are loaded memory-mapped, so a hit only pages in the key columns fact generation needs; the other columns are
+# decoded only when a dimension file has to be written again.
+#
+# The entry also stores the state of the `random` module right after the dimensions were generated, so the facts
+# of a cached run draw exactly the same values as the facts of the run that filled the cache.
+
+DEFAULT_CACHE_DIR = os.path.join('.cache', 'dimensions')
+CACHE_FORMAT_VERSION = 1
+MANIFEST_FILE_NAME = 'manifest.json'
+
+DIMENSION_TABLES = ['customers', 'dates', 'channels', 'transaction_types', 'locations', 'currencies', 'accounts',
+                    'investment_types', 'loans']
+
+# key column handed to fact generation -> the dimension table it comes from
+KEY_COLUMNS = {
+    'account_id': 'accounts',
+    'customer_id': 'customers',
+    'date_id': 'dates',
+    'transaction_type_id': 'transaction_types',
+    'channel_id': 'channels',
+    'location_id': 'locations',
+    'currency_id': 'currencies',
+    'investment_type_id': 'investment_types',
+    'loan_id': 'loans',
+}
+
+
+def code_version(*sources):
+    """
+    Fingerprints the code that produces the dimensions, so editing a generator invalidates the cache.
+    Parameters:
+        *sources: Functions, or module names, whose source is hashed, e.g. main.generate_dim_customer or 'value_pools'.
+    Returns:
+        str: A hex digest of the sources, the Faker version and CACHE_FORMAT_VERSION.
+    """
+    digest = hashlib.sha256(f'{CACHE_FORMAT_VERSION}:{faker.VERSION}'.encode('utf-8'))
+    for source in sources:
+        if isinstance(source, str):
+            source = importlib.import_module(source)
+        digest.update(inspect.getsource(source).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def cache_key(params, version):
+    """
+    Parameters:
+        params (dict): The generator parameters and seed, JSON-serializable.
+        version (str): The code version from code_version().
+    Returns:
+        str: The cache entry name.
+    """
+    payload = json.dumps({'params': params, 'code': version}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:24]
+
+
+def _file_name(table, column, part=None):
+    return f'{table}.{column}.{part}.npy' if part else f'{table}.{column}.npy'
+
+
+class CachedDimensions:
+    """
+    A cache entry opened for reading; arrays are memory-mapped from disk.
+    Attributes:
+        rows (dict): Table name -> number of rows.
+        random_state (tuple): The `random` module state to restore before generating facts.
+    """
+
+    def __init__(self, path, manifest):
+        self.path = path
+        self.rows = manifest['rows']
+        version, internal_state, gauss = manifest['random_state']
+        self.random_state = (version, tuple(internal_state), gauss)
+
+    def _load(self, file_name):
+        return np.load(os.path.join(self.path, file_name), mmap_mode='r')
+
+    def keys(self, column):
+        """
+        Parameters:
+            column (str): A key column of KEY_COLUMNS, e.g. 'account_id'.
+        Returns:
+            numpy.ndarray: The key values, memory-mapped.
+        """
+        return self._load(_file_name(KEY_COLUMNS[column], column))
+
+    def dim_keys(self):
+        """
+        Returns:
+            dict: Every key column -> its memory-mapped key values.
+        """
+        return {column: self.keys(column) for column in KEY_COLUMNS}
+
+    def columns(self, table):
+        """
+        Decodes a whole dimension table, e.g. to write it out again.
+        Parameters:
+            table (str): The dimension table name.
+        Returns:
+            dict: Column name -> numpy.ndarray in schema order, as accepted by main.write_table.
+        """
+        columns = {}
+        for column, column_type in schemas.SCHEMAS[table]:
+            if column_type in ('str', 'date'):
+                text = self._load(_file_name(table, column, 'data')).tobytes().decode('utf-8')
+                offsets = self._load(_file_name(table, column, 'offsets')).tolist()
+                values = np.empty(len(offsets) - 1, dtype=object)
+                values[:] = [text[start:end] for start, end in zip(offsets, offsets[1:])]
+                columns[column] = values
+            else:
+                columns[column] = self._load(_file_name(table, column))
+        return columns
+
+
+class DimensionCache:
+    """
+    A directory of cached dimension sets, one sub-directory per cache key.
+    Parameters:
+        cache_dir (str, optional): The cache directory. Defaults to '.cache/dimensions'.
+    Example:
+        >>> cache = DimensionCache()
+        >>> key = cache_key({'seed': 42, 'customers': 100}, code_version(generate_dim_customer))
+        >>> if not cache.exists(key):
+        ...     cache.save(key, {'customers': customers, ...}, random.getstate())
+        >>> account_ids = cache.load(key).keys('account_id')
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def exists(self, key):
+        return os.path.exists(os.path.join(self.path(key), MANIFEST_FILE_NAME))
+
+    def save(self, key, dimensions, random_state, params=None):
+        """
+        Stores a set of dimensions. The entry is written to a temporary directory and renamed into place,
+        so a crashed run never leaves a half-written entry behind.
+        Parameters:
+            key (str): The cache key.
+            dimensions (dict): Table name -> list of record dictionaries, for every table in DIMENSION_TABLES.
+            random_state (tuple): random.getstate() right after the dimensions were generated.
+            params (dict, optional): The parameters behind the key, stored for reference. Defaults to None.
+        """
+        final_path = self.path(key)
+        tmp_path = final_path + f'.tmp-{os.getpid()}'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for table in DIMENSION_TABLES:
+            records = dimensions[table]
+            for column, column_type in schemas.SCHEMAS[table]:
+                values = [record[column] for record in records]
+                if column_type in ('str', 'date'):
+                    text = ''.join(values)
+                    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+                    np.cumsum([len(value) for value in values], out=offsets[1:])
+                    np.save(os.path.join(tmp_path, _file_name(table, column, 'data')),
+                            np.frombuffer(text.encode('utf-8'), dtype=np.uint8))
+                    np.save(os.path.join(tmp_path, _file_name(table, column, 'offsets')), offsets)
+                else:
+                    dtype = np.int64 if column_type == 'int' else np.float64
+                    np.save(os.path.join(tmp_path, _file_name(table, column)), np.array(values, dtype=dtype))
+        manifest = {
+            'format': CACHE_FORMAT_VERSION,
+            'params': params,
+            'rows': {table: len(dimensions[table]) for table in DIMENSION_TABLES},
+            'random_state': random_state,
+        }
+        with open(os.path.join(tmp_path, MANIFEST_FILE_NAME), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        if os.path.exists(final_path):
+            shutil.rmtree(final_path)
+        os.replace(tmp_path, final_path)
+
+    def load(self, key):
+        """
+        Parameters:
+            key (str): The cache key.
+        Returns:
+            CachedDimensions: The cached entry.
+        """
+        with open(os.path.join(self.path(key), MANIFEST_FILE_NAME), encoding='utf-8') as f:
+            return CachedDimensions(self.path(key), json.load(f))
+
+    def _outputs_path(self, key):
+        return os.path.join(self.path(key), 'outputs.json')
+
+    def _outputs(self, key):
+        try:
+            with open(self._outputs_path(key), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def record_output(self, key, file_path):
+        """
+        Remembers that file_path was written from this entry, so later hits can leave it alone.
+        Parameters:
+            key (str): The cache key.
+            file_path (str): The dimension file that was written.
+        """
+        outputs = self._outputs(key)
+        stat = os.stat(file_path)
+        outputs[os.path.abspath(file_path)] = [stat.st_size, stat.st_mtime_ns]
+        with open(self._outputs_path(key) + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(outputs, f)
+        os.replace(self._outputs_path(key) + '.tmp', self._outputs_path(key))
+
+    def output_is_current(self, key, file_path):
+        """
+        Parameters:
+            key (str): The cache key.
+            file_path (str): A dimension file in the output folder.
+        Returns:
+            bool: True if the file is still exactly as this entry wrote it (same size and modification time).
+        """
+        if not os.path.exists(file_path):
+            return False
+        stat = os.stat(file_path)
+        return self._outputs(key).get(os.path.abspath(file_path)) == [stat.st_size, stat.st_mtime_ns]
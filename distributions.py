@@ -0,0 +1,206 @@
+import random
+import zlib
+
+import numpy as np
+
+
+# Skewed foreign-key distributions for the fact generators.
+#
+# By default every foreign key is drawn uniformly from its dimension. A KeySampler instead draws keys with
+# Zipf, power-law or custom weights through a precomputed alias table (Vose's method): building the table is
+# O(n) once, after which every draw costs two random numbers and one comparison, however many keys there are,
+# and whole columns are drawn with a few vectorized NumPy operations.
+#
+# Zipf weights are assigned to keys in a seeded random order, so the hot accounts are not simply the lowest ids.
+
+DISTRIBUTIONS = ('uniform', 'zipf', 'power_law', 'weights')
+
+# a ready-made skew profile: a few accounts and customers carry most of the traffic, branch traffic is heavy
+# tailed and most transactions go through the mobile app and online banking (channel ids follow generate_dim_channel)
+DEFAULT_SKEW = {
+    'account_id': {'distribution': 'zipf', 's': 1.1},
+    'customer_id': {'distribution': 'zipf', 's': 1.1},
+    'location_id': {'distribution': 'power_law', 'alpha': 1.16},
+    'channel_id': {'distribution': 'weights', 'weights': {1: 0.30, 2: 0.40, 3: 0.10, 4: 0.15, 5: 0.05}},
+}
+
+
+class AliasTable:
+    """
+    Walker/Vose alias table for O(1) sampling of indices 0..n-1 with the given weights.
+    Parameters:
+        weights (array-like): Non-negative weights, at least one of them positive.
+    Example:
+        >>> table = AliasTable([0.7, 0.2, 0.1])
+        >>> indices = table.sample(1000, np.random.default_rng(0))
+    """
+
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype=np.float64)
+        if weights.ndim != 1 or len(weights) == 0:
+            raise ValueError('weights must be a non-empty 1-D sequence')
+        if not np.all(np.isfinite(weights)) or np.any(weights < 0) or weights.sum() <= 0:
+            raise ValueError('weights must be finite, non-negative and not all zero')
+        n = len(weights)
+        scaled = (weights * (n / weights.sum())).tolist()
+        prob = [1.0] * n
+        alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] = (scaled[l] + scaled[s]) - 1.0
+            (small if scaled[l] < 1.0 else large).append(l)
+        # whatever is left over is 1.0 up to rounding error
+        self.prob = np.array(prob)
+        self.alias = np.array(alias, dtype=np.int64)
+        self._prob_list = None
+        self._alias_list = None
+
+    def __len__(self):
+        return len(self.prob)
+
+    def sample(self, num_records, rng):
+        """
+        Draws indices in one vectorized pass.
+        Parameters:
+            num_records (int): The number of indices to draw.
+            rng (numpy.random.Generator): The random generator.
+        Returns:
+            numpy.ndarray: The drawn indices.
+        """
+        columns = rng.integers(0, len(self.prob), size=num_records)
+        return np.where(rng.random(num_records) < self.prob[columns], columns, self.alias[columns])
+
+    def draw(self, rng=random):
+        """
+        Draws a single index.
+        Parameters:
+            rng (random.Random, optional): The random source. Defaults to the `random` module.
+        Returns:
+            int: The drawn index.
+        """
+        if self._prob_list is None:
+            self._prob_list, self._alias_list = self.prob.tolist(), self.alias.tolist()
+        column = rng.randrange(len(self._prob_list))
+        return column if rng.random() < self._prob_list[column] else self._alias_list[column]
+
+    def __getstate__(self):
+        # the Python lists are only a cache for draw(); leave them out so shards receive small pickles
+        return {**self.__dict__, '_prob_list': None, '_alias_list': None}
+
+
+def zipf_weights(num_keys, s=1.0):
+    """
+    Returns:
+        numpy.ndarray: Weights 1/rank**s for ranks 1..num_keys.
+    """
+    return 1.0 / np.arange(1, num_keys + 1, dtype=np.float64) ** s
+
+
+def power_law_weights(num_keys, alpha=1.16, rng=None):
+    """
+    Returns:
+        numpy.ndarray: Independent Pareto(alpha) weights, one per key; alpha=1.16 gives the 80/20 rule.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    return rng.pareto(alpha, size=num_keys) + 1.0
+
+
+def _seed_rng(seed, column):
+    return np.random.default_rng(np.random.SeedSequence([seed, zlib.crc32(column.encode('utf-8'))]))
+
+
+class KeySampler:
+    """
+    Draws foreign keys of one column from a uniform, Zipf, power-law or custom weighted distribution.
+    Parameters:
+        keys (list or numpy.ndarray): The valid key values, e.g. columnar.key_column(accounts, 'account_id').
+        distribution (str, optional): One of DISTRIBUTIONS. Defaults to 'uniform'.
+        column (str, optional): The key column name; together with `seed` it fixes which keys are hot. Defaults to ''.
+        seed (int, optional): Seed for the key ranking and the power-law weights. Defaults to 0.
+        s (float, optional): The Zipf exponent. Defaults to 1.0.
+        alpha (float, optional): The power-law (Pareto) shape. Defaults to 1.16.
+        weights (list or dict, optional): For 'weights': one weight per key, or key -> weight (missing keys get 0).
+    Example:
+        >>> sampler = KeySampler(account_ids, 'zipf', column='account_id', s=1.1)
+        >>> sampler.sample(100000, rng)    # numpy array of account ids
+        >>> sampler.choice()               # one account id, drawn with the `random` module
+    """
+
+    def __init__(self, keys, distribution='uniform', column='', seed=0, s=1.0, alpha=1.16, weights=None):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f'distribution must be one of {DISTRIBUTIONS}, got {distribution!r}')
+        self.keys = np.asarray(keys, dtype=np.int64)
+        self.distribution = distribution
+        self._key_list = None
+        if len(self.keys) == 0:
+            raise ValueError(f'no keys to sample for {column or "column"}')
+        rng = _seed_rng(seed, column)
+        if distribution == 'uniform':
+            self.table = None
+            return
+        if distribution == 'zipf':
+            key_weights = rng.permutation(zipf_weights(len(self.keys), s))
+        elif distribution == 'power_law':
+            key_weights = power_law_weights(len(self.keys), alpha, rng)
+        elif isinstance(weights, dict):
+            weights = {int(key): weight for key, weight in weights.items()}  # JSON object keys are strings
+            key_weights = [weights.get(key, 0.0) for key in self.keys.tolist()]
+        else:
+            key_weights = weights
+            if key_weights is None or len(key_weights) != len(self.keys):
+                raise ValueError(f'{column or "column"} needs one weight per key')
+        self.table = AliasTable(key_weights)
+
+    def sample(self, num_records, rng):
+        """
+        Draws a column of keys.
+        Parameters:
+            num_records (int): The number of keys to draw.
+            rng (numpy.random.Generator): The random generator.
+        Returns:
+            numpy.ndarray: The drawn keys.
+        """
+        if self.table is None:
+            return self.keys[rng.integers(0, len(self.keys), size=num_records)]
+        return self.keys[self.table.sample(num_records, rng)]
+
+    def choice(self, rng=random):
+        """
+        Draws a single key, for the row-based generators.
+        Parameters:
+            rng (random.Random, optional): The random source. Defaults to the `random` module.
+        Returns:
+            int: The drawn key.
+        """
+        if self._key_list is None:
+            self._key_list = self.keys.tolist()
+        if self.table is None:
+            return rng.choice(self._key_list)
+        return self._key_list[self.table.draw(rng)]
+
+    def __getstate__(self):
+        return {**self.__dict__, '_key_list': None}
+
+
+def build_samplers(dim_keys, spec, seed=0):
+    """
+    Builds one KeySampler per foreign-key column of a distribution spec.
+    Parameters:
+        dim_keys (dict): Key column -> valid keys, e.g. {'account_id': [...], 'channel_id': [...]}.
+        spec (dict): Key column -> distribution name, or a dict of KeySampler arguments, e.g.
+            {'account_id': {'distribution': 'zipf', 's': 1.2}, 'channel_id': 'uniform'}. See DEFAULT_SKEW.
+        seed (int, optional): The run seed. Defaults to 0.
+    Returns:
+        dict: Key column -> KeySampler.
+    """
+    samplers = {}
+    for column, options in spec.items():
+        if column not in dim_keys:
+            raise ValueError(f'unknown foreign key column {column!r}; expected one of {sorted(dim_keys)}')
+        options = {'distribution': options} if isinstance(options, str) else dict(options)
+        samplers[column] = KeySampler(dim_keys[column], column=column, seed=seed, **options)
+    return samplers
@@ -0,0 +1,177 @@
+import hashlib
+
+import numpy as np
+
+
+# Unique key allocation for the fact tables and account numbers.
+#
+# An IdAllocator hands out the ids low + perm(position) for position = 0, 1, 2, ...
+# where perm is a keyed Feistel permutation over [0, high - low]. Because perm is a
+# bijection, distinct positions always give distinct ids: every key costs O(1) and
+# nothing is remembered except the current position, however many keys are drawn.
+# Disjoint position ranges give disjoint ids, which is what shard() relies on.
+
+FEISTEL_ROUNDS = 4
+DEFAULT_HIGH = 2**31 - 1  # fits a Redshift/Snowflake INTEGER column
+
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+
+
+def _round_keys(name, seed):
+    digest = hashlib.blake2b(f'{name}:{seed}'.encode('utf-8'), digest_size=8 * FEISTEL_ROUNDS).digest()
+    return [int.from_bytes(digest[i * 8:(i + 1) * 8], 'little') for i in range(FEISTEL_ROUNDS)]
+
+
+def _mix(x):
+    # splitmix64 finalizer on Python ints
+    x = (x ^ (x >> 30)) * 0xBF58476D1CE4E5B9 & _MASK64
+    x = (x ^ (x >> 27)) * 0x94D049BB133111EB & _MASK64
+    return x ^ (x >> 31)
+
+
+def _mix_array(x):
+    # splitmix64 finalizer on uint64 arrays; multiplication wraps modulo 2**64
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+class IdAllocator:
+    """
+    Allocates unique integer ids from the range [low, high] in O(1) time and constant memory per key.
+    Parameters:
+        name (str): The key the allocator is for, e.g. 'transaction_id'. Different names give different permutations.
+        low (int, optional): The smallest id. Defaults to 1.
+        high (int, optional): The largest id. Defaults to 2**31 - 1.
+        seed (int, optional): Seed for the permutation. The same name, range and seed always give the same ids. Defaults to 0.
+        permute (bool, optional): Scatter ids over the range with a keyed permutation. If False, ids are handed
+            out as a plain sequence low, low + 1, ... Defaults to True.
+        start (int, optional): The first position this allocator hands out. Defaults to 0.
+        stop (int, optional): One past the last position this allocator hands out. Defaults to the size of the range.
+    Example:
+        >>> alloc = IdAllocator('transaction_id', low=1, high=100, permute=False)
+        >>> next(alloc), next(alloc)
+        (1, 2)
+        >>> alloc.take(3).tolist()
+        [3, 4, 5]
+    """
+
+    def __init__(self, name, low=1, high=DEFAULT_HIGH, seed=0, permute=True, start=0, stop=None):
+        if high < low:
+            raise ValueError(f'empty id range [{low}, {high}] for {name}')
+        self.name = name
+        self.low = low
+        self.high = high
+        self.seed = seed
+        self.permute = permute
+        self.size = high - low + 1
+        self.start = start
+        self.stop = self.size if stop is None else stop
+        self.position = start
+        if not 0 <= self.start <= self.stop <= self.size:
+            raise ValueError(f'positions [{self.start}, {self.stop}) fall outside the id range of {name}')
+        # the Feistel network works on an even number of bits covering the range; ids that land
+        # outside the range are walked through the permutation again until they fall inside
+        half_bits = max(1, ((self.size - 1).bit_length() + 1) // 2)
+        self._half_bits = half_bits
+        self._half_mask = (1 << half_bits) - 1
+        self._keys = _round_keys(name, seed)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.position >= self.stop:
+            raise ValueError(f'id range of {self.name} is exhausted after {self.stop - self.start} ids')
+        position = self.position
+        self.position += 1
+        return self.low + self._permute(position)
+
+    def remaining(self):
+        """
+        Returns:
+            int: The number of ids this allocator can still hand out.
+        """
+        return self.stop - self.position
+
+    def take(self, num_ids):
+        """
+        Allocates the next `num_ids` ids in one vectorized call. They are the same ids, in the same order, as
+        `num_ids` calls of next(), so generators can take the ids of a whole batch up front.
+        Parameters:
+            num_ids (int): The number of ids to allocate.
+        Returns:
+            numpy.ndarray: The ids, as int64.
+        """
+        if num_ids > self.remaining():
+            raise ValueError(f'id range of {self.name} is exhausted: asked for {num_ids}, {self.remaining()} left')
+        positions = np.arange(self.position, self.position + num_ids, dtype=np.uint64)
+        self.position += num_ids
+        return (self._permute_array(positions) + np.uint64(self.low)).astype(np.int64)
+
+    def shard(self, shard_index, shard_count):
+        """
+        Splits this allocator's remaining positions into `shard_count` disjoint blocks and returns one of them.
+        Ids from different shards of the same allocator never collide.
+        Parameters:
+            shard_index (int): The block to return, from 0 to shard_count - 1.
+            shard_count (int): The number of blocks.
+        Returns:
+            IdAllocator: An allocator over the positions of block `shard_index`.
+        """
+        if not 0 <= shard_index < shard_count:
+            raise ValueError(f'shard_index must be in [0, {shard_count}), got {shard_index}')
+        block = self.remaining() // shard_count
+        start = self.position + shard_index * block
+        stop = start + block if shard_index < shard_count - 1 else self.stop
+        return IdAllocator(self.name, self.low, self.high, self.seed, self.permute, start, stop)
+
+    def _feistel(self, x):
+        left, right = x >> self._half_bits, x & self._half_mask
+        for key in self._keys:
+            left, right = right, left ^ (_mix(right ^ key) & self._half_mask)
+        return (left << self._half_bits) | right
+
+    def _permute(self, position):
+        if not self.permute:
+            return position
+        x = self._feistel(position)
+        while x >= self.size:
+            x = self._feistel(x)
+        return x
+
+    def _permute_array(self, positions):
+        if not self.permute:
+            return positions
+        half_bits, half_mask = np.uint64(self._half_bits), np.uint64(self._half_mask)
+
+        def feistel(x):
+            left, right = x >> half_bits, x & half_mask
+            for key in self._keys:
+                left, right = right, left ^ (_mix_array(right ^ np.uint64(key)) & half_mask)
+            return (left << half_bits) | right
+
+        x = feistel(positions)
+        outside = np.flatnonzero(x >= np.uint64(self.size))
+        while outside.size:
+            x[outside] = feistel(x[outside])
+            outside = outside[x[outside] >= np.uint64(self.size)]
+        return x
+
+
+_allocators = {}
+
+
+def allocator_for(name, low=1, high=DEFAULT_HIGH, seed=0, permute=True):
+    """
+    Returns the process-wide allocator for a key, creating it on first use.
+    The row-based and columnar generators share these, so their ids never collide within a run.
+    Parameters:
+        name (str): The key the allocator is for, e.g. 'transaction_id'.
+        low, high, seed, permute: Passed to IdAllocator when the allocator is created.
+    Returns:
+        IdAllocator: The shared allocator.
+    """
+    if name not in _allocators:
+        _allocators[name] = IdAllocator(name, low=low, high=high, seed=seed, permute=permute)
+    return _allocators[name]
@@ -0,0 +1,304 @@
+import argparse
+import json
+import os
+import shutil
+from datetime import date, timedelta
+
+import numpy as np
+
+import aggregates
+import balances
+import block_compression
+import columnar
+import csv_encoder
+import distributions
+import parallel
+import schemas
+import workload
+from id_allocator import IdAllocator, allocator_for
+from instrumentation import DEFAULT_METRICS_DIR, RunMetrics
+
+
+# Incremental daily appends on top of a main() snapshot.
+#
+# main() leaves a high-water mark in <folder>/_state/: the last date and date_id of dim_date, the allocator
+# position of every fact primary key, and the key columns of the dimensions. append_days() then adds one day at a
+# time: it appends the new day to dates.csv, generates that day's facts only, and writes each fact table as a
+# Hive-style partition, <folder>/<table>/date_id=<id>/part-00000.csv. Primary keys continue from the stored
+# allocator positions, so they never collide with the snapshot or earlier increments, and the work of an
+# increment depends on one day's volume, never on the history already written. Increments of a compressed
+# snapshot are compressed with the same codec (part-00000.csv.gz, dates.csv.gz). If the snapshot derived its daily
+# balances from the transactions (balances.py), the closing balance of every account is kept in _state/ as well
+# and each day's balances continue from it. Likewise, the KPI aggregates of a snapshot (aggregates.py) are kept in
+# _state/ and every day's facts are merged into them, after which the agg_*.csv tables are rewritten. The state
+# also lists every file and partition written so far, which is exactly what the next main() snapshot removes.
+#
+#   python main.py --seed 42
+#   python incremental.py --folder data --days 1
+
+STATE_DIR_NAME = '_state'
+STATE_FILE_NAME = 'state.json'
+BALANCES_FILE_PREFIX = 'account_balances-'
+AGGREGATES_FILE_PREFIX = 'kpi_aggregates-'
+
+
+def partition_folder(folder_name, table, date_id):
+    """
+    Returns:
+        str: The folder of one daily partition, e.g. data/fact_transactions/date_id=1828.
+    """
+    return os.path.join(folder_name, table, f'date_id={date_id}')
+
+
+def snapshot_state(seed, last_date, last_date_id, row_counts, shards=0, compression=None, balance_engine=None,
+                   id_allocs=None):
+    """
+    Builds the high-water mark of a snapshot written by main().
+    Parameters:
+        seed (int): The run seed.
+        last_date (datetime.date): The last day of dim_date.
+        last_date_id (int): Its date_id.
+        row_counts (dict): Fact table name -> number of rows the snapshot generated.
+        shards (int, optional): The shard count of a sharded snapshot, or 0. Defaults to 0.
+        compression (str, optional): The codec of the snapshot's CSV files, which increments keep using. Defaults to None.
+        balance_engine (balances.BalanceEngine, optional): The engine that derived the snapshot's daily balances;
+            increments then derive theirs from the engine's closing balances. Defaults to None.
+        id_allocs (dict, optional): Primary key -> the IdAllocator the snapshot used, e.g. from main.id_allocators().
+            Defaults to the shared allocators of id_allocator.allocator_for.
+    Returns:
+        dict: The state to pass to save_state().
+    """
+    ids = {}
+    for table, (_, primary_key, _) in parallel.FACT_TABLES.items():
+        if shards:
+            # every shard takes positions from its own block; the last block is the highest one in use
+            last_shard = IdAllocator(primary_key, seed=seed).shard(shards - 1, shards)
+            ids[primary_key] = {'seed': seed,
+                                'position': last_shard.start + parallel.shard_sizes(row_counts[table], shards)[-1]}
+        else:
+            id_alloc = (id_allocs or {}).get(primary_key) or allocator_for(primary_key)
+            ids[primary_key] = {'seed': id_alloc.seed, 'position': id_alloc.position}
+    if balance_engine:
+        ids['balance_id'] = {'seed': balance_engine.id_alloc.seed, 'position': balance_engine.id_alloc.position}
+    return {
+        'seed': seed,
+        'last_date': last_date.isoformat(),
+        'last_date_id': int(last_date_id),
+        'ids': ids,
+        'compression': compression,
+        'balances': {'signs': balance_engine.signs, 'currency_id': balance_engine.currency_id} if balance_engine else None,
+        'days_appended': 0,
+    }
+
+
+def save_state(folder_name, state, dim_keys=None, account_balances=None, aggregator=None):
+    """
+    Writes the high-water mark into <folder>/_state/.
+    Parameters:
+        folder_name (str): The data folder.
+        state (dict): The state, from snapshot_state() or load_state().
+        dim_keys (dict, optional): Key column -> key values of the dimensions; only needed with a new snapshot.
+        account_balances (numpy.ndarray, optional): The closing balance of every account on the last day, for
+            snapshots with derived balances. Defaults to None.
+        aggregator (aggregates.KpiAggregator, optional): The KPI aggregates up to the last day. Defaults to None.
+    """
+    state_dir = os.path.join(folder_name, STATE_DIR_NAME)
+    os.makedirs(state_dir, exist_ok=True)
+    for column, values in (dim_keys or {}).items():
+        np.save(os.path.join(state_dir, f'{column}.npy'), np.asarray(values, dtype=np.int64))
+    if account_balances is not None:
+        # one file per day, so the state never points at balances from a day it does not know about yet
+        state['balances']['file'] = f'{BALANCES_FILE_PREFIX}{state["last_date_id"]}.npy'
+        np.save(os.path.join(state_dir, state['balances']['file']), np.asarray(account_balances, dtype=np.float64))
+    if aggregator is not None:
+        state['aggregates'] = {'file': f'{AGGREGATES_FILE_PREFIX}{state["last_date_id"]}.npz'}
+        aggregator.save(os.path.join(state_dir, state['aggregates']['file']))
+    state_path = os.path.join(state_dir, STATE_FILE_NAME)
+    with open(state_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(state_path + '.tmp', state_path)
+    current = {(state.get('balances') or {}).get('file'), (state.get('aggregates') or {}).get('file')}
+    for name in os.listdir(state_dir):
+        if name.startswith((BALANCES_FILE_PREFIX, AGGREGATES_FILE_PREFIX)) and name not in current:
+            os.remove(os.path.join(state_dir, name))
+
+
+def recorded_outputs(folder_name):
+    """
+    Lists what main() and append_days() wrote into a data folder, as recorded in its state.
+    Parameters:
+        folder_name (str): The data folder.
+    Returns:
+        list: Paths relative to the folder (table files, part folders and date_id= partitions), or None if the
+            folder holds no state.
+    """
+    state_path = os.path.join(folder_name, STATE_DIR_NAME, STATE_FILE_NAME)
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path, encoding='utf-8') as f:
+        return json.load(f).get('outputs', [])
+
+
+def _record_output(state, folder_name, path):
+    relative = os.path.relpath(path, folder_name)
+    outputs = state.setdefault('outputs', [])
+    if relative not in outputs:
+        outputs.append(relative)
+
+
+def load_state(folder_name):
+    """
+    Reads the high-water mark of a data folder.
+    Parameters:
+        folder_name (str): The data folder.
+    Returns:
+        tuple: The state dict, and key column -> memory-mapped key values.
+    """
+    state_dir = os.path.join(folder_name, STATE_DIR_NAME)
+    state_path = os.path.join(state_dir, STATE_FILE_NAME)
+    if not os.path.exists(state_path):
+        raise FileNotFoundError(f'{state_path} not found; write a snapshot with main() first')
+    with open(state_path, encoding='utf-8') as f:
+        state = json.load(f)
+    dim_keys = {name[:-len('.npy')]: np.load(os.path.join(state_dir, name), mmap_mode='r')
+                for name in os.listdir(state_dir) if name.endswith('.npy') and not name.startswith(BALANCES_FILE_PREFIX)}
+    return state, dim_keys
+
+
+def _balance_engine(folder_name, state, dim_keys, date_id):
+    # continues the derived balances of the snapshot from the closing balances of the last day
+    opening = np.load(os.path.join(folder_name, STATE_DIR_NAME, state['balances']['file']))
+    return balances.BalanceEngine(dim_keys['account_id'], opening, [date_id], state['balances']['signs'],
+                                  state['balances']['currency_id'])
+
+
+def date_record(date_id, day):
+    """
+    Returns:
+        dict: The dim_date record of one day, with the columns of main.generate_dim_date.
+    """
+    return {
+        'date_id': date_id,
+        'date': day.strftime('%Y-%m-%d'),
+        'day': day.day,
+        'month': day.month,
+        'year': day.year,
+        'week_day': day.weekday() + 1
+    }
+
+
+def _append_date_row(file_path, record, compression=None):
+    fieldnames = schemas.fieldnames('dates')
+    line = csv_encoder.encode_rows([record], fieldnames)
+    if os.path.exists(file_path):
+        # a run interrupted after this step has already added the day; don't add it twice
+        if compression:
+            with block_compression.open_csv_reader(file_path) as f:
+                lines = f.read().splitlines()
+        else:
+            with open(file_path, 'rb') as f:
+                f.seek(max(0, os.path.getsize(file_path) - 4096))
+                lines = f.read().splitlines()
+        if lines and lines[-1].split(b'|')[0] == str(record['date_id']).encode('utf-8'):
+            return
+    else:
+        line = csv_encoder.encode_rows([], fieldnames, header=True) + line
+    if compression:
+        # gzip members and zstd frames concatenate, so the new day is one more block at the end of the file
+        with open(file_path, 'ab') as f:
+            f.write(block_compression.compress_block(line.encode('utf-8'), compression))
+    else:
+        with open(file_path, 'a', newline='', encoding='utf-8') as f:
+            f.write(line)
+
+
+def append_days(folder_name='data', days=1, daily_rows=None, key_distributions=None, chunk_size=50000,
+                metrics_dir=DEFAULT_METRICS_DIR):
+    """
+    Extends dim_date by `days` days and writes only the new days' facts as date_id= partitions.
+    Parameters:
+        folder_name (str, optional): The data folder holding a main() snapshot. Defaults to 'data'.
+        days (int, optional): The number of days to append. Defaults to 1.
+        daily_rows (dict, optional): Fact table name -> rows per day. Defaults to workload.daily_row_counts() for
+            the snapshot's accounts and customers.
+        key_distributions (dict, optional): Foreign key column -> distribution, as for main(). Defaults to None.
+        chunk_size (int, optional): The number of records per batch. Defaults to 50000.
+        metrics_dir (str, optional): Where per-stage metrics are written; None disables them. Defaults to 'metrics'.
+    Returns:
+        dict: Fact table name -> number of rows appended.
+    """
+    state, dim_keys = load_state(folder_name)
+    daily_rows = daily_rows or workload.daily_row_counts(len(dim_keys['account_id']), len(dim_keys['customer_id']))
+    # every row of a partition has the partition's date_id, so a date_id distribution has nothing to do
+    spec = {column: options for column, options in (key_distributions or {}).items() if column != 'date_id'}
+    samplers = distributions.build_samplers(dim_keys, spec, state['seed']) if spec else None
+    written = {table: 0 for table in parallel.FACT_TABLES}
+
+    metrics = RunMetrics(metrics_dir)
+    try:
+        for _ in range(days):
+            day = date.fromisoformat(state['last_date']) + timedelta(days=1)
+            date_id = state['last_date_id'] + 1
+            keys = {**dim_keys, 'date_id': np.array([date_id], dtype=np.int64)}
+            engine = _balance_engine(folder_name, state, dim_keys, date_id) if state.get('balances') else None
+            aggregator = None
+            if state.get('aggregates'):
+                aggregator = aggregates.KpiAggregator.load(os.path.join(folder_name, STATE_DIR_NAME, state['aggregates']['file']))
+            day_rows = {}
+            for table, (generate, primary_key, key_names) in parallel.FACT_TABLES.items():
+                with metrics.stage(table, kind='fact') as stage:
+                    ids = state['ids'][primary_key]
+                    id_alloc = IdAllocator(primary_key, seed=ids['seed'], start=ids['position'])
+                    table_samplers = {key: samplers[key] for key in key_names if key in samplers} if samplers else None
+                    if engine and table == 'fact_daily_balances':
+                        # the day's balances follow from the day's transactions, generated just before
+                        engine.id_alloc = id_alloc
+                        batches = engine.iter_batches(chunk_size)
+                    else:
+                        batches = columnar.iter_column_chunks(generate, daily_rows[table], *[keys[key] for key in key_names],
+                                                              rng=parallel.shard_rng(state['seed'], table, date_id),
+                                                              chunk_size=chunk_size, id_alloc=id_alloc, samplers=table_samplers)
+                        if engine and table == 'fact_transactions':
+                            batches = engine.tee(batches)
+                    if aggregator:
+                        batches = aggregator.tee(table, batches)
+                    partition = partition_folder(folder_name, table, date_id)
+                    shutil.rmtree(partition, ignore_errors=True)  # leftovers of an interrupted run
+                    part_name = parallel.part_file_name(0, state.get('compression'))
+                    columnar.write_columns_to_csv(stage.count(batches), part_name, folder_name=partition,
+                                                  compression=state.get('compression'))
+                    _record_output(state, folder_name, partition)
+                    part_path = os.path.join(partition, part_name)
+                    stage.bytes_written = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+                    ids['position'] = id_alloc.position
+                    written[table] += stage.rows
+                    day_rows[table] = stage.rows
+            with metrics.stage('append_dim_date', kind='dimension') as stage:
+                dates_name = block_compression.compressed_name('dates.csv', state.get('compression'))
+                _append_date_row(os.path.join(folder_name, dates_name), date_record(date_id, day), state.get('compression'))
+                _record_output(state, folder_name, os.path.join(folder_name, dates_name))
+                stage.rows = 1
+            for table, columns in (aggregator.tables() if aggregator else ()):
+                with metrics.stage(f'write_{table}', kind='write') as stage:
+                    file_name = block_compression.compressed_name(f'{table}.csv', state.get('compression'))
+                    columnar.write_columns_to_csv(stage.count(columns), file_name, folder_name=folder_name,
+                                                  compression=state.get('compression'))
+                    _record_output(state, folder_name, os.path.join(folder_name, file_name))
+            # the new high-water mark is saved only once the whole day is on disk
+            state.update(last_date=day.isoformat(), last_date_id=date_id, days_appended=state['days_appended'] + 1)
+            save_state(folder_name, state, account_balances=engine.closing_balances() if engine else None, aggregator=aggregator)
+            print(f'Appended {day} (date_id={date_id}): ' + ', '.join(f'{day_rows[table]} {table}' for table in parallel.FACT_TABLES))
+    except BaseException:
+        metrics.finish(status='error')
+        raise
+    metrics.finish()
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Append daily fact partitions to a generated snapshot.')
+    parser.add_argument('--folder', default='data', help='data folder holding a main() snapshot')
+    parser.add_argument('--days', type=int, default=1, help='number of days to append')
+    parser.add_argument('--skew', action='store_true', help='draw foreign keys with distributions.DEFAULT_SKEW')
+    args = parser.parse_args()
+    append_days(args.folder, args.days, key_distributions=distributions.DEFAULT_SKEW if args.skew else None)
@@ -0,0 +1,196 @@
+import cProfile
+import json
+import os
+import random
+import resource
+import sys
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+
+# Per-stage run metrics for main().
+#
+# Every stage (a dimension build, a table write, a fact table) records its duration, row count, rows/sec,
+# bytes written and RSS change, and is appended as one JSON line to metrics/<run_id>.jsonl as soon as it
+# finishes; a final 'run' line summarises the whole run. Scheduler jobs can tail or ingest these files.
+#
+# Profiling is off by default. With profiler='cprofile' each stage is profiled and its stats are dumped
+# next to the metrics file (open them with pstats or snakeviz); with profiler='tracemalloc' each stage
+# records its peak traced allocation and top allocation sites. profile_sample_rate profiles only that
+# fraction of runs, so a nightly job can keep profiling on at low cost.
+
+DEFAULT_METRICS_DIR = 'metrics'
+PROFILERS = ('cprofile', 'tracemalloc')
+
+
+def current_rss_bytes():
+    """
+    Returns:
+        int: The resident set size of this process, or its peak RSS where the current value is not available.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Stage:
+    """
+    The measurements of one stage, filled in by the code running inside RunMetrics.stage().
+    Attributes:
+        rows (int): The number of rows the stage produced; set directly or through count().
+        bytes_written (int): The number of bytes the stage wrote.
+    """
+
+    def __init__(self, name, kind):
+        self.name = name
+        self.kind = kind
+        self.rows = 0
+        self.bytes_written = 0
+        self.extra = {}
+
+    def count(self, data):
+        """
+        Counts the rows of data passing through the stage.
+        Parameters:
+            data (list, dict or iterable): Records, a dict of column arrays, or an iterable of batches of either.
+                Iterables are wrapped, so rows are counted as batches are consumed.
+        Returns:
+            The same data, or an iterator over the same batches.
+        """
+        if isinstance(data, (list, dict)):
+            self.rows += _num_rows(data)
+            return data
+        return self._count_batches(data)
+
+    def _count_batches(self, batches):
+        for batch in batches:
+            self.rows += _num_rows(batch)
+            yield batch
+
+
+def _num_rows(batch):
+    if isinstance(batch, dict):
+        return len(next(iter(batch.values()), ()))
+    return len(batch)
+
+
+class RunMetrics:
+    """
+    Collects per-stage metrics for one run and appends them to a JSON lines file.
+    Parameters:
+        metrics_dir (str, optional): Folder for metrics files; None disables writing. Defaults to 'metrics'.
+        profiler (str, optional): None, 'cprofile' or 'tracemalloc'. Defaults to None.
+        profile_sample_rate (float, optional): Fraction of runs that are profiled when a profiler is set. Defaults to 1.0.
+        run_id (str, optional): Identifier of the run. Defaults to a timestamp plus a random suffix.
+    Example:
+        >>> metrics = RunMetrics()
+        >>> with metrics.stage('generate_dim_customer', kind='dimension') as stage:
+        ...     customers = stage.count(generate_dim_customer(100))
+        >>> metrics.finish()
+    """
+
+    def __init__(self, metrics_dir=DEFAULT_METRICS_DIR, profiler=None, profile_sample_rate=1.0, run_id=None):
+        if profiler not in (None,) + PROFILERS:
+            raise ValueError(f'profiler must be one of {PROFILERS}, got {profiler!r}')
+        self.run_id = run_id or f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}-{uuid.uuid4().hex[:8]}"
+        self.metrics_dir = metrics_dir
+        # a private Random, so sampling never disturbs the seeded global random stream of the generators
+        self.profiler = profiler if profiler and random.Random().random() < profile_sample_rate else None
+        self.path = os.path.join(metrics_dir, f'{self.run_id}.jsonl') if metrics_dir else None
+        self.stages = []
+        self._start = time.perf_counter()
+        self._start_rss = current_rss_bytes()
+        if self.path:
+            os.makedirs(metrics_dir, exist_ok=True)
+
+    def _emit(self, record):
+        if self.path:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + '\n')
+
+    @contextmanager
+    def stage(self, name, kind='stage'):
+        """
+        Measures the code run inside the with block as one stage.
+        Parameters:
+            name (str): The stage name, e.g. 'write_customers'.
+            kind (str, optional): The stage category, e.g. 'dimension', 'write' or 'fact'. Defaults to 'stage'.
+        Yields:
+            Stage: Set its rows/bytes_written, or pass data through Stage.count().
+        """
+        stage = Stage(name, kind)
+        profile = cProfile.Profile() if self.profiler == 'cprofile' else None
+        if self.profiler == 'tracemalloc':
+            tracemalloc.start()
+        started_at = datetime.now(timezone.utc).isoformat()
+        rss_before = current_rss_bytes()
+        start = time.perf_counter()
+        status = 'ok'
+        if profile:
+            profile.enable()
+        try:
+            yield stage
+        except BaseException:
+            status = 'error'
+            raise
+        finally:
+            if profile:
+                profile.disable()
+            seconds = time.perf_counter() - start
+            record = {
+                'run_id': self.run_id,
+                'stage': name,
+                'kind': kind,
+                'status': status,
+                'started_at': started_at,
+                'seconds': round(seconds, 6),
+                'rows': stage.rows,
+                'rows_per_sec': round(stage.rows / seconds, 1) if seconds else 0.0,
+                'bytes_written': stage.bytes_written,
+                'rss_bytes': current_rss_bytes(),
+                'rss_delta_bytes': current_rss_bytes() - rss_before,
+                **stage.extra,
+            }
+            if profile and self.path:
+                record['profile_path'] = os.path.join(self.metrics_dir, f'{self.run_id}-{name}.prof')
+                profile.dump_stats(record['profile_path'])
+            if self.profiler == 'tracemalloc':
+                snapshot = tracemalloc.take_snapshot()
+                record['tracemalloc_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+                record['tracemalloc_top'] = [f'{stat.traceback[0].filename}:{stat.traceback[0].lineno} {stat.size}B'
+                                             for stat in snapshot.statistics('lineno')[:5]]
+                tracemalloc.stop()
+            self.stages.append(record)
+            self._emit(record)
+
+    def finish(self, status='ok'):
+        """
+        Appends the run summary line.
+        Parameters:
+            status (str, optional): 'ok' or 'error'. Defaults to 'ok'.
+        Returns:
+            dict: The summary record.
+        """
+        seconds = time.perf_counter() - self._start
+        rows = sum(record['rows'] for record in self.stages if record['kind'] != 'write')
+        summary = {
+            'run_id': self.run_id,
+            'stage': 'run',
+            'kind': 'run',
+            'status': status,
+            'seconds': round(seconds, 6),
+            'rows': rows,
+            'rows_per_sec': round(rows / seconds, 1) if seconds else 0.0,
+            'bytes_written': sum(record['bytes_written'] for record in self.stages),
+            'rss_bytes': current_rss_bytes(),
+            'rss_delta_bytes': current_rss_bytes() - self._start_rss,
+            'profiler': self.profiler,
+        }
+        self._emit(summary)
+        return summary
@@ -1,10 +1,30 @@
 
 from faker import Faker
-from datetime import datetime, timedelta
-import csv
+from datetime import date, datetime, timedelta
+import argparse
+import contextlib
+import itertools
+import json
 import os
 import random 
+import shutil
 
+import aggregates
+import balances
+import block_compression
+import columnar
+import csv_encoder
+import dimension_cache
+import distributions
+import incremental
+import parallel
+import parquet_writer
+import pipeline
+from id_allocator import IdAllocator, allocator_for
+import schemas
+from instrumentation import DEFAULT_METRICS_DIR, PROFILERS, RunMetrics
+from value_pools import ValuePools, unique_emails
+import workload
 
 fake = Faker()
 def id_generator(start=1):
@@ -40,12 +60,65 @@ currency_id_gen = id_generator()
 investment_type_id_gen = id_generator()
 loan_id_gen = id_generator()
 
+# set once the id generators above have been used, after which generated dimensions no longer match the cache
+_fresh_id_generators = True
 
-def generate_dim_customer(num_records):
+
+@contextlib.contextmanager
+def isolated_generator_state():
+    """
+    Runs a block, such as a calibration run of main(), without moving the id generators, random or Faker
+    state of the process, so a run that follows generates what it would have generated without it.
+    """
+    global _fresh_id_generators
+    names = [name for name, value in globals().items() if name.endswith('_id_gen')]
+    saved = {name: globals()[name] for name in names}, _fresh_id_generators, random.getstate(), fake.random.getstate()
+    globals().update({name: id_generator() for name in names})
+    try:
+        yield
+    finally:
+        generators, _fresh_id_generators, random_state, fake_state = saved
+        globals().update(generators)
+        random.setstate(random_state)
+        fake.random.setstate(fake_state)
+
+# number of records per batch when fact tables are streamed to disk
+DEFAULT_CHUNK_SIZE = 50000
+
+# unique key allocators, one id space per key: key -> IdAllocator options
+ID_KEYS = {
+    'transaction_id': {},
+    'investment_id': {},
+    'loan_fact_id': {},
+    'interaction_id': {},
+    'balance_id': {},
+    'account_number': {'low': 1000000000, 'high': 9999999999},
+}
+
+
+def id_allocators(seed=0):
+    """
+    Builds the unique key allocators of one run.
+    Parameters:
+        seed (int, optional): The run seed; it keys every permutation, as in the sharded and incremental paths. Defaults to 0.
+    Returns:
+        dict: Key name (see ID_KEYS) -> a fresh IdAllocator.
+    """
+    return {name: IdAllocator(name, seed=seed, **options) for name, options in ID_KEYS.items()}
+
+
+def _allocator(id_alloc, name):
+    # generators called on their own, outside main(), share the process-wide allocator of the key
+    return id_alloc if id_alloc is not None else allocator_for(name, **ID_KEYS[name])
+
+
+def generate_dim_customer(num_records, pools=None):
     """
     Generates a list of customer records with randomly generated data.
     Parameters:
         num_records (int): The number of customer records to generate.
+        pools (ValuePools, optional): Sample values from these pre-built pools instead of calling Faker per row.
+            Emails are then first.last<customer_id>@domain, so they stay unique. Defaults to None.
     Returns:
         list: A list of dictionaries representing customer records. Each dictionary contains the following keys:
             - customer_id (int): The unique identifier for the customer.
@@ -58,6 +131,16 @@ def generate_dim_customer(num_records):
             - postal_code (str): The postal code of the customer.
             - phone_number (str): The phone number of the customer.
     """
+    if pools is not None:
+        customer_ids = [next(customer_id_gen) for _ in range(num_records)]
+        first_names = pools.sample('first_name', num_records)
+        last_names = pools.sample('last_name', num_records)
+        emails = unique_emails(first_names, last_names, customer_ids, pools.sample('email_domain', num_records))
+        columns = zip(customer_ids, first_names, last_names, emails, pools.sample('address', num_records),
+                      pools.sample('city', num_records), pools.sample('state', num_records),
+                      pools.sample('postcode', num_records), pools.sample('phone_number', num_records))
+        return [dict(zip(schemas.fieldnames('customers'), values)) for values in columns]
+
     customers = []
 
     for _ in range(num_records):
@@ -134,13 +217,14 @@ def generate_dim_channel():
 
     return channels
 
-def generate_dim_account(num_records=100, customer_ids=None):
+def generate_dim_account(num_records=100, customer_ids=None, id_alloc=None):
+    account_number_alloc = _allocator(id_alloc, 'account_number')
     accounts = []
     for _ in range(num_records):
         account = {
             'account_id': next(account_id_gen),
             'customer_id': random.choice(customer_ids),
-            'account_number': fake.unique.random_int(min=1000000000, max=9999999999),
+            'account_number': next(account_number_alloc),
             'account_type': random.choice(['Savings', 'Checking', 'Investment']),
             'account_balance': round(random.uniform(0, 1000000), 2),
             'credit_score': random.randint(300, 850),
@@ -199,14 +283,23 @@ def generate_dim_transaction_type():
 
     return transaction_types
 
-def generate_dim_location(num_records=50):
+def generate_dim_location(num_records=50, pools=None):
     """
     Generates a list of location records with unique identifiers and location names.
+    Parameters:
+        num_records (int, optional): The number of location records to generate. Defaults to 50.
+        pools (ValuePools, optional): Sample values from these pre-built pools instead of calling Faker per row. Defaults to None.
     Returns:
         list: A list of dictionaries representing location records. Each dictionary contains the following keys:
             - location_id (int): The unique identifier for the location.
             - location_name (str): The name of the location.
     """
+    if pools is not None:
+        columns = zip([next(location_id_gen) for _ in range(num_records)], pools.sample('city', num_records),
+                      pools.sample('state', num_records), pools.sample('country', num_records),
+                      pools.sample('postcode', num_records))
+        return [dict(zip(schemas.fieldnames('locations'), values)) for values in columns]
+
     locations = []
     for _ in range(num_records):
         location = {
@@ -247,18 +340,23 @@ def generate_dim_currency():
         }
     ]
 
-def generate_dim_investment_type(num_records=5):
+def generate_dim_investment_type(num_records=5, pools=None):
     """
     Generates a list of investment type records with unique identifiers and investment type names.
     
     Parameters:
         num_records (int, optional): The number of investment type records to generate. Defaults to 5.
+        pools (ValuePools, optional): Sample words from these pre-built pools instead of calling Faker per row. Defaults to None.
     
     Returns:
         list: A list of dictionaries representing investment type records. Each dictionary contains the following keys:
             - investment_type_id (int): The unique identifier for the investment type.
             - investment_type_name (str): The name of the investment type.
     """
+    if pools is not None:
+        return [{'investment_type_id': next(investment_type_id_gen), 'investment_type_name': word.capitalize() + 'Investment'}
+                for word in pools.sample('word', num_records)]
+
     investment_types = []
 
     for _ in range(num_records):
@@ -295,7 +393,20 @@ def generate_dim_loan(num_records=50):
 
     return loans
 
-def generate_fact_transaction(num_records, accounts, ls_dates, transactions_types, channels, locations, currencies):
+def _pick_key(records, key, samplers=None):
+    # a KeySampler from distributions.py replaces the uniform draw for the columns it covers
+    if samplers and key in samplers:
+        return samplers[key].choice()
+    record = random.choice(records)
+    # dimension records, or just their key values (e.g. loaded from the dimension cache)
+    return record[key] if isinstance(record, dict) else record
+
+def _to_records(rows, table):
+    # tuple rows in schema order -> record dictionaries, for callers that want named columns
+    fieldnames = schemas.fieldnames(table)
+    return [dict(zip(fieldnames, row)) for row in rows]
+
+def generate_fact_transaction(num_records, accounts, ls_dates, transactions_types, channels, locations, currencies, samplers=None, as_tuples=False, id_alloc=None):
     """
     Generates a list of fact transaction records with randomized values.
     Parameters:
@@ -306,6 +417,9 @@ def generate_fact_transaction(num_records, accounts, ls_dates, transactions_type
         channels (list): A list of dictionaries representing channel records.
         locations (list): A list of dictionaries representing location records.
         currencies (list): A list of dictionaries representing currency records.
+        samplers (dict, optional): Key column -> distributions.KeySampler for skewed foreign keys. Defaults to uniform keys.
+        as_tuples (bool, optional): Return tuples in schemas.fieldnames order instead of dictionaries. Defaults to False.
+        id_alloc (IdAllocator, optional): Allocator for the primary key, e.g. from id_allocators(). Defaults to the shared one for the table.
     Returns:
         list: A list of dictionaries representing fact transaction records. Each dictionary contains the following keys:
             - transaction_id (int): The unique identifier for the transaction.
@@ -319,22 +433,21 @@ def generate_fact_transaction(num_records, accounts, ls_dates, transactions_type
             - transaction_status (str): The status of the transaction. Possible values are 'Pending', 'Completed', or 'Failed'.
     """
     transactions = []
-    for _ in range(num_records):
-        transaction = {
-            'transaction_id': fake.unique.random_int(min=1, max=100000),
-            'date_id': random.choice(ls_dates)['date_id'],
-            'transaction_type_id': random.choice(transactions_types)['transaction_type_id'],
-            'account_id': random.choice(accounts)['account_id'],
-            'channel_id': random.choice(channels)['channel_id'],
-            'location_id': random.choice(locations)['location_id'],
-            'currency_id': random.choice(currencies)['currency_id'],
-            'transaction_amount': round(random.uniform(a=1.00, b=10000), 2),
-            'transaction_status': random.choice(['Pending', 'Completed', 'Failed']),
-        }
-        transactions.append(transaction)
-    return transactions
+    for transaction_id in _allocator(id_alloc, 'transaction_id').take(num_records).tolist():
+        transactions.append((
+            transaction_id,
+            _pick_key(ls_dates, 'date_id', samplers),
+            _pick_key(transactions_types, 'transaction_type_id', samplers),
+            _pick_key(accounts, 'account_id', samplers),
+            _pick_key(channels, 'channel_id', samplers),
+            _pick_key(locations, 'location_id', samplers),
+            _pick_key(currencies, 'currency_id', samplers),
+            round(random.uniform(a=1.00, b=10000), 2),
+            random.choice(['Pending', 'Completed', 'Failed']),
+        ))
+    return transactions if as_tuples else _to_records(transactions, 'fact_transactions')
 
-def generate_fact_investement(num_records, accounts, ls_dates, investment_types, locations, currencies):
+def generate_fact_investement(num_records, accounts, ls_dates, investment_types, locations, currencies, samplers=None, as_tuples=False, id_alloc=None):
     """
     Generates a list of investment records with randomized values.
     
@@ -345,6 +458,9 @@ def generate_fact_investement(num_records, accounts, ls_dates, investment_types,
         investment_types (list): A list of dictionaries representing investment type records.
         locations (list): A list of dictionaries representing location records.
         currencies (list): A list of dictionaries representing currency records.
+        samplers (dict, optional): Key column -> distributions.KeySampler for skewed foreign keys. Defaults to uniform keys.
+        as_tuples (bool, optional): Return tuples in schemas.fieldnames order instead of dictionaries. Defaults to False.
+        id_alloc (IdAllocator, optional): Allocator for the primary key, e.g. from id_allocators(). Defaults to the shared one for the table.
     
     Returns:
         list: A list of dictionaries representing investment records. Each dictionary contains the following keys:
@@ -358,21 +474,20 @@ def generate_fact_investement(num_records, accounts, ls_dates, investment_types,
             - investment_return (float): The return of the investment.
     """
     investments = []
-    for _ in range(num_records):
-        investment = {
-            'investment_id': fake.unique.random_int(min=1, max=100000),
-            'date_id': random.choice(ls_dates)['date_id'],
-            'investment_type_id': random.choice(investment_types)['investment_type_id'],
-            'account_id': random.choice(accounts)['account_id'],
-            'location_id': random.choice(locations)['location_id'],
-            'currency_id': random.choice(currencies)['currency_id'],
-            'investment_amount': round(random.uniform(a=1000.00, b=10000), 2),
-            'investment_return': round(random.uniform(a=-5000, b=15000), 2)
-        }
-        investments.append(investment)
-    return investments
+    for investment_id in _allocator(id_alloc, 'investment_id').take(num_records).tolist():
+        investments.append((
+            investment_id,
+            _pick_key(ls_dates, 'date_id', samplers),
+            _pick_key(investment_types, 'investment_type_id', samplers),
+            _pick_key(accounts, 'account_id', samplers),
+            _pick_key(locations, 'location_id', samplers),
+            _pick_key(currencies, 'currency_id', samplers),
+            round(random.uniform(a=1000.00, b=10000), 2),
+            round(random.uniform(a=-5000, b=15000), 2),
+        ))
+    return investments if as_tuples else _to_records(investments, 'fact_investments')
 
-def generate_fact_loan(num_records, accounts, ls_dates, loans, locations, currencies):
+def generate_fact_loan(num_records, accounts, ls_dates, loans, locations, currencies, samplers=None, as_tuples=False, id_alloc=None):
     """
     Generates a list of loan records with randomized values.
     Parameters:
@@ -382,6 +497,9 @@ def generate_fact_loan(num_records, accounts, ls_dates, loans, locations, curren
         loans (list): A list of dictionaries representing loan records.
         locations (list): A list of dictionaries representing location records.
         currencies (list): A list of dictionaries representing currency records.
+        samplers (dict, optional): Key column -> distributions.KeySampler for skewed foreign keys. Defaults to uniform keys.
+        as_tuples (bool, optional): Return tuples in schemas.fieldnames order instead of dictionaries. Defaults to False.
+        id_alloc (IdAllocator, optional): Allocator for the primary key, e.g. from id_allocators(). Defaults to the shared one for the table.
     Returns:
         list: A list of dictionaries representing loan records. Each dictionary contains the following keys:
             - loan_fact_id (int): The unique identifier for the loan.
@@ -394,21 +512,20 @@ def generate_fact_loan(num_records, accounts, ls_dates, loans, locations, curren
             - loan_status (str): The status of the loan. Possible values are 'Pending', 'Approved', or 'Rejected'.
     """
     fact_loans = []
-    for _ in range(num_records):
-        loan = {
-            'loan_fact_id': fake.unique.random_int(min=1, max=100000),
-            'date_id': random.choice(ls_dates)['date_id'],
-            'loan_id': random.choice(loans)['loan_id'],
-            'account_id': random.choice(accounts)['account_id'],
-            'location_id': random.choice(locations)['location_id'],
-            'currency_id': random.choice(currencies)['currency_id'],
-            'loan_amount': round(random.uniform(a=5000, b=500000), 2),
-            'loan_status': random.choice(['Pending','Approved', 'Rejected'])
-        }
-        fact_loans.append(loan)
-    return fact_loans
+    for loan_fact_id in _allocator(id_alloc, 'loan_fact_id').take(num_records).tolist():
+        fact_loans.append((
+            loan_fact_id,
+            _pick_key(ls_dates, 'date_id', samplers),
+            _pick_key(loans, 'loan_id', samplers),
+            _pick_key(accounts, 'account_id', samplers),
+            _pick_key(locations, 'location_id', samplers),
+            _pick_key(currencies, 'currency_id', samplers),
+            round(random.uniform(a=5000, b=500000), 2),
+            random.choice(['Pending','Approved', 'Rejected']),
+        ))
+    return fact_loans if as_tuples else _to_records(fact_loans, 'fact_loans')
 
-def generate_fact_customer_interactions(num_records, customers, ls_dates, channels, locations):
+def generate_fact_customer_interactions(num_records, customers, ls_dates, channels, locations, samplers=None, as_tuples=False, id_alloc=None):
     """
     Generates a list of fact customer interaction records with randomized values.
     Parameters:
@@ -417,6 +534,9 @@ def generate_fact_customer_interactions(num_records, customers, ls_dates, channe
         ls_dates (list): A list of dictionaries representing date records.
         channels (list): A list of dictionaries representing channel records.
         locations (list): A list of dictionaries representing location records.
+        samplers (dict, optional): Key column -> distributions.KeySampler for skewed foreign keys. Defaults to uniform keys.
+        as_tuples (bool, optional): Return tuples in schemas.fieldnames order instead of dictionaries. Defaults to False.
+        id_alloc (IdAllocator, optional): Allocator for the primary key, e.g. from id_allocators(). Defaults to the shared one for the table.
     Returns:
         list: A list of dictionaries representing fact customer interaction records. Each dictionary contains the following keys:
             - interaction_id (int): The unique identifier for the interaction.
@@ -428,33 +548,31 @@ def generate_fact_customer_interactions(num_records, customers, ls_dates, channe
             - interaction_rating (int): The rating of the interaction. Values range from 1 to 5.
     """
     interactions = []
-    for _ in range(num_records):
-        interaction = {
-            'interaction_id': fake.unique.random_int(min=1, max=100000),
-            'date_id': random.choice(ls_dates)['date_id'],
-            'customer_id': random.choice(customers)['customer_id'],
-            'channel_id': random.choice(channels)['channel_id'],
-            'location_id': random.choice(locations)['location_id'],
-            'interaction_type': random.choice(['Phone', 'Email', 'Chat', 'Website', 'Social Media', 'In-Person']),
-            'interaction_rating': random.randint(a=1, b=5)
-        }
-        interactions.append(interaction)
-    return interactions
+    for interaction_id in _allocator(id_alloc, 'interaction_id').take(num_records).tolist():
+        interactions.append((
+            interaction_id,
+            _pick_key(ls_dates, 'date_id', samplers),
+            _pick_key(customers, 'customer_id', samplers),
+            _pick_key(channels, 'channel_id', samplers),
+            _pick_key(locations, 'location_id', samplers),
+            random.choice(['Phone', 'Email', 'Chat', 'Website', 'Social Media', 'In-Person']),
+            random.randint(a=1, b=5),
+        ))
+    return interactions if as_tuples else _to_records(interactions, 'fact_customer_interactions')
 
-def generate_fact_daily_balances(num_records, accounts, ls_dates, currencies):
+def generate_fact_daily_balances(num_records, accounts, ls_dates, currencies, samplers=None, as_tuples=False, id_alloc=None):
     daily_balances = []
-    for _ in range(num_records):
-        daily_balance = {
-            'balance_id': fake.unique.random_int(min=1, max=100000),
-            'date_id': random.choice(ls_dates)['date_id'],
-            'account_id': random.choice(accounts)['account_id'],
-            'currency_id': random.choice(currencies)['currency_id'],
-            'opening_balance': round(random.uniform(a=0, b=1000000), 2),
-            'closing_balance': round(random.uniform(a=0, b=1000000), 2),
-            'average_balance': round((random.uniform(0, 1000000) + random.uniform(0, 1000000)), 2) / 2
-        }
-        daily_balances.append(daily_balance)
-    return daily_balances
+    for balance_id in _allocator(id_alloc, 'balance_id').take(num_records).tolist():
+        daily_balances.append((
+            balance_id,
+            _pick_key(ls_dates, 'date_id', samplers),
+            _pick_key(accounts, 'account_id', samplers),
+            _pick_key(currencies, 'currency_id', samplers),
+            round(random.uniform(a=0, b=1000000), 2),
+            round(random.uniform(a=0, b=1000000), 2),
+            round((random.uniform(0, 1000000) + random.uniform(0, 1000000)), 2) / 2,
+        ))
+    return daily_balances if as_tuples else _to_records(daily_balances, 'fact_daily_balances')
 
 
 
@@ -466,58 +584,461 @@ def generate_fact_daily_balances(num_records, accounts, ls_dates, currencies):
 #         dict_writer = csv.DictWriter(output_file, fieldnames=keys, delimiter='|')
 #         dict_writer.writeheader()
 #         dict_writer.writerows(data)
-def write_to_csv(data, file_name, folder_name='data'):
-    if not data:
+def iter_chunks(generate, num_records, *args, chunk_size=DEFAULT_CHUNK_SIZE, **kwargs):
+    """
+    Calls a generator function repeatedly so a large table is produced in fixed-size batches.
+    Parameters:
+        generate (callable): A generate_* function taking the number of records as its first argument.
+        num_records (int): The total number of records to generate.
+        *args: The remaining arguments for `generate`.
+        chunk_size (int, optional): The number of records per batch. Defaults to DEFAULT_CHUNK_SIZE.
+        **kwargs: Keyword arguments for `generate`, e.g. samplers.
+    Yields:
+        list: The next batch of records, at most `chunk_size` long.
+    Example:
+        >>> batches = iter_chunks(generate_fact_transaction, 120000, accounts, ls_dates, transactions_types, channels, locations, currencies)
+        >>> write_to_csv(batches, 'fact_transactions.csv', fieldnames=schemas.fieldnames('fact_transactions'))
+    """
+    for offset in range(0, num_records, chunk_size):
+        yield generate(min(chunk_size, num_records - offset), *args, **kwargs)
+
+
+def write_to_csv(data, file_name, folder_name='data', fieldnames=None, compression=None):
+    """
+    Writes records to a pipe-delimited CSV file.
+    Parameters:
+        data (list or iterable): Either a list of records, or an iterable of such lists (batches), e.g. from
+            iter_chunks. Records are dictionaries or tuples in column order (as_tuples=True). Batches are encoded
+            and written as they arrive, so memory stays bounded by one batch.
+        file_name (str): The name of the file to write.
+        folder_name (str, optional): The folder to write into. Defaults to 'data'.
+        fieldnames (list, optional): The header. Defaults to the keys of the first record; required for tuples.
+        compression (str, optional): 'gzip' or 'zstd' to compress in parallel blocks; file_name should then end in
+            .gz or .zst (see block_compression.py). Defaults to None.
+    """
+    batches = iter([data]) if isinstance(data, list) else iter(data)
+    first_batch = next((batch for batch in batches if batch), None)
+    if first_batch is None:
         return  # exit if data is empty
-    keys = data[0].keys()
+    if fieldnames is None:
+        if not isinstance(first_batch[0], dict):
+            raise ValueError(f'fieldnames are needed to write tuple rows to {file_name}')
+        fieldnames = list(first_batch[0].keys())
     file_path = os.path.join(folder_name, file_name)
     os.makedirs(folder_name, exist_ok=True)  # Create the folder if it doesn't exist
-    with open(file_path, 'w', newline='', encoding='utf-8') as output_file:
-        dict_writer = csv.DictWriter(output_file, fieldnames=keys, delimiter='|')
-        dict_writer.writeheader()
-        dict_writer.writerows(data)
-
-
-def main():
-    customers = generate_dim_customer(100)
-    ls_dates = generate_dim_date(2020, 2024)
-    channels = generate_dim_channel()
-    transactions_types = generate_dim_transaction_type()
-    locations = generate_dim_location(50)
-    currencies = generate_dim_currency()
-    accounts = generate_dim_account(num_records=100, customer_ids=[customer['customer_id'] for customer in customers])
-    investment_types = generate_dim_investment_type()
-    loans = generate_dim_loan(50)
-
-    #write to csv
-    write_to_csv(customers, file_name='customers.csv')
-    write_to_csv(ls_dates, file_name='dates.csv')
-    write_to_csv(channels, file_name='channels.csv')
-    write_to_csv(transactions_types, file_name='transaction_types.csv')
-    write_to_csv(locations, file_name='locations.csv')
-    write_to_csv(currencies, file_name='currencies.csv')
-    write_to_csv(accounts, file_name='accounts.csv')
-    write_to_csv(investment_types, file_name='investment_types.csv')
-    write_to_csv(loans, 'loans.csv')
-
-    #generate fact tables
-    transactions = generate_fact_transaction(10000, accounts, ls_dates, transactions_types, channels, locations, currencies)
-    investments = generate_fact_investement(10000, accounts, ls_dates, investment_types, locations, currencies)
-    fact_loans = generate_fact_loan(10000, accounts, ls_dates, loans, locations, currencies)
-    interactions = generate_fact_customer_interactions(10000, customers, ls_dates, channels, locations)
-    daily_balances = generate_fact_daily_balances(10000, accounts, ls_dates, currencies)
-
-    #write fact tables to csv
-    write_to_csv(transactions, file_name='fact_transactions.csv')
-    write_to_csv(investments, file_name='fact_investments.csv')
-    write_to_csv(fact_loans, file_name='fact_loans.csv')
-    write_to_csv(interactions, file_name='fact_customer_interactions.csv')
-    write_to_csv(daily_balances, file_name='fact_daily_balances.csv')
+    csv_encoder.write_rows(itertools.chain([first_batch], batches), file_path, fieldnames, compression)
+
+
+def write_table(data, table, output_format='csv', folder_name='data', s3_bucket=None, s3_compress=False, compression=None):
+    """
+    Writes a table in the requested output format, named after the table.
+    Parameters:
+        data (list, dict or iterable): Records (a list of dictionaries or of tuples in schema order), columns (a dict of arrays from columnar.py),
+            or an iterable of either.
+        table (str): The table name in schemas.py, e.g. 'fact_transactions'. The file is <table>.csv or <table>.parquet.
+        output_format (str, optional): 'csv' (pipe-delimited) or 'parquet'. Defaults to 'csv'.
+        folder_name (str, optional): The folder to write into. Defaults to 'data'.
+        s3_bucket (str, optional): Stream the CSV straight into this bucket as <table>/<table>.csv instead of
+            writing it locally (see stream_upload.py). Defaults to None.
+        s3_compress (bool, optional): Gzip the CSV streamed to S3, as <table>/<table>.csv.gz. Defaults to False.
+        compression (str, optional): Compress the CSV with 'gzip' or 'zstd' in parallel blocks, as <table>.csv.gz or
+            <table>.csv.zst (see block_compression.py); also applies to S3. Defaults to None.
+    Returns:
+        int: The number of bytes written.
+    """
+    if s3_bucket:
+        import stream_upload  # only S3 output needs boto3
+        if output_format != 'csv':
+            raise ValueError(f'only csv output can be streamed to S3, not {output_format!r}')
+        return stream_upload.stream_table_to_s3(data, table, s3_bucket, compress=compression or s3_compress)['bytes']
+    if output_format == 'parquet':
+        file_path = os.path.join(folder_name, f'{table}.parquet')
+        parquet_writer.write_to_parquet(data, f'{table}.parquet', table, folder_name=folder_name)
+        return os.path.getsize(file_path)
+    if output_format != 'csv':
+        raise ValueError(f'unknown output format {output_format!r} for {table}')
+    file_name = block_compression.compressed_name(f'{table}.csv', compression)
+    file_path = os.path.join(folder_name, file_name)
+    batches = iter([data]) if isinstance(data, (list, dict)) else iter(data)
+    first_batch = next(batches, None)
+    batches = itertools.chain([first_batch], batches)
+    if isinstance(first_batch, dict):
+        columnar.write_columns_to_csv(batches, file_name, folder_name=folder_name, compression=compression)
+    else:
+        write_to_csv(batches, file_name, folder_name=folder_name, fieldnames=schemas.fieldnames(table), compression=compression)
+    return os.path.getsize(file_path) if os.path.exists(file_path) else 0
+
+
+def main(columnar_mode=False, chunk_size=DEFAULT_CHUNK_SIZE, seed=None, shards=0, workers=None, merge_shards=False, formats=None,
+         s3_bucket=None, s3_compress=False, value_pools=False, locale='en_US', metrics_dir=DEFAULT_METRICS_DIR,
+         profiler=None, profile_sample_rate=1.0, row_counts=None, start_year=2020, end_year=2024, folder_name='data',
+         key_distributions=None, dimension_cache_dir=dimension_cache.DEFAULT_CACHE_DIR, compression=None,
+         derive_balances=False, pipelined=False, aggregate_kpis=False):
+    """
+    Generates every dimension and fact table and writes them to the data folder.
+    Unless the tables are streamed to S3, the folder also gets a _state/ high-water mark that incremental.py
+    appends daily partitions to.
+    Parameters:
+        columnar_mode (bool, optional): Generate the fact tables with the batched NumPy engine in
+            columnar.py instead of row by row. Defaults to False.
+        chunk_size (int, optional): The number of fact records generated and written per batch. Defaults to DEFAULT_CHUNK_SIZE.
+        seed (int, optional): Seed for Faker and `random`, so repeated runs produce the same data. Defaults to None.
+        shards (int, optional): If set, generate each fact table in this many shards across a process pool
+            (see parallel.py), writing data/<table>/shards/part-*.csv. Defaults to 0 (single process).
+        workers (int, optional): The number of worker processes in sharded mode. Defaults to the number of CPUs.
+        merge_shards (bool, optional): Merge the part-files of each fact table into <table>.csv. Defaults to False.
+        formats (dict, optional): Table name -> output format ('csv' or 'parquet'). Tables not listed are written
+            as CSV. Sharded fact tables are always written as CSV part-files. Defaults to None.
+        s3_bucket (str, optional): Stream every table straight into this bucket instead of the data folder, so
+            generation and upload overlap and nothing is written to local disk. Not combined with shards. Defaults to None.
+        s3_compress (bool, optional): Gzip the tables streamed to S3. Defaults to False.
+        value_pools (bool, optional): Build customers, locations and investment types from cached Faker value
+            pools (see value_pools.py) instead of calling Faker per row. Defaults to False.
+        locale (str, optional): The Faker locale of the value pools. Defaults to 'en_US'.
+        metrics_dir (str, optional): Where the per-stage metrics of the run are written as JSON lines
+            (see instrumentation.py); None disables them. Defaults to 'metrics'.
+        profiler (str, optional): Profile every stage with 'cprofile' or 'tracemalloc'. Defaults to None.
+        profile_sample_rate (float, optional): Fraction of runs that are profiled when a profiler is set. Defaults to 1.0.
+        row_counts (dict, optional): Table name -> number of rows, e.g. workload.WorkloadSpec(10).row_counts().
+            Defaults to workload.DEFAULT_ROW_COUNTS. The size of dates always follows start_year and end_year.
+        start_year (int, optional): The first year of dim_date. Defaults to 2020.
+        end_year (int, optional): The last year of dim_date. Defaults to 2024.
+        folder_name (str, optional): The output folder. Defaults to 'data'.
+        key_distributions (dict, optional): Foreign key column -> distribution for skewed fact tables, e.g.
+            distributions.DEFAULT_SKEW or {'account_id': {'distribution': 'zipf', 's': 1.2}}. Columns not listed
+            are drawn uniformly. Defaults to None.
+        dimension_cache_dir (str, optional): Where seeded runs cache their dimensions (see dimension_cache.py), so a
+            repeat run with the same seed and dimension sizes only generates the facts; None disables the cache.
+            Defaults to '.cache/dimensions'.
+        compression (str, optional): Write every CSV table, part-file and S3 stream compressed with 'gzip' or 'zstd',
+            as <table>.csv.gz or <table>.csv.zst. Blocks are compressed on all CPUs, and the files stay concatenable
+            (see block_compression.py). Defaults to None.
+        derive_balances (bool, optional): Derive fact_daily_balances from the generated transactions and
+            dim_account.account_balance (see balances.py): one row per account and day with transactions, so its row
+            count follows fact_transactions. Defaults to False (independent random balances).
+        pipelined (bool, optional): Write each CSV fact table through a pipeline (see pipeline.py), so generating,
+            encoding, compressing and writing or uploading its batches overlap; the per-stage utilization ends up in
+            the metrics. Not combined with shards. Defaults to False.
+        aggregate_kpis (bool, optional): Maintain the KPI summary tables of aggregates.py while the facts are
+            generated and write them next to the facts as agg_<name>.csv; incremental.py keeps them up to date.
+            Defaults to False.
+    Returns:
+        dict: The run summary written to the metrics file.
+    """
+    formats = formats or {}
+    counts = {**workload.DEFAULT_ROW_COUNTS, **(row_counts or {})}
+    sink = {'folder_name': folder_name, 's3_bucket': s3_bucket, 's3_compress': s3_compress, 'compression': compression}
+    if shards and s3_bucket:
+        raise ValueError('sharded generation writes part-files locally; upload them with s3_loader.py instead')
+    if shards and pipelined:
+        raise ValueError('sharded generation already writes every shard in a process of its own; use shards or pipelined')
+    if seed is not None:
+        random.seed(seed)
+        fake.seed_instance(seed)
+
+    if not s3_bucket:
+        _remove_stale_output(folder_name, formats, compression)
+    #every run allocates its keys from its own seed, also when main() runs more than once in a process
+    id_allocs = id_allocators(seed or 0)
+    metrics = RunMetrics(metrics_dir, profiler=profiler, profile_sample_rate=profile_sample_rate)
+    try:
+        dim_keys, balance_engine, aggregator = _generate_all(metrics, counts, start_year, end_year, columnar_mode, chunk_size,
+                                                             seed, shards, workers, merge_shards, formats, sink, value_pools,
+                                                             locale, key_distributions, dimension_cache_dir, derive_balances,
+                                                             pipelined, aggregate_kpis, id_allocs)
+        for table, columns in (aggregator.tables() if aggregator else ()):
+            with metrics.stage(f'write_{table}', kind='write') as stage:
+                stage.bytes_written = write_table(stage.count(columns), table, formats.get(table, 'csv'), **sink)
+    except BaseException:
+        metrics.finish(status='error')
+        raise
+    if not s3_bucket:
+        #high-water mark for daily appends with incremental.py
+        state = incremental.snapshot_state(seed or 0, date(end_year, 12, 31), dim_keys['date_id'][-1], counts, shards,
+                                           compression, balance_engine, id_allocs)
+        state['outputs'] = _output_paths(folder_name, formats, compression)
+        incremental.save_state(folder_name, state, dim_keys,
+                               account_balances=balance_engine.closing_balances() if balance_engine else None,
+                               aggregator=aggregator)
+    return metrics.finish()
+
+
+def _remove_stale_output(folder_name, formats, compression):
+    #a snapshot replaces every table: date_id= partitions of incremental.py, part-files of an earlier sharded run and
+    #copies in another format or codec would otherwise be read alongside the new files. Only what an earlier run
+    #recorded in _state/ is removed; anything else in the folder was not written here and is left alone.
+    recorded = incremental.recorded_outputs(folder_name)
+    if recorded is None:
+        return
+    keep = set()
+    for table in dimension_cache.DIMENSION_TABLES:
+        #the dimension cache may leave this run's file in place instead of rewriting it
+        keep.add(f'{table}.parquet' if formats.get(table) == 'parquet' else block_compression.compressed_name(f'{table}.csv', compression))
+    for path in recorded:
+        full_path = os.path.join(folder_name, path)
+        if path in keep:
+            continue
+        if os.path.isdir(full_path):
+            shutil.rmtree(full_path)
+        elif os.path.isfile(full_path):
+            os.remove(full_path)
+    for table in [*schemas.SCHEMAS, *schemas.AGGREGATE_SCHEMAS]:
+        table_folder = os.path.join(folder_name, table)
+        if os.path.isdir(table_folder) and not os.listdir(table_folder):
+            os.rmdir(table_folder)
+    shutil.rmtree(os.path.join(folder_name, incremental.STATE_DIR_NAME))
+
+
+def _output_paths(folder_name, formats, compression):
+    #the files and part folders of every table a local run left in the folder, relative to it, for _state/
+    paths = []
+    for table in [*schemas.SCHEMAS, *schemas.AGGREGATE_SCHEMAS]:
+        names = [block_compression.compressed_name(f'{table}.csv', compression)]
+        if formats.get(table) == 'parquet':
+            names.append(f'{table}.parquet')
+        names.append(os.path.relpath(parallel.shard_folder(folder_name, table), folder_name))
+        paths.extend(name for name in names if os.path.exists(os.path.join(folder_name, name)))
+    return paths
 
 
+def _generate_dimensions(metrics, counts, start_year, end_year, pools, id_allocs):
+    global _fresh_id_generators
+    _fresh_id_generators = False
+    with metrics.stage('generate_dim_customer', kind='dimension') as stage:
+        customers = stage.count(generate_dim_customer(counts['customers'], pools=pools))
+    with metrics.stage('generate_dim_date', kind='dimension') as stage:
+        ls_dates = stage.count(generate_dim_date(start_year, end_year))
+    with metrics.stage('generate_dim_channel', kind='dimension') as stage:
+        channels = stage.count(generate_dim_channel())
+    with metrics.stage('generate_dim_transaction_type', kind='dimension') as stage:
+        transactions_types = stage.count(generate_dim_transaction_type())
+    with metrics.stage('generate_dim_location', kind='dimension') as stage:
+        locations = stage.count(generate_dim_location(counts['locations'], pools=pools))
+    with metrics.stage('generate_dim_currency', kind='dimension') as stage:
+        currencies = stage.count(generate_dim_currency())
+    with metrics.stage('generate_dim_account', kind='dimension') as stage:
+        accounts = stage.count(generate_dim_account(num_records=counts['accounts'], customer_ids=[customer['customer_id'] for customer in customers],
+                                                      id_alloc=id_allocs['account_number']))
+    with metrics.stage('generate_dim_investment_type', kind='dimension') as stage:
+        investment_types = stage.count(generate_dim_investment_type(counts['investment_types'], pools=pools))
+    with metrics.stage('generate_dim_loan', kind='dimension') as stage:
+        loans = stage.count(generate_dim_loan(counts['loans']))
+    return {
+        'customers': customers,
+        'dates': ls_dates,
+        'channels': channels,
+        'transaction_types': transactions_types,
+        'locations': locations,
+        'currencies': currencies,
+        'accounts': accounts,
+        'investment_types': investment_types,
+        'loans': loans,
+    }
+
+
+def parse_formats(values):
+    """
+    Reads the output formats given on the command line.
+    Parameters:
+        values (list): 'table=format' pairs, e.g. ['fact_transactions=parquet'], or a bare format for every table.
+    Returns:
+        dict: Table name -> output format, as main() takes it.
+    """
+    formats = {}
+    for value in values:
+        table, _, output_format = value.rpartition('=')
+        if output_format not in ('csv', 'parquet'):
+            raise ValueError(f'unknown output format {output_format!r} in {value!r}')
+        tables = [table] if table else [*schemas.SCHEMAS, *schemas.AGGREGATE_SCHEMAS]
+        for name in tables:
+            if name not in schemas.SCHEMAS and name not in schemas.AGGREGATE_SCHEMAS:
+                raise ValueError(f'unknown table {name!r} in {value!r}')
+            formats[name] = output_format
+    return formats
+
+
+def _dimension_code_version():
+    return dimension_cache.code_version(id_generator, generate_dim_customer, generate_dim_date, generate_dim_channel,
+                                        generate_dim_account, generate_dim_transaction_type, generate_dim_location,
+                                        generate_dim_currency, generate_dim_investment_type, generate_dim_loan,
+                                        'value_pools', 'id_allocator', 'schemas')
+
+
+def _generate_all(metrics, counts, start_year, end_year, columnar_mode, chunk_size, seed, shards, workers,
+                  merge_shards, formats, sink, value_pools, locale, key_distributions, dimension_cache_dir, derive_balances=False,
+                  pipelined=False, aggregate_kpis=False, id_allocs=None):
+    #the module-level id generators only start at 1 in the first run of a process, so only that run can use the cache
+    id_allocs = id_allocs or id_allocators(seed or 0)
+    cache, cached = None, None
+    if dimension_cache_dir and seed is not None and _fresh_id_generators:
+        cache = dimension_cache.DimensionCache(dimension_cache_dir)
+        params = {'seed': seed, 'start_year': start_year, 'end_year': end_year, 'value_pools': value_pools, 'locale': locale,
+                  **{table: counts[table] for table in ('customers', 'locations', 'accounts', 'investment_types', 'loans')}}
+        cache_key = dimension_cache.cache_key(params, _dimension_code_version())
+
+    if cache and cache.exists(cache_key):
+        with metrics.stage('load_dimensions', kind='dimension') as stage:
+            cached = cache.load(cache_key)
+            dim_keys = cached.dim_keys()
+            stage.rows = sum(cached.rows.values())
+        random.setstate(cached.random_state)
+    else:
+        pools = ValuePools(locale=locale, seed=seed or 0) if value_pools else None
+        dimensions = _generate_dimensions(metrics, counts, start_year, end_year, pools, id_allocs)
+        if cache:
+            cache.save(cache_key, dimensions, random.getstate(), params)
+        dim_keys = {column: columnar.key_column(dimensions[table], column)
+                    for column, table in dimension_cache.KEY_COLUMNS.items()}
+
+    #write dimension tables; on a cache hit, files still exactly as the cache wrote them are left alone
+    for table in dimension_cache.DIMENSION_TABLES:
+        with metrics.stage(f'write_{table}', kind='write') as stage:
+            output_format = formats.get(table, 'csv')
+            local_csv = output_format == 'csv' and not sink['s3_bucket']
+            file_path = os.path.join(sink['folder_name'], block_compression.compressed_name(f'{table}.csv', sink['compression']))
+            if cached and local_csv and cache.output_is_current(cache_key, file_path):
+                stage.rows = cached.rows[table]
+                stage.extra['skipped'] = True
+                continue
+            records = cached.columns(table) if cached else dimensions[table]
+            stage.bytes_written = write_table(stage.count(records), table, output_format, **sink)
+            if cache and local_csv:
+                cache.record_output(cache_key, file_path)
+
+    samplers = distributions.build_samplers(dim_keys, key_distributions, seed or 0) if key_distributions else None
+    #fact generation only needs the dimension keys: arrays for the NumPy engine, lists for the row generators
+    keys = dim_keys if columnar_mode else {column: values.tolist() for column, values in dim_keys.items()}
+
+    engine = None
+    if derive_balances:
+        tables = {table: cached.columns(table) if cached else dimensions[table] for table in ('accounts', 'transaction_types')}
+        #sharded runs leave every balance_id to the engine, so it can use the whole id range
+        engine = balances.BalanceEngine.from_dimensions(tables['accounts'], tables['transaction_types'], dim_keys['date_id'],
+                                                        dim_keys['currency_id'], id_alloc=id_allocs['balance_id'])
+    aggregator = None
+    if aggregate_kpis:
+        tables = {table: cached.columns(table) if cached else dimensions[table] for table in ('accounts', 'loans')}
+        aggregator = aggregates.KpiAggregator.from_dimensions(tables['accounts'], tables['loans'])
+
+    if shards:
+        row_counts = {table: counts[table] for table in parallel.FACT_TABLES if not (engine and table == 'fact_daily_balances')}
+        with metrics.stage('sharded_facts', kind='fact') as stage:
+            stage.rows = sum(parallel.generate_fact_tables_sharded(row_counts, dim_keys, seed=seed or 0, shard_count=shards,
+                                                                   workers=workers, folder_name=sink['folder_name'], chunk_size=chunk_size,
+                                                                   merge=merge_shards, samplers=samplers,
+                                                                   compression=sink['compression'],
+                                                                   aggregator=aggregator).values())
+        if engine:
+            #the transactions were written by the worker processes; read them back to derive the balances
+            with metrics.stage('fact_daily_balances', kind='fact') as stage:
+                files = parallel.table_files('fact_transactions', sink['folder_name'], merge_shards, sink['compression'])
+                for batch in balances.read_transaction_batches(files):
+                    engine.add_transactions(batch)
+                stage.bytes_written = write_table(stage.count(engine.iter_batches(chunk_size)), 'fact_daily_balances',
+                                                  formats.get('fact_daily_balances', 'csv'), **sink)
+        return dim_keys, engine, aggregator
+
+    #generate fact tables in batches and stream them to disk; the batch iterators are lazy, so each table
+    #is generated inside its own stage
+    if columnar_mode:
+        rng = columnar.default_rng(seed)
+        facts = [
+            ('fact_transactions', columnar.iter_column_chunks(columnar.generate_fact_transaction_columns, counts['fact_transactions'], keys['account_id'], keys['date_id'], keys['transaction_type_id'], keys['channel_id'], keys['location_id'], keys['currency_id'], rng=rng, chunk_size=chunk_size, samplers=samplers, id_alloc=id_allocs['transaction_id'])),
+            ('fact_investments', columnar.iter_column_chunks(columnar.generate_fact_investement_columns, counts['fact_investments'], keys['account_id'], keys['date_id'], keys['investment_type_id'], keys['location_id'], keys['currency_id'], rng=rng, chunk_size=chunk_size, samplers=samplers, id_alloc=id_allocs['investment_id'])),
+            ('fact_loans', columnar.iter_column_chunks(columnar.generate_fact_loan_columns, counts['fact_loans'], keys['account_id'], keys['date_id'], keys['loan_id'], keys['location_id'], keys['currency_id'], rng=rng, chunk_size=chunk_size, samplers=samplers, id_alloc=id_allocs['loan_fact_id'])),
+            ('fact_customer_interactions', columnar.iter_column_chunks(columnar.generate_fact_customer_interactions_columns, counts['fact_customer_interactions'], keys['customer_id'], keys['date_id'], keys['channel_id'], keys['location_id'], rng=rng, chunk_size=chunk_size, samplers=samplers, id_alloc=id_allocs['interaction_id'])),
+            ('fact_daily_balances', columnar.iter_column_chunks(columnar.generate_fact_daily_balances_columns, counts['fact_daily_balances'], keys['account_id'], keys['date_id'], keys['currency_id'], rng=rng, chunk_size=chunk_size, samplers=samplers, id_alloc=id_allocs['balance_id'])),
+        ]
+    else:
+        # tuple rows: write_table encodes them in schema order without building a dict per row
+        facts = [
+            ('fact_transactions', iter_chunks(generate_fact_transaction, counts['fact_transactions'], keys['account_id'], keys['date_id'], keys['transaction_type_id'], keys['channel_id'], keys['location_id'], keys['currency_id'], chunk_size=chunk_size, samplers=samplers, as_tuples=True, id_alloc=id_allocs['transaction_id'])),
+            ('fact_investments', iter_chunks(generate_fact_investement, counts['fact_investments'], keys['account_id'], keys['date_id'], keys['investment_type_id'], keys['location_id'], keys['currency_id'], chunk_size=chunk_size, samplers=samplers, as_tuples=True, id_alloc=id_allocs['investment_id'])),
+            ('fact_loans', iter_chunks(generate_fact_loan, counts['fact_loans'], keys['account_id'], keys['date_id'], keys['loan_id'], keys['location_id'], keys['currency_id'], chunk_size=chunk_size, samplers=samplers, as_tuples=True, id_alloc=id_allocs['loan_fact_id'])),
+            ('fact_customer_interactions', iter_chunks(generate_fact_customer_interactions, counts['fact_customer_interactions'], keys['customer_id'], keys['date_id'], keys['channel_id'], keys['location_id'], chunk_size=chunk_size, samplers=samplers, as_tuples=True, id_alloc=id_allocs['interaction_id'])),
+            ('fact_daily_balances', iter_chunks(generate_fact_daily_balances, counts['fact_daily_balances'], keys['account_id'], keys['date_id'], keys['currency_id'], chunk_size=chunk_size, samplers=samplers, as_tuples=True, id_alloc=id_allocs['balance_id'])),
+        ]
+    if engine:
+        #both are lazy: the balances are computed once every transaction has gone through the engine
+        derived = {'fact_transactions': engine.tee, 'fact_daily_balances': lambda _: engine.iter_batches(chunk_size)}
+        facts = [(table, derived[table](batches) if table in derived else batches) for table, batches in facts]
+    if aggregator:
+        facts = [(table, aggregator.tee(table, batches)) for table, batches in facts]
+    for table, batches in facts:
+        with metrics.stage(table, kind='fact') as stage:
+            if pipelined and formats.get(table, 'csv') == 'csv':
+                report = pipeline.write_table_pipelined(stage.count(batches), table, sink['folder_name'],
+                                                        sink['compression'] or ('gzip' if sink['s3_compress'] else None),
+                                                        s3_bucket=sink['s3_bucket'])
+                stage.bytes_written = report['bytes']
+                stage.extra['pipeline'] = report['stages']
+            else:
+                stage.bytes_written = write_table(stage.count(batches), table, formats.get(table, 'csv'), **sink)
+    return dim_keys, engine, aggregator
+
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='Generate the banking star schema as pipe-delimited files.')
+    parser.add_argument('--scale-factor', type=float, help='size every table from one scale factor (SF1 is about 0.45 GB)')
+    parser.add_argument('--config', help='JSON workload spec: scale_factor, start_year, end_year, ratios')
+    parser.add_argument('--dry-run', action='store_true', help='print the projected rows, size and runtime and exit')
+    parser.add_argument('--calibrate', action='store_true', help='measure per-row costs on this machine for the projection')
+    parser.add_argument('--seed', type=int, help='seed for reproducible output')
+    parser.add_argument('--columnar', action='store_true', help='generate fact tables with the NumPy engine')
+    parser.add_argument('--shards', type=int, default=0, help='generate fact tables in this many shards in parallel')
+    parser.add_argument('--workers', type=int, help='worker processes for --shards')
+    parser.add_argument('--merge-shards', action='store_true', help='merge shard part-files into one file per table')
+    parser.add_argument('--value-pools', action='store_true', help='build dimensions from cached Faker value pools')
+    parser.add_argument('--output', default='data', help='output folder')
+    parser.add_argument('--skew', action='store_true', help='draw foreign keys with distributions.DEFAULT_SKEW')
+    parser.add_argument('--key-distributions', help='JSON file: foreign key column -> distribution (see distributions.py)')
+    parser.add_argument('--no-dimension-cache', action='store_true', help='always regenerate the dimensions of seeded runs')
+    parser.add_argument('--compression', choices=sorted(block_compression.CODECS), help='write .csv.gz or .csv.zst files')
+    parser.add_argument('--derive-balances', action='store_true', help='compute daily balances from the transactions')
+    parser.add_argument('--pipelined', action='store_true', help='overlap generating, encoding, compressing and writing')
+    parser.add_argument('--aggregates', action='store_true', help='write KPI summary tables next to the facts')
+    parser.add_argument('--formats', nargs='+', default=[],
+                        help='output format per table as table=parquet, or a bare csv/parquet for every table')
+    parser.add_argument('--s3-bucket', help='stream every table straight into this S3 bucket instead of --output')
+    parser.add_argument('--s3-compress', action='store_true', help='gzip the tables streamed with --s3-bucket')
+    parser.add_argument('--metrics-dir', default=DEFAULT_METRICS_DIR, help='where per-stage run metrics are written')
+    parser.add_argument('--no-metrics', action='store_true', help='write no run metrics')
+    parser.add_argument('--profile', choices=PROFILERS, help='profile every stage; results go next to the metrics')
+    parser.add_argument('--profile-sample-rate', type=float, default=1.0, help='fraction of runs profiled with --profile')
+    args = parser.parse_args()
+    try:
+        formats = parse_formats(args.formats)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.calibrate:
+        workload.calibrate()
+    spec = None
+    if args.config:
+        spec = workload.WorkloadSpec.from_file(args.config)
+    elif args.scale_factor:
+        spec = workload.WorkloadSpec(args.scale_factor)
+    if spec or args.dry_run:
+        engine = 'columnar' if args.columnar or args.shards else 'rows'
+        workers = (args.workers or os.cpu_count() or 1) if args.shards else 1
+        scale = f'SF{spec.scale_factor:g}' if spec else 'the default row counts'
+        workload.print_estimate(workload.estimate(spec.row_counts() if spec else workload.DEFAULT_ROW_COUNTS, engine=engine, workers=workers),
+                                title=f'Projected workload at {scale} ({engine} engine, {workers} worker(s))')
+    key_distributions = distributions.DEFAULT_SKEW if args.skew else None
+    if args.key_distributions:
+        with open(args.key_distributions, encoding='utf-8') as f:
+            key_distributions = json.load(f)
+    if not args.dry_run:
+        main(columnar_mode=args.columnar, seed=args.seed, shards=args.shards, workers=args.workers,
+             merge_shards=args.merge_shards, value_pools=args.value_pools, folder_name=args.output,
+             row_counts=spec.row_counts() if spec else None,
+             start_year=spec.start_year if spec else 2020, end_year=spec.end_year if spec else 2024,
+             key_distributions=key_distributions,
+             dimension_cache_dir=None if args.no_dimension_cache else dimension_cache.DEFAULT_CACHE_DIR,
+             compression=args.compression, derive_balances=args.derive_balances, pipelined=args.pipelined,
+             aggregate_kpis=args.aggregates, formats=formats, s3_bucket=args.s3_bucket, s3_compress=args.s3_compress,
+             metrics_dir=None if args.no_metrics else args.metrics_dir, profiler=args.profile,
+             profile_sample_rate=args.profile_sample_rate)
 
 
@@ -0,0 +1,191 @@
+import os
+import shutil
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import block_compression
+import columnar
+import csv_encoder
+import schemas
+from id_allocator import IdAllocator
+
+
+# Sharded, multi-process generation of the fact tables.
+#
+# Each fact table is split into `shard_count` shards. Shard i of a table draws from its own
+# NumPy stream, seeded from (seed, table, i), and takes its primary keys from block i of the
+# table's IdAllocator, so shards never share random state or keys. Every shard is written to
+# its own part-file, data/<table>/shards/part-00000.csv, data/<table>/shards/part-00001.csv, ... and the
+# same seed and shard count always produce byte-identical parts, however many workers run them. The parts get a
+# folder of their own so they never mix with the date_id= partitions incremental.py adds below data/<table>/.
+
+# table -> (columnar generator, primary key, dimension keys in the generator's argument order)
+FACT_TABLES = {
+    'fact_transactions': (columnar.generate_fact_transaction_columns, 'transaction_id',
+                          ['account_id', 'date_id', 'transaction_type_id', 'channel_id', 'location_id', 'currency_id']),
+    'fact_investments': (columnar.generate_fact_investement_columns, 'investment_id',
+                         ['account_id', 'date_id', 'investment_type_id', 'location_id', 'currency_id']),
+    'fact_loans': (columnar.generate_fact_loan_columns, 'loan_fact_id',
+                   ['account_id', 'date_id', 'loan_id', 'location_id', 'currency_id']),
+    'fact_customer_interactions': (columnar.generate_fact_customer_interactions_columns, 'interaction_id',
+                                   ['customer_id', 'date_id', 'channel_id', 'location_id']),
+    'fact_daily_balances': (columnar.generate_fact_daily_balances_columns, 'balance_id',
+                            ['account_id', 'date_id', 'currency_id']),
+}
+
+
+def shard_rng(seed, table, shard_index):
+    """
+    Returns the independent random stream of one shard.
+    Parameters:
+        seed (int): The run seed.
+        table (str): The fact table name.
+        shard_index (int): The shard number.
+    Returns:
+        numpy.random.Generator: A generator that depends only on (seed, table, shard_index).
+    """
+    return np.random.default_rng(np.random.SeedSequence([seed, zlib.crc32(table.encode('utf-8')), shard_index]))
+
+
+def shard_sizes(num_records, shard_count):
+    """
+    Splits a row count as evenly as possible across shards.
+    Parameters:
+        num_records (int): The total number of records.
+        shard_count (int): The number of shards.
+    Returns:
+        list: The number of records of each shard.
+    """
+    base, extra = divmod(num_records, shard_count)
+    return [base + (1 if i < extra else 0) for i in range(shard_count)]
+
+
+# sub-folder of <table>/ holding the part-files of a sharded run
+SHARD_DIR_NAME = 'shards'
+
+
+def shard_folder(folder_name, table):
+    """
+    Returns:
+        str: The folder of a table's part-files, e.g. data/fact_transactions/shards.
+    """
+    return os.path.join(folder_name, table, SHARD_DIR_NAME)
+
+
+def part_file_name(shard_index, compression=None):
+    return block_compression.compressed_name(f'part-{shard_index:05d}.csv', compression)
+
+
+def _generate_shard(table, shard_index, shard_count, num_records, dim_keys, seed, folder_name, chunk_size, samplers=None,
+                    compression=None, aggregator=None):
+    generate, primary_key, key_names = FACT_TABLES[table]
+    rng = shard_rng(seed, table, shard_index)
+    id_alloc = IdAllocator(primary_key, seed=seed).shard(shard_index, shard_count)
+    batches = columnar.iter_column_chunks(generate, num_records, *[dim_keys[key] for key in key_names],
+                                          rng=rng, chunk_size=chunk_size, id_alloc=id_alloc, samplers=samplers)
+    if aggregator:
+        batches = aggregator.tee(table, batches)
+    columnar.write_columns_to_csv(batches, part_file_name(shard_index, compression),
+                                  folder_name=shard_folder(folder_name, table), compression=compression,
+                                  compression_workers=1)  # the shards already keep every CPU busy
+    return num_records, aggregator
+
+
+def merge_parts(table, folder_name='data', remove_parts=True, compression=None):
+    """
+    Concatenates the part-files of a table into a single <table>.csv, keeping only the first header.
+    Compressed parts are concatenated as they are into <table>.csv.gz or <table>.csv.zst, without recompressing.
+    A table without parts still gets a merged file, holding just the header of schemas.fieldnames(table).
+    Parameters:
+        table (str): The fact table name.
+        folder_name (str, optional): The folder holding the <table>/shards/ part directory. Defaults to 'data'.
+        remove_parts (bool, optional): Delete the part directory once merged. Defaults to True.
+        compression (str, optional): The codec of the parts, used when there are none to take it from. Defaults to None.
+    Returns:
+        str: The path of the merged file.
+    """
+    part_folder = shard_folder(folder_name, table)
+    parts = sorted(name for name in os.listdir(part_folder) if name.startswith('part-')) if os.path.isdir(part_folder) else []
+    codec = block_compression.codec_of(parts[0]) if parts else compression
+    merged_path = os.path.join(folder_name, block_compression.compressed_name(f'{table}.csv', codec))
+    with open(merged_path, 'wb') as merged:
+        if not parts:
+            header = csv_encoder.encode_rows([], schemas.fieldnames(table), header=True).encode('utf-8')
+            merged.write(block_compression.compress_block(header, codec) if codec else header)
+        for i, name in enumerate(parts):
+            part_path = os.path.join(part_folder, name)
+            header_size = block_compression.header_block_size(part_path)
+            with open(part_path, 'rb') as part:
+                header = part.read(header_size)
+                if i == 0:
+                    merged.write(header)
+                shutil.copyfileobj(part, merged, length=1024 * 1024)
+    if remove_parts and parts:
+        shutil.rmtree(part_folder)
+        if not os.listdir(os.path.join(folder_name, table)):
+            os.rmdir(os.path.join(folder_name, table))
+    return merged_path
+
+
+def table_files(table, folder_name='data', merged=False, compression=None):
+    """
+    Returns:
+        list: The files a sharded run wrote for a table: the merged <table>.csv, or its part-files in order.
+    """
+    if merged:
+        return [os.path.join(folder_name, block_compression.compressed_name(f'{table}.csv', compression))]
+    part_folder = shard_folder(folder_name, table)
+    return [os.path.join(part_folder, name) for name in sorted(os.listdir(part_folder)) if name.startswith('part-')]
+
+
+def generate_fact_tables_sharded(row_counts, dim_keys, seed=0, shard_count=None, workers=None,
+                                 folder_name='data', chunk_size=50000, merge=False, samplers=None, compression=None,
+                                 aggregator=None):
+    """
+    Generates fact tables as shards spread across a process pool.
+    Parameters:
+        row_counts (dict): Fact table name -> number of records, e.g. {'fact_transactions': 10000000}.
+        dim_keys (dict): Dimension key name -> array of valid keys, e.g. {'account_id': [...], 'date_id': [...]}.
+        seed (int, optional): The run seed. Defaults to 0.
+        shard_count (int, optional): The number of shards per table. Defaults to the number of CPUs.
+        workers (int, optional): The number of worker processes. Defaults to the number of CPUs.
+        folder_name (str, optional): The output folder. Defaults to 'data'.
+        chunk_size (int, optional): The number of records per batch inside a shard. Defaults to 50000.
+        merge (bool, optional): Merge each table's part-files into a single <table>.csv. Defaults to False.
+        samplers (dict, optional): Key column -> distributions.KeySampler for skewed foreign keys. The alias tables
+            are built once here and shipped to the workers. Defaults to uniform keys.
+        compression (str, optional): 'gzip' or 'zstd' part-files, part-00000.csv.gz, ... (see block_compression.py).
+            Defaults to None.
+        aggregator (aggregates.KpiAggregator, optional): Every shard aggregates its own rows, and the shard
+            aggregates are merged into this one. Defaults to None.
+    Returns:
+        dict: Fact table name -> number of records written; main() records the throughput in its run metrics.
+    """
+    shard_count = shard_count or os.cpu_count() or 1
+    dim_keys = {key: np.asarray(values, dtype=np.int64) for key, values in dim_keys.items()}
+    written = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for table, num_records in row_counts.items():
+            part_folder = shard_folder(folder_name, table)
+            if os.path.isdir(part_folder):
+                shutil.rmtree(part_folder)  # stale parts from a run with a different shard count
+            key_names = FACT_TABLES[table][2]
+            table_keys = {key: dim_keys[key] for key in key_names}
+            table_samplers = {key: samplers[key] for key in key_names if key in samplers} if samplers else None
+            table_aggregator = aggregator.for_table(table) if aggregator else None
+            for shard_index, shard_records in enumerate(shard_sizes(num_records, shard_count)):
+                futures.append((table, pool.submit(_generate_shard, table, shard_index, shard_count, shard_records,
+                                                   table_keys, seed, folder_name, chunk_size, table_samplers,
+                                                   compression, table_aggregator)))
+        for table, future in futures:
+            num_records, shard_aggregator = future.result()
+            written[table] = written.get(table, 0) + num_records
+            if shard_aggregator:
+                aggregator.merge(shard_aggregator)
+    if merge:
+        for table in row_counts:
+            merge_parts(table, folder_name, compression=compression)
+    return written
@@ -0,0 +1,158 @@
+import argparse
+import itertools
+import os
+import time
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # parquet output is optional; CSV works without pyarrow
+    pa = None
+    pq = None
+
+import schemas
+
+
+DEFAULT_ROW_GROUP_SIZE = 1000000
+DEFAULT_COMPRESSION = 'snappy'
+
+
+def arrow_schema(table):
+    """
+    Maps a table's schema in schemas.py to an Arrow schema.
+    'int' -> int64, 'money' and 'float' -> float64, 'str' -> string, 'date' -> date32.
+    Parameters:
+        table (str): The table name, e.g. 'fact_transactions'.
+    Returns:
+        pyarrow.Schema: The typed schema.
+    """
+    _require_pyarrow()
+    types = {'int': pa.int64(), 'money': pa.float64(), 'float': pa.float64(), 'str': pa.string(), 'date': pa.date32()}
+    return pa.schema([(name, types[column_type]) for name, column_type in schemas.columns(table)])
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError('parquet output needs pyarrow: pip install pyarrow')
+
+
+def _to_arrow(batch, schema):
+    # a batch is a dict of column arrays (columnar.py), or a list of record dicts or of tuples in schema order
+    if isinstance(batch, dict):
+        columns = [batch[field.name] for field in schema]
+    elif isinstance(batch[0], dict):
+        columns = [[record[field.name] for record in batch] for field in schema]
+    else:
+        columns = [list(values) for values in zip(*batch)]
+    arrays = []
+    for field, values in zip(schema, columns):
+        if pa.types.is_date32(field.type):
+            arrays.append(pa.array(values, type=pa.string()).cast(pa.date32()))
+        else:
+            arrays.append(pa.array(values, type=field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def _num_rows(batch):
+    return len(next(iter(batch.values()))) if isinstance(batch, dict) else len(batch)
+
+
+def write_to_parquet(data, file_name, table, folder_name='data', row_group_size=DEFAULT_ROW_GROUP_SIZE,
+                     compression=DEFAULT_COMPRESSION):
+    """
+    Writes records to a typed Parquet file.
+    Parameters:
+        data (list, dict or iterable): A list of record dictionaries or tuples, a dict of column arrays, or an
+            iterable of those (batches). Batches are buffered only until a row group is full.
+        file_name (str): The name of the file to write, e.g. 'fact_transactions.parquet'.
+        table (str): The table name in schemas.py that gives the column types.
+        folder_name (str, optional): The folder to write into. Defaults to 'data'.
+        row_group_size (int, optional): The number of rows per Parquet row group. Defaults to 1000000.
+        compression (str, optional): 'snappy', 'zstd', 'gzip', 'lz4', 'brotli' or 'none'. Defaults to 'snappy'.
+    Returns:
+        int: The number of rows written.
+    """
+    _require_pyarrow()
+    schema = arrow_schema(table)
+    batches = iter([data]) if isinstance(data, (list, dict)) else iter(data)
+    file_path = os.path.join(folder_name, file_name)
+    os.makedirs(folder_name, exist_ok=True)
+    written = 0
+    pending, pending_rows = [], 0
+    with pq.ParquetWriter(file_path, schema, compression=compression) as writer:
+        for batch in itertools.chain(batches, [None]):
+            if batch is not None:
+                if not _num_rows(batch):
+                    continue
+                pending.append(_to_arrow(batch, schema))
+                pending_rows += pending[-1].num_rows
+            # flush whole row groups as soon as they are full, and the remainder at the end
+            if pending and (pending_rows >= row_group_size or batch is None):
+                buffered = pa.concat_tables(pending)
+                full = buffered.num_rows if batch is None else buffered.num_rows - buffered.num_rows % row_group_size
+                writer.write_table(buffered.slice(0, full), row_group_size=row_group_size)
+                written += full
+                rest = buffered.slice(full)
+                pending, pending_rows = ([rest], rest.num_rows) if rest.num_rows else ([], 0)
+    return written
+
+
+def read_parquet_batches(file_path, batch_size=100000):
+    """
+    Reads a Parquet file back in batches of rows, e.g. for validator.py and warehouse_loader.py.
+    Parameters:
+        file_path (str): The .parquet file.
+        batch_size (int, optional): Rows per batch. Defaults to 100000.
+    Yields:
+        tuple: (column names, list of row tuples); dates come back as 'YYYY-MM-DD' strings, as in the CSV files.
+    """
+    _require_pyarrow()
+    parquet_file = pq.ParquetFile(file_path)
+    names = parquet_file.schema_arrow.names
+    for record_batch in parquet_file.iter_batches(batch_size=batch_size):
+        columns = [(column.cast(pa.string()) if pa.types.is_date32(column.type) else column).to_pylist()
+                   for column in record_batch.columns]
+        yield names, list(zip(*columns))
+
+
+def benchmark_formats(num_records=1000000, folder_name='bench', compressions=('snappy', 'zstd')):
+    """
+    Compares bytes written and write time of the pipe-delimited CSV path with Parquet, on fact_transactions.
+    Parameters:
+        num_records (int, optional): The number of fact transaction records to write. Defaults to 1000000.
+        folder_name (str, optional): Scratch folder for the output files. Defaults to 'bench'.
+        compressions (tuple, optional): The Parquet codecs to compare. Defaults to ('snappy', 'zstd').
+    Returns:
+        list: One dictionary per format with the keys 'format', 'seconds' and 'bytes'.
+    """
+    import main  # imported here so the writer itself does not pull in Faker
+
+    accounts = main.generate_dim_account(1000, customer_ids=list(range(1, 1001)))
+    batches = list(main.iter_chunks(main.generate_fact_transaction, num_records, accounts, main.generate_dim_date(),
+                                    main.generate_dim_transaction_type(), main.generate_dim_channel(),
+                                    main.generate_dim_location(50), main.generate_dim_currency()))
+    results = []
+
+    start = time.perf_counter()
+    main.write_to_csv(iter(batches), 'fact_transactions.csv', folder_name=folder_name, fieldnames=schemas.fieldnames('fact_transactions'))
+    results.append({'format': 'csv', 'seconds': time.perf_counter() - start,
+                    'bytes': os.path.getsize(os.path.join(folder_name, 'fact_transactions.csv'))})
+
+    for compression in compressions:
+        file_name = f'fact_transactions.{compression}.parquet'
+        start = time.perf_counter()
+        write_to_parquet(iter(batches), file_name, 'fact_transactions', folder_name=folder_name, compression=compression)
+        results.append({'format': f'parquet/{compression}', 'seconds': time.perf_counter() - start,
+                        'bytes': os.path.getsize(os.path.join(folder_name, file_name))})
+
+    for result in results:
+        print(f"{result['format']:<16} {result['seconds']:8.2f}s {result['bytes'] / 1e6:10.1f} MB")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare CSV and Parquet output for fact_transactions.')
+    parser.add_argument('--rows', type=int, default=1000000, help='number of fact_transactions rows to write')
+    parser.add_argument('--folder', default='bench', help='scratch folder for the output files')
+    args = parser.parse_args()
+    benchmark_formats(args.rows, args.folder)
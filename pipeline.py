@@ -0,0 +1,340 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import block_compression
+import csv_encoder
+import schemas
+
+
+# Pipelined table writing: generate -> encode -> compress -> write or upload.
+#
+# run_pipeline() connects the stages with bounded queues. Each stage runs on its own worker threads (CPU-heavy
+# stages can hand their work to a process pool instead), so generating the next batch overlaps with encoding,
+# compressing and writing the previous ones, and the wall time of a table approaches that of its slowest stage
+# instead of the sum of all of them. The queues provide backpressure: a stage that gets ahead blocks once its
+# output queue is full, so memory stays bounded by a few batches per stage. Batches carry a sequence number and
+# the last stage restores their order, so the output is the same as that of the sequential writers.
+#
+# The first error in any stage cancels the others: every worker stops at its next queue operation, the batch
+# source is closed, and the error is raised to the caller. Per-stage metrics show where the time goes: 'busy' is
+# time spent working, 'starved' time spent waiting for input, 'blocked' time spent waiting for room downstream.
+# The bottleneck is the stage with utilization near 1; the stages before it are blocked and those after starved.
+
+DEFAULT_QUEUE_SIZE = 4
+_POLL_SECONDS = 0.05
+_DONE = object()
+
+
+class Cancelled(Exception):
+    """Raised inside a stage when another stage has failed."""
+
+
+class PipelineStage:
+    """
+    One step of a pipeline.
+    Parameters:
+        name (str): The stage name, used in the metrics.
+        fn (callable): Turns one item into the next stage's item.
+        workers (int, optional): Worker threads. Defaults to 1.
+        ordered (bool, optional): Process items in their original order; needs a single worker. Defaults to False.
+        pool (concurrent.futures.Executor, optional): Run fn on this executor, e.g. a ProcessPoolExecutor for
+            work that holds the GIL; each worker thread then drives one task at a time. Defaults to None.
+    """
+
+    def __init__(self, name, fn, workers=1, ordered=False, pool=None):
+        if ordered and workers != 1:
+            raise ValueError(f'stage {name!r} is ordered and needs exactly one worker')
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.ordered = ordered
+        self.pool = pool
+
+
+class _StageMetrics:
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0
+        self.starved = 0.0
+        self.blocked = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, busy=0.0, starved=0.0, blocked=0.0, items=0):
+        with self._lock:
+            self.busy += busy
+            self.starved += starved
+            self.blocked += blocked
+            self.items += items
+
+    def report(self, seconds):
+        capacity = seconds * self.workers
+        return {
+            'stage': self.name,
+            'workers': self.workers,
+            'items': self.items,
+            'busy_seconds': round(self.busy, 3),
+            'starved_seconds': round(self.starved, 3),
+            'blocked_seconds': round(self.blocked, 3),
+            'utilization': round(self.busy / capacity, 3) if capacity else 0.0,
+        }
+
+
+def _put(q, item, cancel):
+    while True:
+        if cancel.is_set():
+            raise Cancelled()
+        try:
+            q.put(item, timeout=_POLL_SECONDS)
+            return
+        except queue.Full:
+            pass
+
+
+def _get(q, cancel):
+    while True:
+        if cancel.is_set():
+            raise Cancelled()
+        try:
+            return q.get(timeout=_POLL_SECONDS)
+        except queue.Empty:
+            pass
+
+
+def run_pipeline(source, stages, queue_size=DEFAULT_QUEUE_SIZE, source_name='generate'):
+    """
+    Pushes every item of `source` through the stages, each stage on its own threads, with bounded queues in between.
+    Parameters:
+        source (iterable): The items, e.g. batches from main.iter_chunks; consumed on a thread of its own.
+        stages (list): PipelineStage objects; the result of the last one is discarded, so it should be a sink.
+        queue_size (int, optional): Items buffered between two stages. Defaults to 4.
+        source_name (str, optional): The name of the source in the metrics. Defaults to 'generate'.
+    Returns:
+        dict: 'seconds' (wall time) and 'stages', the metrics of the source and of every stage.
+    """
+    cancel = threading.Event()
+    errors = []
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    metrics = [_StageMetrics(source_name, 1)] + [_StageMetrics(stage.name, stage.workers) for stage in stages]
+    start = time.perf_counter()
+
+    def fail(error):
+        if not isinstance(error, Cancelled):
+            errors.append(error)
+        cancel.set()
+
+    def produce():
+        stage_metrics = metrics[0]
+        iterator = iter(source)
+        try:
+            for seq in range(1 << 62):
+                started = time.perf_counter()
+                item = next(iterator, _DONE)
+                stage_metrics.add(busy=time.perf_counter() - started)
+                if item is _DONE:
+                    break
+                started = time.perf_counter()
+                _put(queues[0], (seq, item), cancel)
+                stage_metrics.add(blocked=time.perf_counter() - started, items=1)
+            _put(queues[0], _DONE, cancel)
+        except BaseException as error:
+            fail(error)
+        finally:
+            if cancel.is_set() and hasattr(iterator, 'close'):
+                iterator.close()  # lets generator-based sources release what they hold
+
+    def consume(index, remaining):
+        stage, stage_metrics = stages[index], metrics[index + 1]
+        inbox = queues[index]
+        outbox = queues[index + 1] if index + 1 < len(stages) else None
+        pending, next_seq = {}, 0
+        try:
+            while True:
+                started = time.perf_counter()
+                entry = _get(inbox, cancel)
+                stage_metrics.add(starved=time.perf_counter() - started)
+                if entry is _DONE:
+                    _put(inbox, _DONE, cancel)  # for the other workers of this stage
+                    break
+                if stage.ordered:
+                    pending[entry[0]] = entry[1]
+                    ready = []
+                    while next_seq in pending:
+                        ready.append((next_seq, pending.pop(next_seq)))
+                        next_seq += 1
+                else:
+                    ready = [entry]
+                for seq, item in ready:
+                    started = time.perf_counter()
+                    result = stage.pool.submit(stage.fn, item).result() if stage.pool else stage.fn(item)
+                    stage_metrics.add(busy=time.perf_counter() - started, items=1)
+                    if outbox is not None:
+                        started = time.perf_counter()
+                        _put(outbox, (seq, result), cancel)
+                        stage_metrics.add(blocked=time.perf_counter() - started)
+            with remaining[1]:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last and outbox is not None:
+                _put(outbox, _DONE, cancel)
+        except BaseException as error:
+            fail(error)
+
+    threads = [threading.Thread(target=produce, name=f'pipeline-{source_name}', daemon=True)]
+    for index, stage in enumerate(stages):
+        remaining = [stage.workers, threading.Lock()]
+        threads.extend(threading.Thread(target=consume, args=(index, remaining), name=f'pipeline-{stage.name}-{i}',
+                                        daemon=True) for i in range(stage.workers))
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    except BaseException as error:  # e.g. KeyboardInterrupt in the calling thread
+        fail(error)
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
+    seconds = time.perf_counter() - start
+    return {'seconds': round(seconds, 3), 'stages': [stage_metrics.report(seconds) for stage_metrics in metrics]}
+
+
+def encode_batch(batch, fieldnames):
+    """
+    Returns:
+        bytes: A batch of records, tuples or columns (a dict of arrays) encoded as pipe-delimited CSV lines.
+    """
+    if isinstance(batch, dict):
+        batch = list(zip(*(batch[name].tolist() for name in fieldnames)))
+    return csv_encoder.encode_rows(batch, fieldnames).encode('utf-8')
+
+
+class _Sink:
+    # writes the header and then the encoded (and compressed) batches, in order, to a file or an S3 object; the
+    # output is only opened for the first batch, so an empty table writes no file, as main.write_to_csv does
+
+    def __init__(self, open_raw, fieldnames, compression):
+        self.open_raw = open_raw
+        self.raw = None
+        self.bytes_written = 0
+        header = csv_encoder.encode_rows([], fieldnames, header=True).encode('utf-8')
+        # compressed, the header is a block of its own, as block_compression.header_block_size expects
+        self.header = block_compression.compress_block(header, compression) if compression else header
+
+    def open(self):
+        self.raw = self.open_raw()
+        self.raw.write(self.header)
+        self.bytes_written += len(self.header)
+
+    def write(self, data):
+        if self.raw is None:
+            self.open()
+        self.raw.write(data)
+        self.bytes_written += len(data)
+
+
+def write_table_pipelined(batches, table, folder_name='data', compression=None, s3_bucket=None, s3_client=None,
+                          encode_workers=1, encode_processes=False, compress_workers=None,
+                          queue_size=DEFAULT_QUEUE_SIZE):
+    """
+    Writes a table as pipe-delimited CSV through a generate -> encode -> compress -> write/upload pipeline.
+    The output has the same rows and header as main.write_table, and like it, an empty table writes no local file
+    (S3 still gets a header-only object, as from stream_upload.stream_table_to_s3); compressed, every batch is one
+    gzip member or zstd frame.
+    Parameters:
+        batches (iterable): Batches of records, tuples in schema order or column dicts, e.g. from main.iter_chunks.
+        table (str): The table name in schemas.py; the file is <table>.csv[.gz|.zst].
+        folder_name (str, optional): The local folder. Defaults to 'data'.
+        compression (str, optional): 'gzip' or 'zstd'. Defaults to None.
+        s3_bucket (str, optional): Upload to <table>/<file> in this bucket instead of writing locally. Defaults to None.
+        s3_client (botocore.client.S3, optional): The S3 client. Defaults to s3_loader.create_s3_client().
+        encode_workers (int, optional): Encoder workers. Defaults to 1.
+        encode_processes (bool, optional): Encode in worker processes instead of threads; CSV encoding holds the
+            GIL, so this is what spreads it over several CPUs. Defaults to False.
+        compress_workers (int, optional): Compression threads. Defaults to the number of CPUs.
+        queue_size (int, optional): Batches buffered between two stages. Defaults to 4.
+    Returns:
+        dict: 'path' (file path or S3 key), 'bytes', 'seconds' and the per-stage 'stages' metrics.
+    """
+    fieldnames = schemas.fieldnames(table)
+    file_name = block_compression.compressed_name(f'{table}.csv', compression)
+    pool = ProcessPoolExecutor(max_workers=encode_workers) if encode_processes else None
+    if s3_bucket:
+        import s3_loader  # only S3 output needs boto3
+        import stream_upload
+        path = s3_loader.s3_key(file_name)
+        s3_client = s3_client or s3_loader.create_s3_client()
+
+        def open_raw():
+            return stream_upload.S3MultipartWriter(s3_client, s3_bucket, path)
+    else:
+        path = os.path.join(folder_name, file_name)
+
+        def open_raw():
+            os.makedirs(folder_name, exist_ok=True)
+            return open(path, 'wb')
+    sink = _Sink(open_raw, fieldnames, compression)
+    if s3_bucket:
+        sink.open()
+    # like the sequential writers, batches without rows are skipped
+    batches = (batch for batch in batches if _num_rows(batch))
+    try:
+        stages = [PipelineStage('encode', _Encoder(fieldnames), workers=encode_workers, pool=pool)]
+        if compression:
+            stages.append(PipelineStage('compress', _Compressor(compression), workers=compress_workers or os.cpu_count() or 1))
+        stages.append(PipelineStage('upload' if s3_bucket else 'write', sink.write, ordered=True))
+        report = run_pipeline(batches, stages, queue_size=queue_size)
+    except BaseException:
+        if s3_bucket:
+            sink.raw.abort()  # no partial object is left behind
+        elif sink.raw is not None:
+            sink.raw.close()
+            os.remove(path)
+        raise
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+    if sink.raw is not None:
+        sink.raw.close()
+    return {'path': path, 'bytes': sink.bytes_written, **report}
+
+
+def _num_rows(batch):
+    return len(next(iter(batch.values()), ())) if isinstance(batch, dict) else len(batch)
+
+
+class _Encoder:
+    # a picklable callable, so the encode stage can run in worker processes
+
+    def __init__(self, fieldnames):
+        self.fieldnames = fieldnames
+
+    def __call__(self, batch):
+        return encode_batch(batch, self.fieldnames)
+
+
+class _Compressor:
+    def __init__(self, codec):
+        self.codec = codec
+
+    def __call__(self, data):
+        return block_compression.compress_block(data, self.codec)
+
+
+def print_report(table, report):
+    """
+    Prints the per-stage metrics of write_table_pipelined() or run_pipeline().
+    Parameters:
+        table (str): The table name.
+        report (dict): The returned report.
+    """
+    print(f"{table}: {report['seconds']:.2f}s")
+    print(f"  {'stage':<10}{'workers':>8}{'items':>8}{'busy':>9}{'starved':>9}{'blocked':>9}{'util':>7}")
+    for stage in report['stages']:
+        print(f"  {stage['stage']:<10}{stage['workers']:>8}{stage['items']:>8}{stage['busy_seconds']:>9.2f}"
+              f"{stage['starved_seconds']:>9.2f}{stage['blocked_seconds']:>9.2f}{stage['utilization']:>7.0%}")
@@ -1,42 +1,356 @@
+import argparse
 import boto3
+import hashlib
+import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-# AWS credentials and S3 configuration
-aws_access_key_id = 'YOUR_ACCESS_KEY'
-aws_secret_access_key = 'YOUR_PASSOWRD'
-bucket_name = 'NAME OF YOUR S3 BUCKET'
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from s3transfer.utils import ChunksizeAdjuster
+
+import block_compression
+import schemas
+
+# AWS credentials and S3 configuration (environment variables override the placeholders)
+aws_access_key_id = os.environ.get('AWS_ACCESS_KEY_ID', 'YOUR_ACCESS_KEY')
+aws_secret_access_key = os.environ.get('AWS_SECRET_ACCESS_KEY', 'YOUR_PASSOWRD')
+bucket_name = os.environ.get('AWS_S3_BUCKET', 'NAME OF YOUR S3 BUCKET')
 base_s3_directory = 'BUCKET_DIRECTORY'
 
 # Default to 'us-east-1' if region is not known
-region_name = 'YOUR_REGION'
+region_name = os.environ.get('AWS_REGION', 'YOUR_REGION')
 
-# Initialize the S3 client
-s3_client = boto3.client(
-    's3',
-    aws_access_key_id=aws_access_key_id,
-    aws_secret_access_key=aws_secret_access_key,
-    region_name=region_name
-)
+# Set to a MinIO/moto server URL to load into a local S3 stand-in
+endpoint_url = os.environ.get('S3_ENDPOINT_URL')
 
 # Local directory where the CSV files are stored
 local_directory = '/Users/divinesam/dbt_redshift_dw/data'
 
-# Check if the local directory exists
-if not os.path.exists(local_directory):
-    print(f'Local directory {local_directory} does not exist.')
-else:
-    # Iterate over CSV files in the local directory
-    for filename in os.listdir(local_directory):
-        if filename.endswith('.csv'):
-            local_file_path = os.path.join(local_directory, filename)
-            folder_name = filename.split('.')[0]
-            s3_file_path = os.path.join(folder_name, filename)
-            
-            print(f'Uploading {local_file_path} to s3://{bucket_name}/{s3_file_path}')
-            
+# Transfer tuning
+MAX_WORKERS = 8                 # files uploaded concurrently
+MULTIPART_CHUNKSIZE_MB = 64     # size of each multipart part
+MULTIPART_THRESHOLD_MB = 64     # files larger than this are uploaded in parts
+MAX_CONCURRENCY_PER_FILE = 4    # parts of one file uploaded concurrently
+MAX_ATTEMPTS = 5                # attempts per file, including the first
+BACKOFF_BASE_SECONDS = 1.0      # wait before retry n is BACKOFF_BASE_SECONDS * 2 ** (n - 1)
+
+# Sync mode keeps size, mtime and content hash of every uploaded file here, inside the local directory
+MANIFEST_FILE_NAME = '.s3_manifest.json'
+
+
+def create_s3_client(endpoint_url=endpoint_url, max_pool_connections=MAX_WORKERS * MAX_CONCURRENCY_PER_FILE):
+    """
+    Creates the S3 client used by the loader.
+    Parameters:
+        endpoint_url (str, optional): Custom endpoint, e.g. a MinIO server. Defaults to S3_ENDPOINT_URL, or AWS if unset.
+        max_pool_connections (int, optional): HTTP connection pool size; should cover every concurrent part upload.
+    Returns:
+        botocore.client.S3: The S3 client.
+    """
+    return boto3.client(
+        's3',
+        aws_access_key_id=aws_access_key_id,
+        aws_secret_access_key=aws_secret_access_key,
+        region_name=region_name,
+        endpoint_url=endpoint_url,
+        config=Config(max_pool_connections=max_pool_connections, retries={'max_attempts': MAX_ATTEMPTS, 'mode': 'adaptive'}),
+    )
+
+
+def create_transfer_config(multipart_chunksize_mb=MULTIPART_CHUNKSIZE_MB, multipart_threshold_mb=MULTIPART_THRESHOLD_MB,
+                           max_concurrency=MAX_CONCURRENCY_PER_FILE):
+    """
+    Builds the boto3 TransferConfig that controls multipart uploads of a single file.
+    Parameters:
+        multipart_chunksize_mb (int, optional): Size of each part, in MB.
+        multipart_threshold_mb (int, optional): Files larger than this are uploaded in parts, in MB.
+        max_concurrency (int, optional): Parts of one file uploaded concurrently.
+    Returns:
+        boto3.s3.transfer.TransferConfig: The transfer configuration.
+    """
+    mb = 1024 * 1024
+    return TransferConfig(multipart_threshold=multipart_threshold_mb * mb, multipart_chunksize=multipart_chunksize_mb * mb,
+                          max_concurrency=max_concurrency, use_threads=max_concurrency > 1)
+
+
+def s3_key(filename, prefix=''):
+    """
+    Returns the S3 key of a generated file: <table>/<file name>, e.g. fact_loans/fact_loans.csv.
+    Files in sub-folders keep their relative path, e.g. fact_loans/date_id=1828/part-00000.csv.
+    Parameters:
+        filename (str): The local file name, or its path relative to the data directory.
+        prefix (str, optional): Key prefix to put in front of the table folder. Defaults to ''.
+    Returns:
+        str: The S3 key.
+    """
+    if os.sep in filename or '/' in filename:
+        return '/'.join(part for part in (prefix.strip('/'), filename.replace(os.sep, '/')) if part)
+    folder_name = filename.split('.')[0]
+    return '/'.join(part for part in (prefix.strip('/'), folder_name, filename) if part)
+
+
+def upload_file(s3_client, local_file_path, bucket, key, transfer_config=None, max_attempts=MAX_ATTEMPTS,
+                backoff_base_seconds=BACKOFF_BASE_SECONDS):
+    """
+    Uploads one file, retrying with exponential backoff if the whole transfer fails.
+    Parameters:
+        s3_client (botocore.client.S3): The S3 client.
+        local_file_path (str): The file to upload.
+        bucket (str): The target bucket.
+        key (str): The target key.
+        transfer_config (TransferConfig, optional): Multipart settings. Defaults to create_transfer_config().
+        max_attempts (int, optional): Attempts before giving up, including the first.
+        backoff_base_seconds (float, optional): Wait before the first retry; doubled on every further retry.
+    Returns:
+        int: The number of bytes uploaded.
+    """
+    transfer_config = transfer_config or create_transfer_config()
+    for attempt in range(1, max_attempts + 1):
+        try:
+            s3_client.upload_file(local_file_path, bucket, key, Config=transfer_config)
+            return os.path.getsize(local_file_path)
+        except Exception as e:
+            if attempt == max_attempts:
+                raise
+            wait = backoff_base_seconds * 2 ** (attempt - 1)
+            print(f'Upload of {local_file_path} failed ({e}), retrying in {wait:.1f}s')
+            time.sleep(wait)
+
+
+def list_upload_files(directory, extensions=block_compression.CSV_EXTENSIONS):
+    """
+    Lists the generated files in a directory that should be uploaded, including shard part-files and
+    date_id= partitions in table sub-folders. Folders starting with '_' or '.' (run state, caches) are skipped.
+    Parameters:
+        directory (str): The local directory.
+        extensions (tuple, optional): File name endings to upload. Defaults to .csv, .csv.gz and .csv.zst.
+    Returns:
+        list: The file paths relative to the directory, sorted.
+    """
+    filenames = []
+    for root, folders, files in os.walk(directory):
+        folders[:] = [folder for folder in folders if not folder.startswith(('_', '.'))]
+        filenames.extend(os.path.relpath(os.path.join(root, filename), directory)
+                         for filename in files if filename.endswith(extensions))
+    return sorted(filenames)
+
+
+def _upload_files(s3_client, directory, filenames, bucket, prefix, max_workers, transfer_config, max_attempts,
+                  backoff_base_seconds, on_uploaded=None):
+    uploaded, failed, total_bytes = [], [], 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {}
+        for filename in filenames:
+            key = s3_key(filename, prefix)
+            print(f'Uploading {os.path.join(directory, filename)} to s3://{bucket}/{key}')
+            futures[pool.submit(upload_file, s3_client, os.path.join(directory, filename), bucket, key,
+                                transfer_config, max_attempts, backoff_base_seconds)] = (filename, key)
+        for future in as_completed(futures):
+            filename, key = futures[future]
             try:
-                # Upload the file to S3
-                s3_client.upload_file(local_file_path, bucket_name, s3_file_path)
-                print(f'Uploaded {filename} to s3://{bucket_name}/{s3_file_path}')
+                total_bytes += future.result()
+                uploaded.append(filename)
+                print(f'Uploaded {filename} to s3://{bucket}/{key}')
+                if on_uploaded:
+                    on_uploaded(filename)
             except Exception as e:
+                failed.append(filename)
                 print(f'Failed to upload {filename}: {str(e)}')
+    seconds = time.perf_counter() - start
+    mb_per_sec = total_bytes / (1024 * 1024) / seconds if seconds else 0.0
+    print(f'Uploaded {len(uploaded)} files, {total_bytes / (1024 * 1024):.1f} MB in {seconds:.2f}s ({mb_per_sec:.1f} MB/s); {len(failed)} failed')
+    return {'uploaded': uploaded, 'failed': failed, 'bytes': total_bytes, 'seconds': seconds, 'mb_per_sec': mb_per_sec}
+
+
+def upload_directory(directory=local_directory, bucket=bucket_name, s3_client=None, prefix='', max_workers=MAX_WORKERS,
+                     transfer_config=None, max_attempts=MAX_ATTEMPTS, backoff_base_seconds=BACKOFF_BASE_SECONDS):
+    """
+    Uploads every generated file in a directory to S3, many files at a time.
+    Parameters:
+        directory (str, optional): The local directory. Defaults to local_directory.
+        bucket (str, optional): The target bucket. Defaults to bucket_name.
+        s3_client (botocore.client.S3, optional): The S3 client. Defaults to create_s3_client().
+        prefix (str, optional): Key prefix to put in front of the table folders. Defaults to ''.
+        max_workers (int, optional): Files uploaded concurrently. Defaults to MAX_WORKERS.
+        transfer_config (TransferConfig, optional): Multipart settings for each file. Defaults to create_transfer_config().
+        max_attempts (int, optional): Attempts per file, including the first.
+        backoff_base_seconds (float, optional): Wait before the first retry of a file.
+    Returns:
+        dict: 'uploaded' and 'failed' file lists, 'bytes', 'seconds' and 'mb_per_sec'.
+    """
+    if not os.path.exists(directory):
+        print(f'Local directory {directory} does not exist.')
+        return {'uploaded': [], 'failed': [], 'bytes': 0, 'seconds': 0.0, 'mb_per_sec': 0.0}
+    return _upload_files(s3_client or create_s3_client(), directory, list_upload_files(directory), bucket, prefix,
+                         max_workers, transfer_config or create_transfer_config(), max_attempts, backoff_base_seconds)
+
+
+def expected_etag(local_file_path, transfer_config=None):
+    """
+    Computes the ETag S3 will report for a file uploaded with the given transfer settings: the MD5 of the file for
+    a single-part upload, or the MD5 of the part MD5s followed by '-<part count>' for a multipart upload.
+    Parameters:
+        local_file_path (str): The file.
+        transfer_config (TransferConfig, optional): The multipart settings the file is uploaded with.
+    Returns:
+        str: The ETag, without quotes.
+    """
+    transfer_config = transfer_config or create_transfer_config()
+    size = os.path.getsize(local_file_path)
+    if size < transfer_config.multipart_threshold:
+        digest = hashlib.md5()
+        with open(local_file_path, 'rb') as f:
+            for block in iter(lambda: f.read(8 * 1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    part_size = ChunksizeAdjuster().adjust_chunksize(transfer_config.multipart_chunksize, size)
+    with open(local_file_path, 'rb') as f:
+        part_digests = [hashlib.md5(part).digest() for part in iter(lambda: f.read(part_size), b'')]
+    return f'{hashlib.md5(b"".join(part_digests)).hexdigest()}-{len(part_digests)}'
+
+
+def load_manifest(directory):
+    """
+    Reads the sync manifest of a directory.
+    Parameters:
+        directory (str): The local directory.
+    Returns:
+        dict: File name -> {'size', 'mtime', 'etag'}; empty if there is no manifest yet.
+    """
+    manifest_path = os.path.join(directory, MANIFEST_FILE_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(directory, manifest):
+    """
+    Writes the sync manifest of a directory atomically, so an interrupted run never leaves a torn file.
+    Parameters:
+        directory (str): The local directory.
+        manifest (dict): File name -> {'size', 'mtime', 'etag'}.
+    """
+    manifest_path = os.path.join(directory, MANIFEST_FILE_NAME)
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def list_remote_objects(s3_client, bucket, prefix=''):
+    """
+    Lists the objects under a prefix.
+    Parameters:
+        s3_client (botocore.client.S3): The S3 client.
+        bucket (str): The bucket.
+        prefix (str, optional): Only list keys under this prefix. Defaults to ''.
+    Returns:
+        dict: Key -> {'etag', 'size'}.
+    """
+    objects = {}
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix.strip('/') + '/' if prefix.strip('/') else ''):
+        for obj in page.get('Contents', []):
+            objects[obj['Key']] = {'etag': obj['ETag'].strip('"'), 'size': obj['Size']}
+    return objects
+
+
+def is_generated_key(key, prefix=''):
+    """
+    Tells whether a key lies in the folder of a generated table, i.e. is one sync_directory() may delete.
+    Other objects in a shared bucket, and the sync manifest, are never touched.
+    Parameters:
+        key (str): The S3 key.
+        prefix (str, optional): Key prefix in front of the table folders. Defaults to ''.
+    Returns:
+        bool: True if the key is under <prefix>/<table>/ for a table of schemas.SCHEMAS or schemas.AGGREGATE_SCHEMAS.
+    """
+    if key == s3_key(MANIFEST_FILE_NAME, prefix):
+        return False
+    folders = tuple(s3_key(table + '/', prefix) for table in [*schemas.SCHEMAS, *schemas.AGGREGATE_SCHEMAS])
+    return key.startswith(folders)
+
+
+def sync_directory(directory=local_directory, bucket=bucket_name, s3_client=None, prefix='', delete=False,
+                   max_workers=MAX_WORKERS, transfer_config=None, max_attempts=MAX_ATTEMPTS,
+                   backoff_base_seconds=BACKOFF_BASE_SECONDS):
+    """
+    Uploads only the files that are new or changed since they were last uploaded, so re-runs are cheap.
+    A file is skipped when the object at its key already has the file's size and expected ETag. Hashes are cached
+    in the directory's manifest and only recomputed for files whose size or mtime changed.
+    Parameters:
+        directory (str, optional): The local directory. Defaults to local_directory.
+        bucket (str, optional): The target bucket. Defaults to bucket_name.
+        s3_client (botocore.client.S3, optional): The S3 client. Defaults to create_s3_client().
+        prefix (str, optional): Key prefix to put in front of the table folders. Defaults to ''.
+        delete (bool, optional): Also delete objects in the generated table folders under the prefix whose local file no
+            longer exists; see is_generated_key(). Defaults to False.
+        max_workers, transfer_config, max_attempts, backoff_base_seconds: As for upload_directory.
+    Returns:
+        dict: As for upload_directory, plus 'skipped' and 'deleted' file/key lists.
+    """
+    if not os.path.exists(directory):
+        print(f'Local directory {directory} does not exist.')
+        return {'uploaded': [], 'failed': [], 'skipped': [], 'deleted': [], 'bytes': 0, 'seconds': 0.0, 'mb_per_sec': 0.0}
+    s3_client = s3_client or create_s3_client()
+    transfer_config = transfer_config or create_transfer_config()
+    manifest = load_manifest(directory)
+    remote = list_remote_objects(s3_client, bucket, prefix)
+
+    local_files = list_upload_files(directory)
+    entries, to_upload, skipped = {}, [], []
+    for filename in local_files:
+        stat = os.stat(os.path.join(directory, filename))
+        entry = manifest.get(filename)
+        if not entry or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime_ns:
+            entry = {'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+                     'etag': expected_etag(os.path.join(directory, filename), transfer_config)}
+        entries[filename] = entry
+        remote_object = remote.get(s3_key(filename, prefix))
+        if remote_object and remote_object['etag'] == entry['etag'] and remote_object['size'] == entry['size']:
+            skipped.append(filename)
+        else:
+            to_upload.append(filename)
+
+    # only files known to be in the bucket go into the manifest, so a failed run is retried next time
+    new_manifest = {filename: entries[filename] for filename in skipped}
+    lock = threading.Lock()
+
+    def record_upload(filename):
+        with lock:
+            new_manifest[filename] = entries[filename]
+            save_manifest(directory, new_manifest)
+
+    print(f'{len(to_upload)} new or changed files to upload, {len(skipped)} unchanged')
+    result = _upload_files(s3_client, directory, to_upload, bucket, prefix, max_workers, transfer_config,
+                           max_attempts, backoff_base_seconds, on_uploaded=record_upload)
+    save_manifest(directory, new_manifest)
+
+    deleted = []
+    if delete:
+        local_keys = {s3_key(filename, prefix) for filename in local_files}
+        deleted = sorted(key for key in remote if key not in local_keys and is_generated_key(key, prefix))
+        for i in range(0, len(deleted), 1000):  # delete_objects takes at most 1000 keys
+            s3_client.delete_objects(Bucket=bucket, Delete={'Objects': [{'Key': key} for key in deleted[i:i + 1000]]})
+        for key in deleted:
+            print(f'Deleted s3://{bucket}/{key}')
+    result.update({'skipped': skipped, 'deleted': deleted})
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Upload the generated data files to S3.')
+    parser.add_argument('--directory', default=local_directory, help='local directory with the generated files')
+    parser.add_argument('--bucket', default=bucket_name, help='target bucket')
+    parser.add_argument('--prefix', default='', help='key prefix in front of the table folders')
+    parser.add_argument('--sync', action='store_true', help='upload only new or changed files')
+    parser.add_argument('--delete', action='store_true', help='with --sync, delete objects in the table folders whose local file is gone')
+    args = parser.parse_args()
+    if args.sync:
+        sync_directory(args.directory, args.bucket, prefix=args.prefix, delete=args.delete)
+    else:
+        upload_directory(args.directory, args.bucket, prefix=args.prefix)
@@ -0,0 +1,217 @@
+# Column layout of every table written by main.py, keyed by table name (the CSV file name without extension).
+# Column types:
+#   - 'int': integer keys and counts
+#   - 'money': floats rounded to 2 decimal places
+#   - 'float': other floats
+#   - 'str': free text and categorical values
+#   - 'date': ISO 'YYYY-MM-DD' strings
+SCHEMAS = {
+    'customers': [
+        ('customer_id', 'int'),
+        ('first_name', 'str'),
+        ('last_name', 'str'),
+        ('email', 'str'),
+        ('address', 'str'),
+        ('city', 'str'),
+        ('state', 'str'),
+        ('postal_code', 'str'),
+        ('phone_number', 'str'),
+    ],
+    'dates': [
+        ('date_id', 'int'),
+        ('date', 'date'),
+        ('day', 'int'),
+        ('month', 'int'),
+        ('year', 'int'),
+        ('week_day', 'int'),
+    ],
+    'channels': [
+        ('channel_id', 'int'),
+        ('channel_name', 'str'),
+    ],
+    'transaction_types': [
+        ('transaction_type_id', 'int'),
+        ('transaction_type_name', 'str'),
+    ],
+    'locations': [
+        ('location_id', 'int'),
+        ('city', 'str'),
+        ('state', 'str'),
+        ('country', 'str'),
+        ('postal_code', 'str'),
+    ],
+    'currencies': [
+        ('currency_id', 'int'),
+        ('currency_code', 'str'),
+        ('currency_name', 'str'),
+    ],
+    'accounts': [
+        ('account_id', 'int'),
+        ('customer_id', 'int'),
+        ('account_number', 'int'),
+        ('account_type', 'str'),
+        ('account_balance', 'money'),
+        ('credit_score', 'int'),
+    ],
+    'investment_types': [
+        ('investment_type_id', 'int'),
+        ('investment_type_name', 'str'),
+    ],
+    'loans': [
+        ('loan_id', 'int'),
+        ('loan_type', 'str'),
+        ('loan_amount', 'money'),
+        ('interest_rate', 'money'),
+    ],
+    'fact_transactions': [
+        ('transaction_id', 'int'),
+        ('date_id', 'int'),
+        ('transaction_type_id', 'int'),
+        ('account_id', 'int'),
+        ('channel_id', 'int'),
+        ('location_id', 'int'),
+        ('currency_id', 'int'),
+        ('transaction_amount', 'money'),
+        ('transaction_status', 'str'),
+    ],
+    'fact_investments': [
+        ('investment_id', 'int'),
+        ('date_id', 'int'),
+        ('investment_type_id', 'int'),
+        ('account_id', 'int'),
+        ('location_id', 'int'),
+        ('currency_id', 'int'),
+        ('investment_amount', 'money'),
+        ('investment_return', 'money'),
+    ],
+    'fact_loans': [
+        ('loan_fact_id', 'int'),
+        ('date_id', 'int'),
+        ('loan_id', 'int'),
+        ('account_id', 'int'),
+        ('location_id', 'int'),
+        ('currency_id', 'int'),
+        ('loan_amount', 'money'),
+        ('loan_status', 'str'),
+    ],
+    'fact_customer_interactions': [
+        ('interaction_id', 'int'),
+        ('date_id', 'int'),
+        ('customer_id', 'int'),
+        ('channel_id', 'int'),
+        ('location_id', 'int'),
+        ('interaction_type', 'str'),
+        ('interaction_rating', 'int'),
+    ],
+    'fact_daily_balances': [
+        ('balance_id', 'int'),
+        ('date_id', 'int'),
+        ('account_id', 'int'),
+        ('currency_id', 'int'),
+        ('opening_balance', 'money'),
+        ('closing_balance', 'money'),
+        ('average_balance', 'float'),
+    ],
+}
+
+
+# Column layout of the KPI summary tables that aggregates.py maintains next to the facts; the group-by columns come
+# first and every other column is a mergeable measure (counts, sums, minimums and maximums). The transaction
+# aggregates leave out failed transactions.
+AGGREGATE_SCHEMAS = {
+    'agg_account_transactions': [
+        ('account_id', 'int'),
+        ('transaction_count', 'int'),
+        ('transaction_amount', 'money'),
+        ('first_date_id', 'int'),
+        ('last_date_id', 'int'),
+    ],
+    'agg_customer_transactions': [
+        ('customer_id', 'int'),
+        ('transaction_count', 'int'),
+        ('transaction_amount', 'money'),
+        ('first_date_id', 'int'),
+        ('last_date_id', 'int'),
+    ],
+    'agg_daily_channel_location': [
+        ('date_id', 'int'),
+        ('channel_id', 'int'),
+        ('location_id', 'int'),
+        ('transaction_count', 'int'),
+        ('transaction_amount', 'money'),
+    ],
+    'agg_loan_status': [
+        ('loan_type', 'str'),
+        ('loan_status', 'str'),
+        ('loan_count', 'int'),
+        ('loan_amount', 'money'),
+    ],
+    'agg_daily_interactions': [
+        ('date_id', 'int'),
+        ('channel_id', 'int'),
+        ('interaction_type', 'str'),
+        ('interaction_count', 'int'),
+        ('rating_total', 'int'),
+    ],
+}
+
+
+def columns(table):
+    """
+    Returns the column layout of a table or of a KPI summary table.
+    Parameters:
+        table (str): The table name, e.g. 'fact_transactions' or 'agg_loan_status'.
+    Returns:
+        list: (column name, column type) pairs, in output order.
+    """
+    return SCHEMAS[table] if table in SCHEMAS else AGGREGATE_SCHEMAS[table]
+
+
+def fieldnames(table):
+    """
+    Returns the column names of a table, in output order.
+    Parameters:
+        table (str): The table name, e.g. 'fact_transactions'.
+    Returns:
+        list: The column names.
+    """
+    return [name for name, _ in columns(table)]
+
+
+# table -> primary key column
+PRIMARY_KEYS = {table: columns[0][0] for table, columns in SCHEMAS.items()}
+
+# table -> {foreign key column: referenced dimension table}; the referenced column has the same name
+FOREIGN_KEYS = {
+    'accounts': {'customer_id': 'customers'},
+    'fact_transactions': {'date_id': 'dates', 'transaction_type_id': 'transaction_types', 'account_id': 'accounts',
+                          'channel_id': 'channels', 'location_id': 'locations', 'currency_id': 'currencies'},
+    'fact_investments': {'date_id': 'dates', 'investment_type_id': 'investment_types', 'account_id': 'accounts',
+                         'location_id': 'locations', 'currency_id': 'currencies'},
+    'fact_loans': {'date_id': 'dates', 'loan_id': 'loans', 'account_id': 'accounts', 'location_id': 'locations',
+                   'currency_id': 'currencies'},
+    'fact_customer_interactions': {'date_id': 'dates', 'customer_id': 'customers', 'channel_id': 'channels',
+                                   'location_id': 'locations'},
+    'fact_daily_balances': {'date_id': 'dates', 'account_id': 'accounts', 'currency_id': 'currencies'},
+}
+
+# table -> {column: (low, high)}, the inclusive range the generators draw numeric values from
+VALUE_RANGES = {
+    'dates': {'day': (1, 31), 'month': (1, 12), 'week_day': (1, 7)},
+    'accounts': {'account_number': (1000000000, 9999999999), 'account_balance': (0, 1000000), 'credit_score': (300, 850)},
+    'loans': {'loan_amount': (50, 500000), 'interest_rate': (1.5, 10)},
+    'fact_transactions': {'transaction_amount': (1, 10000)},
+    'fact_investments': {'investment_amount': (1000, 10000), 'investment_return': (-5000, 15000)},
+    'fact_loans': {'loan_amount': (5000, 500000)},
+    'fact_customer_interactions': {'interaction_rating': (1, 5)},
+    # fact_daily_balances has no fixed range: balances derived from transactions (balances.py) can be overdrawn
+}
+
+# table -> {column: allowed values} for categorical columns
+ALLOWED_VALUES = {
+    'accounts': {'account_type': ('Savings', 'Checking', 'Investment')},
+    'loans': {'loan_type': ('Mortgage', 'Personal', 'Auto', 'Student', 'Business', 'Other')},
+    'fact_transactions': {'transaction_status': ('Pending', 'Completed', 'Failed')},
+    'fact_loans': {'loan_status': ('Pending', 'Approved', 'Rejected')},
+    'fact_customer_interactions': {'interaction_type': ('Phone', 'Email', 'Chat', 'Website', 'Social Media', 'In-Person')},
+}
@@ -0,0 +1,168 @@
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import block_compression
+import csv_encoder
+import s3_loader
+import schemas
+
+
+# Generate-and-upload without touching local disk.
+#
+# S3MultipartWriter is a binary file object whose bytes go straight into an S3 multipart upload. Every time
+# part_size bytes have been written, the part is handed to a small thread pool and uploaded while the caller
+# keeps generating rows; at most max_parts_in_flight parts are buffered, so memory stays bounded.
+
+DEFAULT_PART_SIZE = 16 * 1024 * 1024  # S3 needs every part except the last to be at least 5 MB
+MAX_PARTS_IN_FLIGHT = 4
+
+
+class S3MultipartWriter(io.RawIOBase):
+    """
+    A writable binary file object that uploads its content to S3 as a multipart upload.
+    Objects smaller than one part are sent with a single put_object instead.
+    Parameters:
+        s3_client (botocore.client.S3): The S3 client.
+        bucket (str): The target bucket.
+        key (str): The target key.
+        part_size (int, optional): Bytes per part. Defaults to 16 MB.
+        max_parts_in_flight (int, optional): Parts buffered or uploading at the same time. Defaults to 4.
+        content_encoding (str, optional): Content-Encoding to store with the object, e.g. 'gzip'. Defaults to None.
+    Example:
+        >>> with S3MultipartWriter(s3_client, 'bucket', 'fact_loans/fact_loans.csv') as f:
+        ...     f.write(b'loan_fact_id|date_id|...\r\n')
+    """
+
+    def __init__(self, s3_client, bucket, key, part_size=DEFAULT_PART_SIZE, max_parts_in_flight=MAX_PARTS_IN_FLIGHT,
+                 content_encoding=None):
+        super().__init__()
+        if part_size < 5 * 1024 * 1024:
+            raise ValueError('part_size must be at least 5 MB')
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.content_encoding = content_encoding
+        self.bytes_written = 0
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._parts = []
+        self._pool = ThreadPoolExecutor(max_workers=max_parts_in_flight)
+        self._slots = threading.BoundedSemaphore(max_parts_in_flight)
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        self.bytes_written += len(data)
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            self._submit_part(part)
+        return len(data)
+
+    def _extra_args(self):
+        return {'ContentEncoding': self.content_encoding} if self.content_encoding else {}
+
+    def _submit_part(self, part):
+        if self._upload_id is None:
+            response = self.s3_client.create_multipart_upload(Bucket=self.bucket, Key=self.key, **self._extra_args())
+            self._upload_id = response['UploadId']
+        part_number = len(self._parts) + 1
+        self._slots.acquire()  # backpressure: wait while max_parts_in_flight parts are pending
+        future = self._pool.submit(self._upload_part, part_number, part)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._parts.append(future)
+
+    def _upload_part(self, part_number, part):
+        response = self.s3_client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                                              PartNumber=part_number, Body=part)
+        return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._upload_id is None:
+                self.s3_client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer), **self._extra_args())
+            else:
+                if self._buffer:
+                    self._submit_part(bytes(self._buffer))
+                parts = [future.result() for future in self._parts]
+                self.s3_client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                                                         MultipartUpload={'Parts': parts})
+            self._buffer = bytearray()
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self._pool.shutdown(wait=True)
+            super().close()
+
+    def abort(self):
+        """
+        Abandons the upload, so no partial object is left behind and S3 frees the uploaded parts.
+        """
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        if self._upload_id is not None:
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+            self._upload_id = None
+        self._buffer = bytearray()
+        super().close()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+def stream_table_to_s3(data, table, bucket, s3_client=None, prefix='', compress=False, part_size=DEFAULT_PART_SIZE):
+    """
+    Encodes a table as pipe-delimited CSV, identical to write_to_csv, and streams it into S3 as it is generated.
+    The key follows the s3_loader.py layout: <table>/<table>.csv, or <table>/<table>.csv.gz / .csv.zst when compressed.
+    Gzip streams are stored with Content-Encoding: gzip.
+    Parameters:
+        data (list, dict or iterable): Records (a list of dictionaries or of tuples in schema order), columns (a dict of arrays from columnar.py),
+            or an iterable of either, e.g. from main.iter_chunks.
+        table (str): The table name in schemas.py, e.g. 'fact_transactions'.
+        bucket (str): The target bucket.
+        s3_client (botocore.client.S3, optional): The S3 client. Defaults to s3_loader.create_s3_client().
+        prefix (str, optional): Key prefix to put in front of the table folder. Defaults to ''.
+        compress (bool or str, optional): Compress the stream on the fly in parallel blocks (see block_compression.py):
+            'gzip' (or True) or 'zstd'. Defaults to False.
+        part_size (int, optional): Bytes per multipart part. Defaults to 16 MB.
+    Returns:
+        dict: 'key', 'rows', 'bytes' (bytes sent to S3) and 'seconds'.
+    """
+    s3_client = s3_client or s3_loader.create_s3_client()
+    fieldnames = schemas.fieldnames(table)
+    codec = 'gzip' if compress is True else compress or None
+    key = s3_loader.s3_key(block_compression.compressed_name(f'{table}.csv', codec), prefix)
+    batches = iter([data]) if isinstance(data, (list, dict)) else iter(data)
+    rows = 0
+    start = time.perf_counter()
+    content_encoding = 'gzip' if codec == 'gzip' else None
+    with S3MultipartWriter(s3_client, bucket, key, part_size=part_size, content_encoding=content_encoding) as raw:
+        stream = block_compression.ParallelCompressor(raw, codec) if codec else raw
+        try:
+            text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+            text.write(csv_encoder.encode_rows([], fieldnames, header=True))
+            for batch in batches:
+                if isinstance(batch, dict):
+                    batch = list(zip(*(batch[name].tolist() for name in fieldnames)))
+                text.write(csv_encoder.encode_rows(batch, fieldnames))
+                rows += len(batch)
+            text.flush()
+            text.detach()  # leave closing the byte streams to us
+            if codec:
+                stream.close()  # writes the last compressed blocks into raw; raw itself stays open
+        finally:
+            if codec and not stream.closed:
+                stream.abort()  # the upload failed; don't leave the compression threads running
+    seconds = time.perf_counter() - start
+    print(f'Streamed {rows} rows of {table} to s3://{bucket}/{key} ({raw.bytes_written / (1024 * 1024):.1f} MB in {seconds:.2f}s)')
+    return {'key': key, 'rows': rows, 'bytes': raw.bytes_written, 'seconds': seconds}
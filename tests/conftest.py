@@ -0,0 +1,37 @@
+import shutil
+
+import pytest
+
+import main
+
+# a snapshot small enough to generate in well under a second: one year of dates and a few hundred facts
+SMALL_ROW_COUNTS = {
+    'customers': 40,
+    'accounts': 60,
+    'locations': 8,
+    'investment_types': 5,
+    'loans': 10,
+    'fact_transactions': 400,
+    'fact_investments': 50,
+    'fact_loans': 20,
+    'fact_customer_interactions': 60,
+    'fact_daily_balances': 100,
+}
+
+
+def generate_snapshot(folder, **kwargs):
+    options = {'seed': 7, 'row_counts': SMALL_ROW_COUNTS, 'start_year': 2024, 'end_year': 2024, 'columnar_mode': True,
+               'metrics_dir': None, 'dimension_cache_dir': None, **kwargs}
+    main.main(folder_name=str(folder), **options)
+    return folder
+
+
+@pytest.fixture(scope='session')
+def clean_snapshot(tmp_path_factory):
+    return generate_snapshot(tmp_path_factory.mktemp('snapshot'))
+
+
+@pytest.fixture
+def snapshot(clean_snapshot, tmp_path):
+    # a copy of the session snapshot that a test may change
+    return shutil.copytree(clean_snapshot, tmp_path / 'data')
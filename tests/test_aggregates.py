@@ -0,0 +1,98 @@
+from collections import defaultdict
+
+import numpy as np
+import pytest
+
+import aggregates
+import columnar
+import parallel
+
+NUM_ACCOUNTS = 50
+NUM_DAYS = 30
+
+
+@pytest.fixture
+def dimensions():
+    accounts = {'account_id': np.arange(1, NUM_ACCOUNTS + 1), 'customer_id': np.arange(NUM_ACCOUNTS) % 17 + 1}
+    loans = {'loan_id': np.arange(1, 7), 'loan_type': np.array(['Personal', 'Mortgage', 'Auto'] * 2)}
+    return accounts, loans
+
+
+def _transaction_batches(seed, num_records, chunk_size=97):
+    generate, primary_key, _ = parallel.FACT_TABLES['fact_transactions']
+    return list(columnar.iter_column_chunks(generate, num_records, np.arange(1, NUM_ACCOUNTS + 1), np.arange(1, NUM_DAYS + 1),
+                                            np.arange(1, 5), np.arange(1, 6), np.arange(1, 9), np.arange(1, 4),
+                                            rng=np.random.default_rng(seed), chunk_size=chunk_size,
+                                            id_alloc=parallel.IdAllocator(primary_key, seed=seed)))
+
+
+def _loan_batches(seed, num_records):
+    generate, primary_key, _ = parallel.FACT_TABLES['fact_loans']
+    return list(columnar.iter_column_chunks(generate, num_records, np.arange(1, NUM_ACCOUNTS + 1), np.arange(1, NUM_DAYS + 1),
+                                            np.arange(1, 7), np.arange(1, 9), np.arange(1, 4),
+                                            rng=np.random.default_rng(seed), chunk_size=41,
+                                            id_alloc=parallel.IdAllocator(primary_key, seed=seed)))
+
+
+def _assert_same_tables(left, right):
+    for name, columns in left.tables():
+        other = right.result(name)
+        assert list(columns) == list(other)
+        for column in columns:
+            np.testing.assert_array_equal(columns[column], other[column], err_msg=f'{name}.{column}')
+
+
+def test_merged_shards_match_a_single_pass(dimensions):
+    # more batches than MAX_PENDING_PARTS, so folding is exercised on both sides
+    shards = [(_transaction_batches(seed, 4000), _loan_batches(seed, 300)) for seed in (1, 2, 3)]
+    single = aggregates.KpiAggregator.from_dimensions(*dimensions)
+    merged = aggregates.KpiAggregator.from_dimensions(*dimensions)
+    for transactions, loans in shards:
+        for batch in transactions:
+            single.add('fact_transactions', batch)
+        for batch in loans:
+            single.add('fact_loans', batch)
+        shard = merged.for_table('fact_transactions')
+        for batch in transactions:
+            shard.add('fact_transactions', batch)
+        merged.merge(shard)
+        shard = merged.for_table('fact_loans')
+        for batch in loans:
+            shard.add('fact_loans', batch)
+        merged.merge(shard)
+    _assert_same_tables(single, merged)
+
+
+def test_saved_aggregates_continue_like_a_single_pass(dimensions, tmp_path):
+    first, second = _transaction_batches(4, 1500), _transaction_batches(5, 1500)
+    single = aggregates.KpiAggregator.from_dimensions(*dimensions)
+    for batch in first + second:
+        single.add('fact_transactions', batch)
+    aggregator = aggregates.KpiAggregator.from_dimensions(*dimensions)
+    for batch in first:
+        aggregator.add('fact_transactions', batch)
+    aggregator.save(str(tmp_path / 'kpi.npz'))
+    resumed = aggregates.KpiAggregator.load(str(tmp_path / 'kpi.npz'))
+    for batch in second:
+        resumed.add('fact_transactions', batch)
+    _assert_same_tables(single, resumed)
+
+
+def test_aggregates_match_brute_force(dimensions):
+    batches = _transaction_batches(6, 3000)
+    aggregator = aggregates.KpiAggregator.from_dimensions(*dimensions)
+    for batch in batches:
+        aggregator.add('fact_transactions', batch)
+    expected = defaultdict(lambda: [0, 0])
+    for batch in batches:
+        for channel, location, day, amount, status in zip(batch['channel_id'].tolist(), batch['location_id'].tolist(),
+                                                          batch['date_id'].tolist(), batch['transaction_amount'].tolist(),
+                                                          batch['transaction_status'].tolist()):
+            if status != 'Failed':
+                expected[day, channel, location][0] += 1
+                expected[day, channel, location][1] += round(amount * 100)
+    result = aggregator.result('agg_daily_channel_location')
+    keys = zip(result['date_id'].tolist(), result['channel_id'].tolist(), result['location_id'].tolist())
+    actual = {key: [count, round(amount * 100)] for key, count, amount in zip(keys, result['transaction_count'].tolist(),
+                                                                              result['transaction_amount'].tolist())}
+    assert actual == dict(expected)
@@ -0,0 +1,76 @@
+from collections import defaultdict
+
+import numpy as np
+import pytest
+
+import balances
+import columnar
+import parallel
+from id_allocator import IdAllocator
+
+NUM_ACCOUNTS = 40
+NUM_DAYS = 60
+SIGNS = {1: 1, 2: -1, 3: -1, 4: 0}  # deposit, withdrawal, payment, transfer
+
+
+def _transaction_batches(num_records, chunk_size):
+    generate, primary_key, _ = parallel.FACT_TABLES['fact_transactions']
+    return list(columnar.iter_column_chunks(generate, num_records, np.arange(1, NUM_ACCOUNTS + 1), np.arange(1, NUM_DAYS + 1),
+                                            np.arange(1, 5), np.arange(1, 6), np.arange(1, 9), np.arange(1, 4),
+                                            rng=np.random.default_rng(11), chunk_size=chunk_size,
+                                            id_alloc=IdAllocator(primary_key, seed=11)))
+
+
+def _brute_force(batches, opening):
+    # running balance per account over the days with at least one counted transaction, in cents
+    nets = defaultdict(int)
+    for batch in batches:
+        for account, day, type_id, amount, status in zip(batch['account_id'].tolist(), batch['date_id'].tolist(),
+                                                         batch['transaction_type_id'].tolist(),
+                                                         batch['transaction_amount'].tolist(),
+                                                         batch['transaction_status'].tolist()):
+            if status not in balances.IGNORED_STATUSES:
+                nets[account, day] += SIGNS[type_id] * round(amount * 100)
+    rows, running = [], {account: round(balance * 100) for account, balance in zip(range(1, NUM_ACCOUNTS + 1), opening)}
+    for account, day in sorted(nets):
+        before = running[account]
+        running[account] += nets[account, day]
+        rows.append((day, account, before, running[account]))
+    return rows, running
+
+
+@pytest.mark.parametrize('account_chunk_size', [7, balances.DEFAULT_ACCOUNT_CHUNK_SIZE])
+def test_balances_match_a_running_sum(account_chunk_size):
+    opening = np.round(np.random.default_rng(3).uniform(0, 5000, NUM_ACCOUNTS), 2)
+    batches = _transaction_batches(5000, chunk_size=101)  # more batches than MAX_PENDING_PARTS
+    engine = balances.BalanceEngine(np.arange(1, NUM_ACCOUNTS + 1), opening, np.arange(1, NUM_DAYS + 1), SIGNS, 1,
+                                    account_chunk_size=account_chunk_size, id_alloc=IdAllocator('balance_id'))
+    assert list(engine.tee(batches)) == batches
+    output = list(engine.iter_batches(chunk_size=64))
+    actual = [(day, account, round(before * 100), round(after * 100))
+              for batch in output
+              for day, account, before, after in zip(batch['date_id'].tolist(), batch['account_id'].tolist(),
+                                                     batch['opening_balance'].tolist(), batch['closing_balance'].tolist())]
+    expected, closing = _brute_force(batches, opening)
+    assert actual == expected
+    assert np.rint(engine.closing_balances() * 100).astype(np.int64).tolist() == [closing[account]
+                                                                                 for account in range(1, NUM_ACCOUNTS + 1)]
+    balance_ids = np.concatenate([batch['balance_id'] for batch in output])
+    assert len(np.unique(balance_ids)) == len(expected)
+
+
+def test_failed_transactions_leave_balances_alone():
+    engine = balances.BalanceEngine([1], [100.0], [1, 2], SIGNS, 1, id_alloc=IdAllocator('balance_id'))
+    engine.add_transactions({'account_id': np.array([1, 1]), 'date_id': np.array([1, 2]),
+                             'transaction_type_id': np.array([1, 2]), 'transaction_amount': np.array([50.0, 30.0]),
+                             'transaction_status': np.array(['Failed', 'Completed'])})
+    (batch,) = engine.iter_batches()
+    assert batch['date_id'].tolist() == [2]
+    assert batch['opening_balance'].tolist() == [100.0]
+    assert batch['closing_balance'].tolist() == [70.0]
+
+
+def test_unknown_accounts_are_rejected():
+    engine = balances.BalanceEngine([1, 2], [0.0, 0.0], [1], SIGNS, 1, id_alloc=IdAllocator('balance_id'))
+    with pytest.raises(ValueError):
+        engine.add_transactions([(1, 1, 1, 3, 1, 1, 1, 10.0, 'Completed')])
@@ -0,0 +1,37 @@
+import io
+import os
+
+import pytest
+
+import block_compression
+import parallel
+
+CODECS = ['gzip', pytest.param('zstd', marks=pytest.mark.skipif(block_compression.zstandard is None,
+                                                                 reason='zstandard is not installed'))]
+DATA = b''.join(b'%d|row %d|%.2f\r\n' % (i, i * 7, i / 3) for i in range(20000))
+
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_parallel_blocks_read_back_as_the_input(codec, tmp_path):
+    file_path = tmp_path / block_compression.compressed_name('table.csv', codec)
+    with open(file_path, 'wb') as f, block_compression.ParallelCompressor(f, codec, block_size=4096, workers=3) as out:
+        for offset in range(0, len(DATA), 1000):
+            out.write(DATA[offset:offset + 1000])
+    with block_compression.open_csv_reader(str(file_path)) as f:
+        assert f.read() == DATA
+
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_merged_parts_keep_one_header(codec, tmp_path):
+    header, rows = 'id|name\r\n', ['1|a\r\n', '2|b\r\n', '3|c\r\n']
+    folder = parallel.shard_folder(str(tmp_path), 'fact_loans')
+    os.makedirs(folder)
+    for i, part_rows in enumerate([rows[:2], rows[2:]]):
+        with block_compression.open_csv_writer(os.path.join(folder, parallel.part_file_name(i, codec)), codec) as f:
+            f.write(header)
+            f.flush_block()
+            f.write(''.join(part_rows))
+    merged = parallel.merge_parts('fact_loans', str(tmp_path))
+    with io.TextIOWrapper(block_compression.open_csv_reader(merged), encoding='utf-8', newline='') as f:
+        assert f.read() == header + ''.join(rows)
+
@@ -0,0 +1,53 @@
+import csv
+import io
+
+import pytest
+
+import csv_encoder
+import main
+import schemas
+
+FIELDNAMES = ['id', 'name', 'amount', 'note']
+ROWS = [
+    (1, 'plain', 12.5, ''),
+    (2, 'with|pipe', -0.1, 'quote " inside'),
+    (3, 'line\nbreak', 1e-07, 'carriage\rreturn'),
+    (4, ' padded ', 123456789.0, None),
+    (5, 'unicodé ✓', 0.30000000000000004, True),
+]
+
+
+def _csv_writer_text(rows, fieldnames, header):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter='|')
+    if header:
+        writer.writerow(fieldnames)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize('header', [True, False])
+def test_tuples_match_csv_writer(header):
+    assert csv_encoder.encode_rows(ROWS, FIELDNAMES, header=header) == _csv_writer_text(ROWS, FIELDNAMES, header)
+
+
+def test_records_match_dict_writer():
+    records = [dict(zip(FIELDNAMES, row)) for row in ROWS]
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=FIELDNAMES, delimiter='|')
+    writer.writeheader()
+    writer.writerows(records)
+    assert csv_encoder.encode_rows(records, FIELDNAMES, header=True) == buffer.getvalue()
+
+
+def test_generated_rows_match_csv_writer():
+    rows = main.generate_fact_loan(200, [{'account_id': 1}, {'account_id': 2}], [{'date_id': 1}],
+                                   [{'loan_id': 1}], [{'location_id': 1}], [{'currency_id': 1}], as_tuples=True)
+    fieldnames = schemas.fieldnames('fact_loans')
+    assert csv_encoder.encode_rows(rows, fieldnames, header=True) == _csv_writer_text(rows, fieldnames, True)
+
+
+def test_write_rows_writes_the_encoded_batches(tmp_path):
+    file_path = tmp_path / 'rows.csv'
+    assert csv_encoder.write_rows([ROWS[:2], [], ROWS[2:]], str(file_path), FIELDNAMES) == len(ROWS)
+    assert file_path.read_bytes() == _csv_writer_text(ROWS, FIELDNAMES, True).encode('utf-8')
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from id_allocator import IdAllocator
+
+
+@pytest.mark.parametrize('low, high', [(1, 1), (1, 2), (1, 1000), (10, 4105), (1000000000, 1000065535)])
+def test_ids_are_a_bijection_onto_the_range(low, high):
+    ids = IdAllocator('transaction_id', low=low, high=high, seed=3).take(high - low + 1)
+    assert sorted(ids.tolist()) == list(range(low, high + 1))
+
+
+def test_range_is_exhausted_after_every_id():
+    alloc = IdAllocator('transaction_id', low=1, high=10)
+    alloc.take(10)
+    with pytest.raises(ValueError):
+        next(alloc)
+    with pytest.raises(ValueError):
+        alloc.take(1)
+
+
+@pytest.mark.parametrize('permute', [True, False])
+def test_take_matches_next(permute):
+    by_next = IdAllocator('loan_fact_id', seed=5, permute=permute)
+    by_take = IdAllocator('loan_fact_id', seed=5, permute=permute)
+    expected = [next(by_next) for _ in range(2500)]
+    taken = np.concatenate([by_take.take(size) for size in (1, 999, 0, 1500)])
+    assert taken.tolist() == expected
+    assert by_take.position == by_next.position
+
+
+def test_name_and_seed_key_the_permutation():
+    ids = IdAllocator('transaction_id', seed=1).take(100).tolist()
+    assert ids == IdAllocator('transaction_id', seed=1).take(100).tolist()
+    assert ids != IdAllocator('transaction_id', seed=2).take(100).tolist()
+    assert ids != IdAllocator('investment_id', seed=1).take(100).tolist()
+
+
+def test_shards_never_collide():
+    alloc = IdAllocator('interaction_id', low=1, high=5000, seed=9)
+    shards = [alloc.shard(i, 3) for i in range(3)]
+    ids = np.concatenate([shard.take(shard.remaining()) for shard in shards])
+    assert sorted(ids.tolist()) == list(range(1, 5001))
+
+
+def test_restarting_from_a_position_continues_the_sequence():
+    first = IdAllocator('balance_id', seed=4)
+    head = first.take(300)
+    rest = IdAllocator('balance_id', seed=4, start=first.position).take(200)
+    assert np.concatenate([head, rest]).tolist() == IdAllocator('balance_id', seed=4).take(500).tolist()
@@ -0,0 +1,56 @@
+import filecmp
+import os
+import shutil
+
+import incremental
+from conftest import generate_snapshot
+
+
+def _files(folder):
+    return sorted(os.path.relpath(os.path.join(root, name), folder)
+                  for root, _, names in os.walk(folder) for name in names)
+
+
+def _assert_same_tree(left, right):
+    assert _files(left) == _files(right)
+    for name in _files(left):
+        assert filecmp.cmp(os.path.join(left, name), os.path.join(right, name), shallow=False), name
+
+
+def test_rerunning_an_interrupted_day_gives_the_same_output(tmp_path):
+    folder = generate_snapshot(tmp_path / 'data', derive_balances=True, aggregate_kpis=True)
+    before = shutil.copytree(folder / incremental.STATE_DIR_NAME, tmp_path / 'state-before')
+    incremental.append_days(str(folder), 1, metrics_dir=None)
+    once = shutil.copytree(folder, tmp_path / 'once')
+
+    # the day is on disk, but the run died before the new state was saved: running it again must not add it twice
+    shutil.rmtree(folder / incremental.STATE_DIR_NAME)
+    shutil.copytree(before, folder / incremental.STATE_DIR_NAME)
+    incremental.append_days(str(folder), 1, metrics_dir=None)
+    _assert_same_tree(once, folder)
+
+
+def test_days_continue_dates_and_keys(tmp_path):
+    folder = generate_snapshot(tmp_path / 'data')
+    state, _ = incremental.load_state(str(folder))
+    incremental.append_days(str(folder), 2, daily_rows={'fact_transactions': 30, 'fact_investments': 3, 'fact_loans': 2,
+                                                        'fact_customer_interactions': 5, 'fact_daily_balances': 10},
+                            metrics_dir=None)
+    after, _ = incremental.load_state(str(folder))
+    assert after['last_date_id'] == state['last_date_id'] + 2
+    assert after['days_appended'] == 2
+    assert after['ids']['transaction_id']['position'] == state['ids']['transaction_id']['position'] + 60
+    dates = (folder / 'dates.csv').read_text(encoding='utf-8').splitlines()
+    assert [line.split('|')[0] for line in dates[-2:]] == [str(state['last_date_id'] + 1), str(state['last_date_id'] + 2)]
+    for date_id in (state['last_date_id'] + 1, state['last_date_id'] + 2):
+        assert os.path.isfile(os.path.join(incremental.partition_folder(str(folder), 'fact_transactions', date_id),
+                                           'part-00000.csv'))
+
+
+def test_appended_days_validate(tmp_path):
+    import validator
+
+    folder = generate_snapshot(tmp_path / 'data', derive_balances=True)
+    incremental.append_days(str(folder), 2, metrics_dir=None)
+    report = validator.validate(str(folder), workers=1)
+    assert report['ok'], report['violations']
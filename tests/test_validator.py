@@ -0,0 +1,62 @@
+import validator
+
+
+def _edit_row(file_path, row_index, **values):
+    # sets columns of one data row of a pipe-delimited file; row 0 is the first row after the header
+    lines = file_path.read_bytes().decode('utf-8').split('\r\n')
+    header = lines[0].split('|')
+    fields = lines[row_index + 1].split('|')
+    for column, value in values.items():
+        fields[header.index(column)] = str(value)
+    lines[row_index + 1] = '|'.join(fields)
+    file_path.write_bytes('\r\n'.join(lines).encode('utf-8'))
+
+
+def _field(file_path, row_index, column):
+    lines = file_path.read_bytes().decode('utf-8').split('\r\n')
+    return lines[row_index + 1].split('|')[lines[0].split('|').index(column)]
+
+
+def _violations(report):
+    return {(violation['table'], violation['check'], violation['column']): violation for violation in report['violations']}
+
+
+def test_generated_snapshot_is_clean(clean_snapshot):
+    report = validator.validate(str(clean_snapshot), workers=1)
+    assert report['ok'], report['violations']
+    assert report['rows']['fact_transactions'] == 400
+
+
+def test_orphan_foreign_key_is_reported(snapshot):
+    _edit_row(snapshot / 'fact_transactions.csv', 3, account_id=987654321)
+    violations = _violations(validator.validate(str(snapshot), workers=1))
+    assert set(violations) == {('fact_transactions', 'foreign_key', 'account_id')}
+    assert violations['fact_transactions', 'foreign_key', 'account_id']['examples'] == [987654321]
+
+
+def test_duplicate_primary_key_is_reported(snapshot):
+    file_path = snapshot / 'fact_loans.csv'
+    _edit_row(file_path, 5, loan_fact_id=_field(file_path, 0, 'loan_fact_id'))
+    violations = _violations(validator.validate(str(snapshot), workers=1))
+    assert set(violations) == {('fact_loans', 'duplicate_key', 'loan_fact_id')}
+    assert violations['fact_loans', 'duplicate_key', 'loan_fact_id']['count'] == 1
+
+
+def test_duplicate_dimension_key_is_reported(snapshot):
+    file_path = snapshot / 'customers.csv'
+    _edit_row(file_path, 1, customer_id=_field(file_path, 0, 'customer_id'))
+    violations = _violations(validator.validate(str(snapshot), workers=1))
+    assert ('customers', 'duplicate_key', 'customer_id') in violations
+
+
+def test_out_of_range_value_is_reported(snapshot):
+    _edit_row(snapshot / 'fact_transactions.csv', 7, transaction_amount=20000.0)
+    violations = _violations(validator.validate(str(snapshot), workers=1))
+    assert set(violations) == {('fact_transactions', 'range', 'transaction_amount')}
+    assert violations['fact_transactions', 'range', 'transaction_amount']['examples'] == [20000.0]
+
+
+def test_missing_table_is_reported(snapshot):
+    (snapshot / 'fact_investments.csv').unlink()
+    violations = _violations(validator.validate(str(snapshot), workers=1))
+    assert ('fact_investments', 'missing_table', None) in violations
@@ -0,0 +1,390 @@
+import argparse
+import csv
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import block_compression
+import parquet_writer
+import schemas
+
+
+# Referential-integrity and data-quality checks for a generated data folder.
+#
+# The validator streams every file in batches, so memory depends on the batch size and the dimension indexes,
+# never on the size of the fact files:
+#   1. the key column of every dimension is loaded into a KeyIndex (a bitset when the keys are dense, a sorted
+#      array otherwise) and checked for duplicates;
+#   2. every file (<table>.csv or <table>.parquet, shard part-files and date_id= partitions) is checked by a
+#      process pool, one task per file: header, column count, types, foreign keys against the dimension indexes,
+#      VALUE_RANGES and ALLOWED_VALUES from schemas.py. Fact primary keys are spilled to disk, bucketed by
+#      key % PK_BUCKETS;
+#   3. one task per (fact table, bucket) sorts the bucket and reports duplicate primary keys across all files.
+# Parquet files are read through pyarrow; without pyarrow they are listed under 'skipped_files' in the report
+# instead of being checked, and their tables are not reported as missing.
+#
+#   python validator.py --folder data --report validation_report.json
+
+DEFAULT_BATCH_SIZE = 100000
+PK_BUCKETS = 64
+MAX_EXAMPLES = 5
+DIMENSION_TABLES = [table for table in schemas.SCHEMAS if not table.startswith('fact_')]
+FACT_TABLES = [table for table in schemas.SCHEMAS if table.startswith('fact_')]
+TABLE_EXTENSIONS = block_compression.CSV_EXTENSIONS + ('.parquet',)
+
+
+class KeyIndex:
+    """
+    Compact membership index over the keys of one dimension.
+    Dense keys (such as 1..n) are stored as a bitset, one bit per possible key; sparse keys as a sorted array.
+    Parameters:
+        keys (numpy.ndarray): The key values.
+    Attributes:
+        duplicates (int): The number of keys that occurred more than once.
+        duplicate_examples (list): Some of the duplicated keys.
+    """
+
+    def __init__(self, keys):
+        keys = np.asarray(keys, dtype=np.int64)
+        unique, counts = np.unique(keys, return_counts=True)
+        self.size = len(unique)
+        self.duplicates = int((counts - 1).sum())
+        self.duplicate_examples = unique[counts > 1][:MAX_EXAMPLES].tolist()
+        self.low = int(unique[0]) if self.size else 0
+        span = int(unique[-1]) - self.low + 1 if self.size else 0
+        if self.size and span <= 64 * self.size:
+            offsets = unique - self.low
+            self.bits = np.zeros((span + 7) // 8, dtype=np.uint8)
+            np.bitwise_or.at(self.bits, offsets >> 3, (1 << (offsets & 7)).astype(np.uint8))
+            self.sorted_keys = None
+        else:
+            self.bits = None
+            self.sorted_keys = unique
+
+    def contains(self, keys):
+        """
+        Parameters:
+            keys (numpy.ndarray): int64 keys to look up.
+        Returns:
+            numpy.ndarray: One bool per key, True if the key is in the index.
+        """
+        if self.bits is not None:
+            offsets = keys - self.low
+            inside = (offsets >= 0) & (offsets < len(self.bits) * 8)
+            found = np.zeros(len(keys), dtype=bool)
+            offsets = offsets[inside]
+            found[inside] = (self.bits[offsets >> 3] >> (offsets & 7).astype(np.uint8)) & 1 == 1
+            return found
+        if not self.size:
+            return np.zeros(len(keys), dtype=bool)
+        positions = np.minimum(np.searchsorted(self.sorted_keys, keys), self.size - 1)
+        return self.sorted_keys[positions] == keys
+
+
+def list_table_files(folder_name, tables=None):
+    """
+    Finds the files of every table in a data folder.
+    Parameters:
+        folder_name (str): The data folder.
+        tables (list, optional): The tables to look for. Defaults to every table of schemas.SCHEMAS.
+    Returns:
+        dict: Table name -> list of file paths: <table>.csv or <table>.parquet plus the part-files below <table>/,
+            each CSV optionally compressed (.csv.gz, .csv.zst).
+    """
+    files = {}
+    for table in tables or schemas.SCHEMAS:
+        paths = [os.path.join(folder_name, table + extension) for extension in TABLE_EXTENSIONS
+                 if os.path.isfile(os.path.join(folder_name, table + extension))]
+        for root, folders, names in os.walk(os.path.join(folder_name, table)):
+            folders.sort()
+            paths.extend(os.path.join(root, name) for name in sorted(names)
+                         if name.endswith(TABLE_EXTENSIONS))
+        if paths:
+            files[table] = paths
+    return files
+
+
+def _read_batches(file_path, batch_size):
+    if file_path.endswith('.parquet'):
+        # the checks work on the text of each value, as read from CSV
+        empty = True
+        for header, rows in parquet_writer.read_parquet_batches(file_path, batch_size):
+            empty = False
+            yield header, [['' if value is None else str(value) for value in row] for row in rows]
+        if empty:
+            yield parquet_writer.pq.ParquetFile(file_path).schema_arrow.names, []
+        return
+    with io.TextIOWrapper(block_compression.open_csv_reader(file_path), encoding='utf-8', newline='') as f:
+        reader = csv.reader(f, delimiter='|')
+        header = next(reader, None)
+        batch = []
+        for row in reader:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield header, batch
+                batch = []
+        yield header, batch
+
+
+def _parse(values, column_type):
+    # -> (parsed array, mask of values that could not be parsed)
+    dtype = np.int64 if column_type == 'int' else np.float64
+    try:
+        return np.asarray(values).astype(dtype), np.zeros(len(values), dtype=bool)
+    except ValueError:
+        parsed, invalid = np.zeros(len(values), dtype=dtype), np.zeros(len(values), dtype=bool)
+        for i, value in enumerate(values):
+            try:
+                parsed[i] = int(value) if column_type == 'int' else float(value)
+            except ValueError:
+                invalid[i] = True
+        return parsed, invalid
+
+
+class _Violations:
+    def __init__(self, table, file_path):
+        self.table = table
+        self.file_path = file_path
+        self.entries = {}
+
+    def add(self, check, column, count, examples):
+        if not count:
+            return
+        entry = self.entries.setdefault((check, column), {'table': self.table, 'check': check, 'column': column,
+                                                          'count': 0, 'examples': [], 'files': [self.file_path]})
+        entry['count'] += int(count)
+        for example in examples:
+            if len(entry['examples']) >= MAX_EXAMPLES:
+                break
+            if example not in entry['examples']:
+                entry['examples'].append(example)
+
+
+def _merge_examples(examples, more):
+    for example in more:
+        if len(examples) < MAX_EXAMPLES and example not in examples:
+            examples.append(example)
+    return examples
+
+
+_indexes = {}
+
+
+def _init_worker(indexes):
+    global _indexes
+    _indexes = indexes
+
+
+def check_file(table, file_path, spill_dir=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Streams one file and checks its header, types, foreign keys, value ranges and categorical values.
+    Parameters:
+        table (str): The table the file belongs to.
+        file_path (str): The file.
+        spill_dir (str, optional): Where to spill the primary keys for the duplicate check. Defaults to None (no spill).
+        batch_size (int, optional): Rows parsed per batch. Defaults to 100000.
+    Returns:
+        dict: 'table', 'file', 'rows' and 'violations' (a list of violation dicts).
+    """
+    columns = schemas.SCHEMAS[table]
+    foreign_keys = schemas.FOREIGN_KEYS.get(table, {})
+    ranges = schemas.VALUE_RANGES.get(table, {})
+    allowed = {column: np.array(values) for column, values in schemas.ALLOWED_VALUES.get(table, {}).items()}
+    primary_key = schemas.PRIMARY_KEYS[table]
+    violations = _Violations(table, file_path)
+    spill_files = {}
+    rows = 0
+    try:
+        for header, batch in _read_batches(file_path, batch_size):
+            if header != schemas.fieldnames(table):
+                violations.add('header', None, 1, [header])
+                break
+            well_formed = [row for row in batch if len(row) == len(columns)]
+            violations.add('column_count', None, len(batch) - len(well_formed),
+                           [row for row in batch if len(row) != len(columns)][:MAX_EXAMPLES])
+            rows += len(batch)
+            if not well_formed:
+                continue
+            for (column, column_type), values in zip(columns, zip(*well_formed)):
+                if column_type in ('str', 'date'):
+                    violations.add('empty', column, values.count(''), [])
+                    if column in allowed:
+                        values = np.asarray(values)
+                        bad = ~np.isin(values, allowed[column])
+                        violations.add('allowed_values', column, bad.sum(), values[bad][:MAX_EXAMPLES].tolist())
+                    continue
+                parsed, invalid = _parse(values, column_type)
+                violations.add('type', column, invalid.sum(), np.asarray(values)[invalid][:MAX_EXAMPLES].tolist())
+                parsed = parsed[~invalid]
+                if column in foreign_keys and foreign_keys[column] in _indexes:
+                    missing = ~_indexes[foreign_keys[column]].contains(parsed)
+                    violations.add('foreign_key', column, missing.sum(), np.unique(parsed[missing])[:MAX_EXAMPLES].tolist())
+                if column in ranges:
+                    low, high = ranges[column]
+                    outside = (parsed < low) | (parsed > high)
+                    violations.add('range', column, outside.sum(), parsed[outside][:MAX_EXAMPLES].tolist())
+                if column == primary_key and spill_dir:
+                    buckets = parsed % PK_BUCKETS
+                    for bucket in np.unique(buckets).tolist():
+                        if bucket not in spill_files:
+                            spill_files[bucket] = open(os.path.join(spill_dir, f'{bucket}-{os.getpid()}.bin'), 'ab')
+                        parsed[buckets == bucket].tofile(spill_files[bucket])
+    finally:
+        for spill_file in spill_files.values():
+            spill_file.close()
+    return {'table': table, 'file': file_path, 'rows': rows, 'violations': list(violations.entries.values())}
+
+
+def check_duplicates(table, spill_dir, bucket):
+    """
+    Finds primary keys that occur more than once in one bucket of a fact table's spilled keys.
+    Parameters:
+        table (str): The fact table.
+        spill_dir (str): The table's spill folder.
+        bucket (int): The bucket, from 0 to PK_BUCKETS - 1.
+    Returns:
+        tuple: (number of duplicate rows, example keys).
+    """
+    parts = [os.path.join(spill_dir, name) for name in os.listdir(spill_dir) if name.startswith(f'{bucket}-')]
+    if not parts:
+        return 0, []
+    keys = np.sort(np.concatenate([np.fromfile(part, dtype=np.int64) for part in parts]))
+    repeated = keys[1:][keys[1:] == keys[:-1]]
+    return len(repeated), np.unique(repeated)[:MAX_EXAMPLES].tolist()
+
+
+def _load_key_column(table, paths, batch_size):
+    keys = []
+    for file_path in paths:
+        for header, batch in _read_batches(file_path, batch_size):
+            if header != schemas.fieldnames(table):
+                break
+            parsed, bad = _parse([row[0] for row in batch if row], 'int')
+            keys.append(parsed[~bad])  # unparsable keys are reported by check_file
+    return np.concatenate(keys) if keys else np.zeros(0, dtype=np.int64)
+
+
+def validate(folder_name='data', workers=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Checks the referential integrity and data quality of every table in a data folder.
+    Parameters:
+        folder_name (str, optional): The data folder. Defaults to 'data'.
+        workers (int, optional): Worker processes. Defaults to the number of CPUs.
+        batch_size (int, optional): Rows parsed per batch. Defaults to 100000.
+    Returns:
+        dict: The report: 'ok', 'files', 'rows' (per table), 'violations', 'skipped_files' (Parquet files left
+            unchecked because pyarrow is not installed) and 'seconds'.
+    """
+    start = time.perf_counter()
+    files = list_table_files(folder_name)
+    skipped = []
+    if parquet_writer.pa is None:
+        skipped = [path for paths in files.values() for path in paths if path.endswith('.parquet')]
+        files = {table: [path for path in paths if not path.endswith('.parquet')] for table, paths in files.items()}
+    skipped_tables = {table for table, paths in files.items() if not paths}
+    files = {table: paths for table, paths in files.items() if paths}
+    violations = []
+    for table in schemas.SCHEMAS:
+        if table not in files and table not in skipped_tables:
+            violations.append({'table': table, 'check': 'missing_table', 'column': None, 'count': 1,
+                               'examples': [], 'files': []})
+
+    indexes = {}
+    for table in DIMENSION_TABLES:
+        if table in files:
+            indexes[table] = KeyIndex(_load_key_column(table, files[table], batch_size))
+            if indexes[table].duplicates:
+                violations.append({'table': table, 'check': 'duplicate_key', 'column': schemas.PRIMARY_KEYS[table],
+                                   'count': indexes[table].duplicates, 'examples': indexes[table].duplicate_examples,
+                                   'files': files[table]})
+
+    spill_root = tempfile.mkdtemp(prefix='validate-')
+    rows = {}
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(indexes,)) as pool:
+            futures = []
+            for table, paths in files.items():
+                spill_dir = None
+                if table in FACT_TABLES:
+                    spill_dir = os.path.join(spill_root, table)
+                    os.makedirs(spill_dir)
+                futures.extend(pool.submit(check_file, table, path, spill_dir, batch_size) for path in paths)
+            merged = {}
+            for future in futures:
+                result = future.result()
+                rows[result['table']] = rows.get(result['table'], 0) + result['rows']
+                for violation in result['violations']:
+                    key = (violation['table'], violation['check'], violation['column'])
+                    if key not in merged:
+                        merged[key] = violation
+                        continue
+                    merged[key]['count'] += violation['count']
+                    merged[key]['files'].extend(violation['files'])
+                    merged[key]['examples'] = _merge_examples(merged[key]['examples'], violation['examples'])
+            violations.extend(merged.values())
+
+            duplicate_futures = {(table, bucket): pool.submit(check_duplicates, table, os.path.join(spill_root, table), bucket)
+                                 for table in FACT_TABLES if table in files for bucket in range(PK_BUCKETS)}
+            duplicates = {}
+            for (table, bucket), future in duplicate_futures.items():
+                count, examples = future.result()
+                if count:
+                    entry = duplicates.setdefault(table, {'table': table, 'check': 'duplicate_key',
+                                                          'column': schemas.PRIMARY_KEYS[table], 'count': 0,
+                                                          'examples': [], 'files': files[table]})
+                    entry['count'] += count
+                    entry['examples'] = _merge_examples(entry['examples'], examples)
+            violations.extend(duplicates.values())
+    finally:
+        shutil.rmtree(spill_root, ignore_errors=True)
+
+    return {
+        'ok': not violations,
+        'folder': folder_name,
+        'files': sum(len(paths) for paths in files.values()),
+        'rows': rows,
+        'violations': violations,
+        'skipped_files': skipped,
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+def print_report(report):
+    """
+    Prints a validation report as a summary table.
+    Parameters:
+        report (dict): The report from validate().
+    """
+    total_rows = sum(report['rows'].values())
+    print(f"Checked {report['files']} files, {total_rows:,} rows in {report['seconds']:.2f}s")
+    if report.get('skipped_files'):
+        print(f"Skipped {len(report['skipped_files'])} Parquet files (pyarrow is not installed)")
+    if report['ok']:
+        print('No violations')
+        return
+    print(f"{'table':<28}{'check':<16}{'column':<24}{'count':>12}  examples")
+    for violation in report['violations']:
+        print(f"{violation['table']:<28}{violation['check']:<16}{violation['column'] or '':<24}"
+              f"{violation['count']:>12,}  {violation['examples']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check referential integrity and data quality of generated files.')
+    parser.add_argument('--folder', default='data', help='data folder to validate')
+    parser.add_argument('--workers', type=int, help='worker processes (default: number of CPUs)')
+    parser.add_argument('--report', help='also write the report as JSON to this file')
+    args = parser.parse_args()
+
+    report = validate(args.folder, args.workers)
+    print_report(report)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, default=str)
+    sys.exit(0 if report['ok'] else 1)
@@ -0,0 +1,132 @@
+import json
+import os
+import random
+import re
+
+from faker import Faker
+
+
+# Pre-sampled Faker values for the dimension generators.
+#
+# Faker providers cost tens of microseconds per call. A ValuePools object asks Faker for a fixed number of
+# values per attribute once (the attribute's cardinality), keeps only the distinct ones, and caches them on
+# disk per locale and seed. Rows are then assembled by sampling from the pools, which costs about as much as
+# random.choice. Warm runs load the pools from the cache and never create a Faker instance.
+
+DEFAULT_CACHE_DIR = os.path.join('.cache', 'value_pools')
+
+# attribute -> number of Faker draws the pool is built from
+DEFAULT_CARDINALITY = {
+    'first_name': 5000,
+    'last_name': 10000,
+    'address': 50000,
+    'city': 5000,
+    'state': 1000,
+    'postcode': 40000,
+    'phone_number': 50000,
+    'country': 2000,
+    'word': 2000,
+    'email_domain': 200,
+}
+
+PROVIDERS = {
+    'first_name': lambda fake: fake.first_name(),
+    'last_name': lambda fake: fake.last_name(),
+    'address': lambda fake: fake.address().replace('\n', ','),
+    'city': lambda fake: fake.city(),
+    'state': lambda fake: fake.state(),
+    'postcode': lambda fake: fake.postcode(),
+    'phone_number': lambda fake: fake.phone_number(),
+    'country': lambda fake: fake.country(),
+    'word': lambda fake: fake.word(),
+    'email_domain': lambda fake: fake.free_email_domain(),
+}
+
+
+class ValuePools:
+    """
+    Reusable pools of realistic Faker values, built once per locale and seed and cached on disk.
+    Parameters:
+        locale (str, optional): The Faker locale. Defaults to 'en_US'.
+        seed (int, optional): Seed for building the pools. Defaults to 0.
+        cardinality (dict, optional): Attribute -> number of Faker draws, overriding DEFAULT_CARDINALITY.
+        cache_dir (str, optional): Where pools are cached; None disables the cache. Defaults to '.cache/value_pools'.
+    Example:
+        >>> pools = ValuePools(seed=42)
+        >>> len(pools.sample('city', 3))
+        3
+    """
+
+    def __init__(self, locale='en_US', seed=0, cardinality=None, cache_dir=DEFAULT_CACHE_DIR):
+        self.locale = locale
+        self.seed = seed
+        self.cardinality = {**DEFAULT_CARDINALITY, **(cardinality or {})}
+        self.cache_dir = cache_dir
+        self._pools = {}
+        self._fake = None
+
+    def _cache_path(self, attribute):
+        return os.path.join(self.cache_dir, f'{self.locale}-{self.seed}-{attribute}-{self.cardinality[attribute]}.json')
+
+    def _faker(self):
+        if self._fake is None:
+            self._fake = Faker(self.locale)
+        return self._fake
+
+    def pool(self, attribute):
+        """
+        Returns the distinct values of an attribute, building or loading the pool on first use.
+        Parameters:
+            attribute (str): One of PROVIDERS, e.g. 'first_name'.
+        Returns:
+            list: The pool values.
+        """
+        if attribute in self._pools:
+            return self._pools[attribute]
+        cache_path = self._cache_path(attribute) if self.cache_dir else None
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path, encoding='utf-8') as f:
+                values = json.load(f)
+        else:
+            # each attribute gets its own Faker stream, so a pool does not depend on which pools were built before it
+            fake = self._faker()
+            fake.seed_instance(f'{self.seed}:{attribute}')
+            provider = PROVIDERS[attribute]
+            values = list(dict.fromkeys(provider(fake) for _ in range(self.cardinality[attribute])))
+            if cache_path:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                with open(cache_path + '.tmp', 'w', encoding='utf-8') as f:
+                    json.dump(values, f, ensure_ascii=False)
+                os.replace(cache_path + '.tmp', cache_path)
+        self._pools[attribute] = values
+        return values
+
+    def sample(self, attribute, num_records, rng=random):
+        """
+        Draws values of an attribute by index sampling from its pool.
+        Parameters:
+            attribute (str): One of PROVIDERS, e.g. 'city'.
+            num_records (int): The number of values to draw.
+            rng (random.Random, optional): The random source. Defaults to the `random` module.
+        Returns:
+            list: The sampled values.
+        """
+        return rng.choices(self.pool(attribute), k=num_records)
+
+
+def _email_part(name):
+    return re.sub(r'[^a-z0-9]', '', name.lower()) or 'user'
+
+
+def unique_emails(first_names, last_names, ids, domains):
+    """
+    Builds one email per row that is unique as long as the ids are: first.last<id>@domain.
+    Parameters:
+        first_names, last_names (list): The sampled names of each row.
+        ids (list): A unique id per row, e.g. the customer_id.
+        domains (list): The sampled email domain of each row.
+    Returns:
+        list: The email addresses.
+    """
+    return [f'{_email_part(first)}.{_email_part(last)}{record_id}@{domain}'
+            for first, last, record_id, domain in zip(first_names, last_names, ids, domains)]
@@ -0,0 +1,264 @@
+import argparse
+import csv
+import io
+import itertools
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import duckdb
+except ImportError:  # the DuckDB path is optional; SQLite ships with Python
+    duckdb = None
+
+import block_compression
+import parquet_writer
+import schemas
+from instrumentation import RunMetrics
+from validator import list_table_files
+
+
+# Bulk loads the generated files into a local SQL engine, as a stand-in for Redshift or Snowflake.
+#
+# The tables are created from schemas.py and loaded dimension-first in dependency levels: tables of one level only
+# reference tables of earlier levels, so they can be loaded at the same time. Primary and foreign keys are only
+# declared with constraints=True: Redshift and Snowflake do not enforce them either, and enforcing them makes
+# DuckDB check every fact row against the dimensions (about 15x slower). validator.py checks the keys instead.
+# The KPI summary tables of aggregates.py (agg_*) are loaded too when the folder has them; they have no keys to
+# declare. Every table goes through the engine's native bulk path:
+#   - DuckDB: INSERT ... SELECT FROM read_csv([...]) over all files of a table (.csv, .csv.gz, .csv.zst, shard
+#     part-files and date_id= partitions), and FROM read_parquet([...]) for tables written as .parquet. The tables
+#     of a level load in parallel, each on a cursor of the one shared connection; DuckDB also parallelises each
+#     read_csv internally.
+#   - SQLite: executemany() in large batches inside one explicit transaction per table. SQLite has a single
+#     writer, so tables load one after another.
+# Each table is one stage of a RunMetrics run, so rows/sec per table ends up in the metrics file as well.
+#
+#   python main.py --seed 42
+#   python warehouse_loader.py --folder data --database warehouse.duckdb
+
+ENGINES = ('duckdb', 'sqlite')
+DEFAULT_BATCH_SIZE = 100000
+
+# the star schema, then the KPI summary tables
+ALL_TABLES = [*schemas.SCHEMAS, *schemas.AGGREGATE_SCHEMAS]
+
+# schemas.py column type -> SQL type per engine
+SQL_TYPES = {
+    'duckdb': {'int': 'BIGINT', 'money': 'DECIMAL(18, 2)', 'float': 'DOUBLE', 'str': 'VARCHAR', 'date': 'DATE'},
+    'sqlite': {'int': 'INTEGER', 'money': 'REAL', 'float': 'REAL', 'str': 'TEXT', 'date': 'TEXT'},
+}
+
+
+def create_table_sql(table, engine='duckdb', constraints=False):
+    """
+    Parameters:
+        table (str): The table name in schemas.py, including the agg_* tables of schemas.AGGREGATE_SCHEMAS.
+        engine (str, optional): 'duckdb' or 'sqlite'. Defaults to 'duckdb'.
+        constraints (bool, optional): Declare the primary key and the foreign keys; KPI summary tables have
+            neither. Defaults to False.
+    Returns:
+        str: The CREATE TABLE statement.
+    """
+    columns = [f'{name} {SQL_TYPES[engine][column_type]}' for name, column_type in schemas.columns(table)]
+    if constraints and table in schemas.PRIMARY_KEYS:
+        columns.append(f'PRIMARY KEY ({schemas.PRIMARY_KEYS[table]})')
+        columns.extend(f'FOREIGN KEY ({column}) REFERENCES {parent} ({column})'
+                       for column, parent in schemas.FOREIGN_KEYS.get(table, {}).items())
+    return f'CREATE TABLE {table} (\n    ' + ',\n    '.join(columns) + '\n)'
+
+
+def load_levels(tables):
+    """
+    Groups tables so that every table only references tables of earlier groups.
+    Parameters:
+        tables (list): Table names in schemas.py.
+    Returns:
+        list: Lists of table names, in load order.
+    """
+    levels, done, remaining = [], set(), list(tables)
+    while remaining:
+        level = [table for table in remaining
+                 if all(parent in done or parent not in tables for parent in schemas.FOREIGN_KEYS.get(table, {}).values())]
+        if not level:
+            raise ValueError(f'circular foreign keys between {remaining}')
+        levels.append(level)
+        done.update(level)
+        remaining = [table for table in remaining if table not in done]
+    return levels
+
+
+def _read_rows(file_paths, batch_size):
+    for file_path in file_paths:
+        if file_path.endswith('.parquet'):
+            for _, rows in parquet_writer.read_parquet_batches(file_path, batch_size):
+                yield rows
+            continue
+        with io.TextIOWrapper(block_compression.open_csv_reader(file_path), encoding='utf-8', newline='') as f:
+            reader = csv.reader(f, delimiter='|')
+            next(reader, None)  # header
+            while True:
+                rows = list(itertools.islice(reader, batch_size))
+                if not rows:
+                    break
+                yield rows
+
+
+class WarehouseLoader:
+    """
+    Creates the star schema in a local database and bulk loads generated files into it over one connection.
+    Parameters:
+        database (str, optional): The database file, or ':memory:'. Defaults to ':memory:'.
+        engine (str, optional): 'duckdb' or 'sqlite'. Defaults to 'duckdb'.
+        workers (int, optional): Tables loaded at the same time (DuckDB only). Defaults to the number of CPUs.
+        constraints (bool, optional): Declare primary and foreign keys, which the engine then enforces while
+            loading. Defaults to False.
+        batch_size (int, optional): Rows per executemany() batch (SQLite only). Defaults to 100000.
+        metrics_dir (str, optional): Where the per-table load metrics are written; None disables them. Defaults to None.
+    Example:
+        >>> with WarehouseLoader('warehouse.duckdb') as loader:
+        ...     loader.create_tables()
+        ...     report = loader.load_folder('data')
+    """
+
+    def __init__(self, database=':memory:', engine='duckdb', workers=None, constraints=False,
+                 batch_size=DEFAULT_BATCH_SIZE, metrics_dir=None):
+        if engine not in ENGINES:
+            raise ValueError(f'engine must be one of {ENGINES}, got {engine!r}')
+        if engine == 'duckdb' and duckdb is None:
+            raise ImportError('the duckdb engine needs duckdb: pip install duckdb')
+        self.engine = engine
+        self.workers = workers or os.cpu_count() or 1
+        self.constraints = constraints
+        self.batch_size = batch_size
+        self.metrics_dir = metrics_dir
+        if engine == 'duckdb':
+            self.connection = duckdb.connect(database)
+        else:
+            self.connection = sqlite3.connect(database, isolation_level=None)  # transactions are explicit
+            self.connection.execute('PRAGMA journal_mode = WAL')
+            self.connection.execute('PRAGMA synchronous = OFF')
+
+    def create_tables(self, tables=None):
+        """
+        Drops and creates the tables, referencing tables first.
+        Parameters:
+            tables (list, optional): Table names in schemas.py. Defaults to every table, KPI summary tables included.
+        """
+        tables = list(tables or ALL_TABLES)
+        levels = load_levels(tables)
+        for level in reversed(levels):
+            for table in level:
+                self.connection.execute(f'DROP TABLE IF EXISTS {table}')
+        for level in levels:
+            for table in level:
+                self.connection.execute(create_table_sql(table, self.engine, self.constraints))
+
+    def _load_duckdb(self, table, file_paths):
+        columns = ', '.join(f"'{name}': '{SQL_TYPES['duckdb'][column_type]}'" for name, column_type in schemas.columns(table))
+        csv_files = ', '.join("'" + path.replace("'", "''") + "'" for path in file_paths if not path.endswith('.parquet'))
+        parquet_files = ', '.join("'" + path.replace("'", "''") + "'" for path in file_paths if path.endswith('.parquet'))
+        cursor = self.connection.cursor()  # a connection of its own to the same database, for this thread
+        rows = 0
+        try:
+            if csv_files:
+                rows += cursor.execute(f"INSERT INTO {table} SELECT * FROM read_csv([{csv_files}], delim = '|', header = true, "
+                                       f"auto_detect = false, columns = {{{columns}}})").fetchone()[0]
+            if parquet_files:
+                names = ', '.join(schemas.fieldnames(table))
+                rows += cursor.execute(f"INSERT INTO {table} SELECT {names} FROM read_parquet([{parquet_files}])").fetchone()[0]
+            return rows
+        finally:
+            cursor.close()
+
+    def _load_sqlite(self, table, file_paths):
+        insert = f"INSERT INTO {table} VALUES ({', '.join('?' for _ in schemas.columns(table))})"
+        rows = 0
+        self.connection.execute('BEGIN')
+        try:
+            for batch in _read_rows(file_paths, self.batch_size):
+                self.connection.executemany(insert, batch)
+                rows += len(batch)
+            self.connection.execute('COMMIT')
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+        return rows
+
+    def load_folder(self, folder_name='data', tables=None):
+        """
+        Loads every table found in a data folder into the (already created) tables.
+        Parameters:
+            folder_name (str, optional): The data folder. Defaults to 'data'.
+            tables (list, optional): Only load these tables. Defaults to every table with files, the agg_* KPI
+                summary tables included.
+        Returns:
+            dict: Table name -> {'files', 'rows', 'seconds', 'rows_per_sec'}.
+        """
+        files = list_table_files(folder_name, ALL_TABLES)
+        tables = [table for table in (tables or ALL_TABLES) if table in files]
+        load = self._load_duckdb if self.engine == 'duckdb' else self._load_sqlite
+        metrics = RunMetrics(self.metrics_dir)
+        report = {}
+
+        def load_table(table):
+            with metrics.stage(f'load_{table}', kind='load') as stage:
+                stage.rows = load(table, files[table])
+                stage.extra['bytes_read'] = sum(os.path.getsize(path) for path in files[table])
+            record = next(record for record in reversed(metrics.stages) if record['stage'] == f'load_{table}')
+            report[table] = {'files': len(files[table]), 'rows': record['rows'], 'seconds': record['seconds'],
+                             'rows_per_sec': record['rows_per_sec']}
+
+        try:
+            for level in load_levels(tables):
+                if self.engine == 'duckdb' and self.workers > 1 and len(level) > 1:
+                    with ThreadPoolExecutor(max_workers=min(self.workers, len(level))) as pool:
+                        list(pool.map(load_table, level))
+                else:
+                    for table in level:
+                        load_table(table)
+        except BaseException:
+            metrics.finish(status='error')
+            raise
+        metrics.finish()
+        return {table: report[table] for table in tables}
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def print_report(report):
+    """
+    Prints the rows/sec of every loaded table.
+    Parameters:
+        report (dict): The report from WarehouseLoader.load_folder().
+    """
+    print(f"{'table':<28}{'files':>6}{'rows':>14}{'seconds':>10}{'rows/sec':>14}")
+    for table, entry in report.items():
+        print(f"{table:<28}{entry['files']:>6}{entry['rows']:>14,}{entry['seconds']:>10.2f}{entry['rows_per_sec']:>14,.0f}")
+    rows = sum(entry['rows'] for entry in report.values())
+    print(f'Loaded {rows:,} rows into {len(report)} tables')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bulk load generated files into a local DuckDB or SQLite database.')
+    parser.add_argument('--folder', default='data', help='data folder to load')
+    parser.add_argument('--database', default='warehouse.duckdb', help="database file, or ':memory:'")
+    parser.add_argument('--engine', choices=ENGINES, default='duckdb', help='local SQL engine')
+    parser.add_argument('--workers', type=int, help='tables loaded in parallel (duckdb only)')
+    parser.add_argument('--constraints', action='store_true', help='declare and enforce primary and foreign keys')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    with WarehouseLoader(args.database, args.engine, args.workers, constraints=args.constraints,
+                         metrics_dir='metrics') as loader:
+        loader.create_tables()
+        print_report(loader.load_folder(args.folder))
+    print(f'Done in {time.perf_counter() - started:.2f}s')
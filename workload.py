@@ -0,0 +1,282 @@
+import json
+import math
+import os
+import shutil
+import tempfile
+from datetime import date
+
+
+# Scale-factor workload specification.
+#
+# A WorkloadSpec derives every dimension and fact cardinality from one scale factor, TPC-DS style: the
+# customer base grows linearly with the scale factor, accounts follow customers, facts follow accounts
+# and days, and reference dimensions (locations, loan products) grow with the square root. Before a run,
+# estimate() projects row counts, output bytes and runtime from per-row costs that calibrate() measures
+# on this machine (or the built-in DEFAULT_COSTS when no calibration has been saved).
+
+# the cardinalities main() used before scale factors existed; used when no workload is given
+DEFAULT_ROW_COUNTS = {
+    'customers': 100,
+    'dates': 1827,
+    'channels': 5,
+    'transaction_types': 4,
+    'locations': 50,
+    'currencies': 3,
+    'accounts': 100,
+    'investment_types': 5,
+    'loans': 50,
+    'fact_transactions': 10000,
+    'fact_investments': 10000,
+    'fact_loans': 10000,
+    'fact_customer_interactions': 10000,
+    'fact_daily_balances': 10000,
+}
+
+DEFAULT_RATIOS = {
+    'customers_per_sf': 10000,                      # customers at SF1
+    'accounts_per_customer': 1.5,
+    'locations_per_sqrt_sf': 50,                    # branches/locations grow with sqrt(SF)
+    'loans_per_sqrt_sf': 50,                        # loan products grow with sqrt(SF)
+    'investment_types': 5,
+    'transactions_per_account_per_day': 0.2,
+    'investments_per_account_per_year': 2.0,
+    'loans_per_account_per_year': 0.2,
+    'interactions_per_customer_per_year': 4.0,
+    'balance_snapshots_per_account_per_day': 0.1,
+}
+
+# table -> bytes per CSV row and seconds per row (generate + write) for the row and columnar engines
+DEFAULT_COSTS = {
+    'customers': {'bytes_per_row': 135, 'seconds_per_row': {'rows': 6.5e-4, 'columnar': 6.5e-4}},
+    'dates': {'bytes_per_row': 28, 'seconds_per_row': {'rows': 6e-6, 'columnar': 6e-6}},
+    'channels': {'bytes_per_row': 16, 'seconds_per_row': {'rows': 1e-6, 'columnar': 1e-6}},
+    'transaction_types': {'bytes_per_row': 23, 'seconds_per_row': {'rows': 1e-6, 'columnar': 1e-6}},
+    'locations': {'bytes_per_row': 45, 'seconds_per_row': {'rows': 2.5e-4, 'columnar': 2.5e-4}},
+    'currencies': {'bytes_per_row': 30, 'seconds_per_row': {'rows': 1e-6, 'columnar': 1e-6}},
+    'accounts': {'bytes_per_row': 45, 'seconds_per_row': {'rows': 1.5e-5, 'columnar': 1.5e-5}},
+    'investment_types': {'bytes_per_row': 27, 'seconds_per_row': {'rows': 5e-5, 'columnar': 5e-5}},
+    'loans': {'bytes_per_row': 28, 'seconds_per_row': {'rows': 8e-6, 'columnar': 8e-6}},
+    'fact_transactions': {'bytes_per_row': 48, 'seconds_per_row': {'rows': 2.2e-5, 'columnar': 4e-6}},
+    'fact_investments': {'bytes_per_row': 45, 'seconds_per_row': {'rows': 2e-5, 'columnar': 4e-6}},
+    'fact_loans': {'bytes_per_row': 50, 'seconds_per_row': {'rows': 2e-5, 'columnar': 4e-6}},
+    'fact_customer_interactions': {'bytes_per_row': 37, 'seconds_per_row': {'rows': 1.8e-5, 'columnar': 3.5e-6}},
+    'fact_daily_balances': {'bytes_per_row': 52, 'seconds_per_row': {'rows': 2e-5, 'columnar': 5e-6}},
+}
+
+DEFAULT_CALIBRATION_PATH = os.path.join('.cache', 'workload_costs.json')
+
+FACT_TABLES = ['fact_transactions', 'fact_investments', 'fact_loans', 'fact_customer_interactions', 'fact_daily_balances']
+
+
+class WorkloadSpec:
+    """
+    Table cardinalities derived from a single scale factor.
+    Parameters:
+        scale_factor (float, optional): The scale factor; SF1 is about 0.45 GB of CSV. Defaults to 1.
+        start_year (int, optional): The first year of dim_date. Defaults to 2020.
+        end_year (int, optional): The last year of dim_date. Defaults to 2024.
+        ratios (dict, optional): Overrides of DEFAULT_RATIOS, e.g. {'accounts_per_customer': 2}.
+    Example:
+        >>> WorkloadSpec(10).row_counts()['customers']
+        100000
+    """
+
+    def __init__(self, scale_factor=1, start_year=2020, end_year=2024, ratios=None):
+        if scale_factor <= 0:
+            raise ValueError(f'scale_factor must be positive, got {scale_factor}')
+        unknown = set(ratios or {}) - set(DEFAULT_RATIOS)
+        if unknown:
+            raise ValueError(f'unknown workload ratios: {sorted(unknown)}')
+        self.scale_factor = scale_factor
+        self.start_year = start_year
+        self.end_year = end_year
+        self.ratios = {**DEFAULT_RATIOS, **(ratios or {})}
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Loads a spec from a JSON file such as {"scale_factor": 100, "end_year": 2025, "ratios": {...}}.
+        Parameters:
+            path (str): The JSON file.
+        Returns:
+            WorkloadSpec: The spec.
+        """
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+        return cls(config.get('scale_factor', 1), config.get('start_year', 2020), config.get('end_year', 2024),
+                   config.get('ratios'))
+
+    def days(self):
+        """
+        Returns:
+            int: The number of days in dim_date.
+        """
+        return (date(self.end_year, 12, 31) - date(self.start_year, 1, 1)).days + 1
+
+    def row_counts(self):
+        """
+        Returns:
+            dict: Table name -> number of rows, for every table main() writes.
+        """
+        r, sf = self.ratios, self.scale_factor
+        years = self.days() / 365.25
+        customers = max(1, round(r['customers_per_sf'] * sf))
+        accounts = max(1, round(customers * r['accounts_per_customer']))
+        return {
+            'customers': customers,
+            'dates': self.days(),
+            'channels': 5,
+            'transaction_types': 4,
+            'locations': max(1, round(r['locations_per_sqrt_sf'] * math.sqrt(sf))),
+            'currencies': 3,
+            'accounts': accounts,
+            'investment_types': max(1, round(r['investment_types'])),
+            'loans': max(1, round(r['loans_per_sqrt_sf'] * math.sqrt(sf))),
+            'fact_transactions': round(accounts * self.days() * r['transactions_per_account_per_day']),
+            'fact_investments': round(accounts * years * r['investments_per_account_per_year']),
+            'fact_loans': round(accounts * years * r['loans_per_account_per_year']),
+            'fact_customer_interactions': round(customers * years * r['interactions_per_customer_per_year']),
+            'fact_daily_balances': round(accounts * self.days() * r['balance_snapshots_per_account_per_day']),
+        }
+
+
+def daily_row_counts(num_accounts, num_customers, ratios=None):
+    """
+    Returns the fact rows of one day, for incremental runs (see incremental.py).
+    Parameters:
+        num_accounts (int): The number of accounts in dim_account.
+        num_customers (int): The number of customers in dim_customer.
+        ratios (dict, optional): Overrides of DEFAULT_RATIOS. Defaults to None.
+    Returns:
+        dict: Fact table name -> number of rows for one day.
+    """
+    r = {**DEFAULT_RATIOS, **(ratios or {})}
+    return {
+        'fact_transactions': round(num_accounts * r['transactions_per_account_per_day']),
+        'fact_investments': round(num_accounts * r['investments_per_account_per_year'] / 365.25),
+        'fact_loans': round(num_accounts * r['loans_per_account_per_year'] / 365.25),
+        'fact_customer_interactions': round(num_customers * r['interactions_per_customer_per_year'] / 365.25),
+        'fact_daily_balances': round(num_accounts * r['balance_snapshots_per_account_per_day']),
+    }
+
+
+def load_costs(path=DEFAULT_CALIBRATION_PATH):
+    """
+    Returns the per-row costs saved by calibrate(), or DEFAULT_COSTS if there are none.
+    Parameters:
+        path (str, optional): The calibration file. Defaults to '.cache/workload_costs.json'.
+    Returns:
+        dict: Table name -> {'bytes_per_row', 'seconds_per_row': {'rows', 'columnar'}}.
+    """
+    if path and os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            return {**DEFAULT_COSTS, **json.load(f)}
+    return DEFAULT_COSTS
+
+
+def estimate(row_counts, engine='rows', workers=1, costs=None):
+    """
+    Projects output size and runtime of a workload.
+    Parameters:
+        row_counts (dict): Table name -> rows, e.g. WorkloadSpec(10).row_counts().
+        engine (str, optional): 'rows' (row generators) or 'columnar' (NumPy engine). Defaults to 'rows'.
+        workers (int, optional): Processes generating fact tables in parallel (sharded mode). Defaults to 1.
+        costs (dict, optional): Per-row costs. Defaults to load_costs().
+    Returns:
+        dict: Table name -> {'rows', 'bytes', 'seconds'}, plus a 'total' entry.
+    """
+    costs = costs or load_costs()
+    projection = {}
+    for table, rows in row_counts.items():
+        seconds = rows * costs[table]['seconds_per_row'][engine]
+        if table in FACT_TABLES:
+            seconds /= max(1, workers)
+        projection[table] = {'rows': rows, 'bytes': rows * costs[table]['bytes_per_row'], 'seconds': seconds}
+    projection['total'] = {key: sum(entry[key] for entry in projection.values()) for key in ('rows', 'bytes', 'seconds')}
+    return projection
+
+
+def print_estimate(projection, title='Projected workload'):
+    """
+    Prints a projection from estimate() as a table.
+    Parameters:
+        projection (dict): The projection.
+        title (str, optional): The heading. Defaults to 'Projected workload'.
+    """
+    print(title)
+    print(f"{'table':<28}{'rows':>16}{'size':>12}{'time':>12}")
+    for table, entry in projection.items():
+        print(f"{table:<28}{entry['rows']:>16,}{_format_bytes(entry['bytes']):>12}{_format_seconds(entry['seconds']):>12}")
+
+
+def _format_bytes(num_bytes):
+    for unit in ('B', 'KB', 'MB', 'GB', 'TB'):
+        if num_bytes < 1024 or unit == 'TB':
+            return f'{num_bytes:.1f} {unit}'
+        num_bytes /= 1024
+
+
+def _format_seconds(seconds):
+    if seconds < 120:
+        return f'{seconds:.1f}s'
+    if seconds < 7200:
+        return f'{seconds / 60:.1f}m'
+    return f'{seconds / 3600:.1f}h'
+
+
+def calibrate(sample_rows=5000, path=DEFAULT_CALIBRATION_PATH):
+    """
+    Measures per-row bytes and seconds of every table on this machine and saves them for estimate().
+    Parameters:
+        sample_rows (int, optional): Rows generated per table and engine. Defaults to 5000.
+        path (str, optional): Where to save the costs. Defaults to '.cache/workload_costs.json'.
+    Returns:
+        dict: The measured costs, in the format of DEFAULT_COSTS.
+    """
+    import main
+
+    folder = tempfile.mkdtemp(prefix='calibrate-')
+    counts = {table: (sample_rows if rows > 10 else rows) for table, rows in DEFAULT_ROW_COUNTS.items()}
+    counts['dates'] = DEFAULT_ROW_COUNTS['dates']
+    costs = {}
+    try:
+        for engine in ('rows', 'columnar'):
+            summary_path = os.path.join(folder, f'{engine}-metrics')
+            #main() keys fresh id allocators on the seed; the dimension id generators and random state are restored afterwards
+            with main.isolated_generator_state():
+                main.main(columnar_mode=engine == 'columnar', row_counts=counts, folder_name=folder, metrics_dir=summary_path)
+            metrics_file = os.path.join(summary_path, os.listdir(summary_path)[0])
+            with open(metrics_file, encoding='utf-8') as f:
+                stages = [json.loads(line) for line in f]
+            for table in DEFAULT_ROW_COUNTS:
+                seconds = sum(stage['seconds'] for stage in stages if stage['stage'] in _stage_names(table))
+                rows = max(1, counts[table])
+                size = os.path.getsize(os.path.join(folder, f'{table}.csv'))
+                entry = costs.setdefault(table, {'bytes_per_row': size / rows, 'seconds_per_row': {}})
+                entry['seconds_per_row'][engine] = seconds / rows
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(costs, f, indent=2)
+    return costs
+
+
+# table -> metric stage names of main() that make up its cost
+_DIMENSION_GENERATORS = {
+    'customers': 'generate_dim_customer',
+    'dates': 'generate_dim_date',
+    'channels': 'generate_dim_channel',
+    'transaction_types': 'generate_dim_transaction_type',
+    'locations': 'generate_dim_location',
+    'currencies': 'generate_dim_currency',
+    'accounts': 'generate_dim_account',
+    'investment_types': 'generate_dim_investment_type',
+    'loans': 'generate_dim_loan',
+}
+
+
+def _stage_names(table):
+    if table in _DIMENSION_GENERATORS:
+        return {_DIMENSION_GENERATORS[table], f'write_{table}'}
+    return {table}